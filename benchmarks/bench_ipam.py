@@ -0,0 +1,47 @@
+"""IP 地址分配基准测试：65k 地址规模下的逐个分配、批量分配与建池
+
+用法:
+    python -m benchmarks.bench_ipam [-n 65000]
+"""
+
+import argparse
+import time
+
+from wg_manager.ipam import AddressPool
+
+
+def bench(label: str, n: int, func) -> None:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {n:>7} 个  {elapsed:8.3f}s  {elapsed / n * 1e6:8.2f} µs/个")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="IP 地址分配基准测试")
+    parser.add_argument("-n", type=int, default=65000, help="分配数量 (/16 最多 65534)")
+    args = parser.parse_args()
+    n = args.n
+
+    pool = AddressPool("10.8.0.1/16")
+    bench("逐个分配 (IPv4 /16)", n, lambda: [pool.allocate() for _ in range(n)])
+
+    pool = AddressPool("10.8.0.1/16")
+    bench("批量分配 (IPv4 /16)", n, lambda: pool.allocate_many(n))
+
+    pool = AddressPool("10.0.0.1/8", reserved=["10.0.0.0/16", "10.1.0.0-10.1.127.255"])
+    bench("批量分配 (IPv4 /8，含保留范围)", n, lambda: pool.allocate_many(n))
+
+    pool = AddressPool("fd00::1/64")
+    bench("批量分配 (IPv6 ULA /64)", n, lambda: pool.allocate_many(n))
+
+    # 每隔一个地址已用，模拟删除过大量客户端后的碎片化网段
+    used = [f"10.8.{i >> 8}.{i & 0xff}/32" for i in range(0, 65536, 2)]
+    bench("建池 (IPv4 /16，32k 已用地址)", len(used), lambda: AddressPool("10.8.0.1/16", used=used))
+    pool = AddressPool("10.8.0.1/16", used=used)
+    free = pool.free_count
+    bench("逐个分配 (碎片化 /16)", free, lambda: [pool.allocate() for _ in range(free)])
+
+
+if __name__ == "__main__":
+    main()
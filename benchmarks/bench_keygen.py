@@ -0,0 +1,48 @@
+"""密钥生成基准测试：进程内批量生成 vs 调用 wg 子进程
+
+用法:
+    python -m benchmarks.bench_keygen [-n 2000] [--subprocess-n 200]
+"""
+
+import argparse
+import shutil
+import time
+
+from wg_manager import crypto
+
+
+def bench(label: str, n: int, func) -> None:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {n:>7} 组  {elapsed:8.3f}s  {n / elapsed:10.1f} 组/秒")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="密钥生成基准测试")
+    parser.add_argument("-n", type=int, default=2000, help="进程内生成数量")
+    parser.add_argument("--subprocess-n", type=int, default=200, help="wg 子进程生成数量")
+    args = parser.parse_args()
+
+    crypto.set_key_backend("auto")
+    backend = crypto.get_key_backend()
+    bench(f"generate_keypairs ({backend})", args.n,
+          lambda: crypto.generate_keypairs(args.n))
+    bench(f"generate_keypairs ({backend}, 单进程)", args.n,
+          lambda: crypto.generate_keypairs(args.n, workers=1))
+    bench(f"generate_keypair + psk ({backend})", args.n // 4,
+          lambda: [(crypto.generate_keypair(), crypto.generate_preshared_key())
+                   for _ in range(args.n // 4)])
+
+    if shutil.which("wg"):
+        crypto.set_key_backend("wg")
+        bench("generate_keypair + psk (wg)", args.subprocess_n,
+              lambda: [(crypto.generate_keypair(), crypto.generate_preshared_key())
+                       for _ in range(args.subprocess_n)])
+        crypto.set_key_backend("auto")
+    else:
+        print("未找到 wg 命令，跳过子进程对比")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""配置解析基准测试：解析、序列化与批量删除耗时随 Peer 数量的变化
+
+每档 Peer 数的单 Peer 耗时应基本不变（线性扩展）。
+
+用法:
+    python -m benchmarks.bench_parse [--sizes 1000 5000 10000 50000]
+"""
+
+import argparse
+import time
+
+from wg_manager.model import parse_wg_config
+from wg_manager.parser import parse_config, parse_peers, remove_peer_sections
+
+
+def synthetic_config(n: int) -> str:
+    """生成包含 n 个 Peer 的服务端配置"""
+    lines = [
+        "[Interface]",
+        "PrivateKey = " + "A" * 43 + "=",
+        "Address = 10.0.0.1/16",
+        "ListenPort = 51820",
+        "",
+    ]
+    for i in range(n):
+        lines += [
+            "[Peer]",
+            f"# peer-{i}",
+            f"PublicKey = {i:043d}=",
+            f"PresharedKey = {i:043d}=",
+            f"AllowedIPs = 10.0.{i // 250}.{i % 250 + 2}/32",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="配置解析基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 10000, 50000],
+                        help="Peer 数量档位")
+    args = parser.parse_args()
+
+    print(f"{'Peer 数':>8} {'大小':>9} {'解析':>9} {'序列化':>9} {'parse_config':>13} "
+          f"{'parse_peers':>12} {'删除10%':>9} {'µs/Peer':>8}")
+    for n in args.sizes:
+        content = synthetic_config(n)
+        config = parse_wg_config(content)
+        assert config.serialize() == content, "往返结果与原文不一致"
+        assert len(config.peers) == n
+
+        t_parse = timed(lambda: parse_wg_config(content))
+        t_serialize = timed(config.serialize)
+        t_config = timed(lambda: parse_config(content))
+        t_peers = timed(lambda: parse_peers(content))
+        # 一次删除 10% 的 Peer
+        keys = {p.public_key for p in config.peers[::10]}
+        t_remove = timed(lambda: remove_peer_sections(content, keys))
+        print(f"{n:>8} {len(content) / 1024:>7.0f}KB {t_parse:>8.3f}s {t_serialize:>8.3f}s "
+              f"{t_config:>12.3f}s {t_peers:>11.3f}s {t_remove:>8.3f}s {t_parse / n * 1e6:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""基准测试用的本地模拟传输
+
+FakeSSHClient 是以临时目录为根目录的 LocalTransport：配置文件在临时目录中读写，
+wg、wg-quick、systemctl、ss、ip 由 FakeRemote 安装的模拟脚本代替，
+每次往返前等待 latency 秒模拟网络延迟。远程操作流程（transport.Flow）
+因此可以不依赖真实服务器运行，并统计真实的往返次数。
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import Optional
+
+from wg_manager.transport import LocalTransport
+
+# 模拟的远程命令：运行中的接口状态为 $WGM_FAKE_STATE/<接口> 中的公钥列表
+_SCRIPTS = {
+    "wg": r'''#!/bin/sh
+state="$WGM_FAKE_STATE"
+cmd=$1; shift
+case "$cmd" in
+show)
+    [ "$2" = peers ] && cat "$state/$1" 2>/dev/null
+    exit 0 ;;
+set)
+    iface=$1; shift
+    touch "$state/$iface"
+    while [ $# -gt 0 ]; do
+        if [ "$1" = peer ]; then
+            key=$2; shift 2
+            if [ "$1" = remove ]; then
+                grep -vxF "$key" "$state/$iface" > "$state/$iface.tmp"
+                mv "$state/$iface.tmp" "$state/$iface"
+                shift
+            else
+                echo "$key" >> "$state/$iface"
+            fi
+        else
+            shift
+        fi
+    done
+    cat > /dev/null
+    exit 0 ;;
+addconf)
+    sed -n 's/^[[:space:]]*[Pp]ublic[Kk]ey[[:space:]]*=[[:space:]]*//p' "$2" >> "$state/$1" ;;
+syncconf)
+    sed -n 's/^[[:space:]]*[Pp]ublic[Kk]ey[[:space:]]*=[[:space:]]*//p' "$2" > "$state/$1" ;;
+esac
+''',
+    "wg-quick": r'''#!/bin/sh
+[ "$1" = strip ] || exit 0
+case "$2" in
+*/*) cat "$2" ;;
+*) cat "$WGM_FAKE_ROOT/etc/wireguard/$2.conf" ;;
+esac
+''',
+    "systemctl": r'''#!/bin/sh
+case "$1" in
+start|restart)
+    iface=${2#wg-quick@}
+    sed -n 's/^[[:space:]]*[Pp]ublic[Kk]ey[[:space:]]*=[[:space:]]*//p' \
+        "$WGM_FAKE_ROOT/etc/wireguard/$iface.conf" > "$WGM_FAKE_STATE/$iface" ;;
+esac
+''',
+    "ss": "#!/bin/sh\n",
+    "ip": "#!/bin/sh\necho 'default via 192.0.2.1 dev eth0 proto static'\n",
+}
+
+
+class FakeSSHClient(LocalTransport):
+    """在本地模拟远程主机的传输，每次往返模拟网络延迟"""
+
+    def __init__(self, remote: "FakeRemote", latency: float = 0.0):
+        super().__init__(remote.root, env=remote.env)
+        self.remote = remote
+        self.latency = latency
+
+    def test_connection(self) -> tuple[bool, str]:
+        self.round_trips += 1
+        time.sleep(self.latency)
+        return super().test_connection()
+
+    def _exec(
+        self, command: str, input: Optional[str] = None, timeout: int = 30
+    ) -> subprocess.CompletedProcess:
+        time.sleep(self.latency)
+        return super()._exec(command, input, timeout)
+
+
+class FakeRemote:
+    """临时目录中的模拟远程主机"""
+
+    def __init__(self):
+        self.root = tempfile.mkdtemp(prefix="wgm-bench-")
+        self.state_dir = os.path.join(self.root, "state")
+        bin_dir = os.path.join(self.root, "bin")
+        self.wg_dir = os.path.join(self.root, "etc", "wireguard")
+        for path in (self.wg_dir, self.state_dir, bin_dir):
+            os.makedirs(path, exist_ok=True)
+        for name, script in _SCRIPTS.items():
+            path = os.path.join(bin_dir, name)
+            with open(path, "w") as f:
+                f.write(script)
+            os.chmod(path, 0o755)
+        self.env = dict(
+            os.environ,
+            PATH=f"{bin_dir}:{os.environ.get('PATH', '/usr/bin:/bin')}",
+            WGM_FAKE_ROOT=self.root,
+            WGM_FAKE_STATE=self.state_dir,
+        )
+
+    def __enter__(self) -> "FakeRemote":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def write_config(self, interface: str, content: str) -> None:
+        """写入配置文件并把其中的 peer 设为运行中的状态"""
+        path = os.path.join(self.wg_dir, f"{interface}.conf")
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        subprocess.run(["systemctl", "start", f"wg-quick@{interface}"], env=self.env, check=True)
+
+    def running_peers(self, interface: str) -> list[str]:
+        """运行中的接口上的公钥列表"""
+        try:
+            with open(os.path.join(self.state_dir, interface)) as f:
+                return f.read().split()
+        except FileNotFoundError:
+            return []
+
+    def client(self, latency: float = 0.0) -> FakeSSHClient:
+        return FakeSSHClient(self, latency)
+
+    def close(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
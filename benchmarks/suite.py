@@ -0,0 +1,239 @@
+"""基准测试套件：热点函数的 CPU 耗时与端到端流程的 SSH 往返次数
+
+对 10 到 100k 个 Peer 的合成配置测量 parse_config、parse_peers、allocate_ip、
+删除 10% Peer 的重写和密钥生成；并在模拟传输（benchmarks.fake_transport）上运行
+list / add / remove 的完整流程，每次往返按 --latency 模拟网络延迟。
+
+结果以 JSON 输出，每项包含墙钟时间、本进程 CPU 时间和（端到端项目的）往返次数。
+指定 --compare 时与之前保存的结果比较，CPU 时间超出容差或往返次数增加时以状态码 1 退出。
+
+用法:
+    python -m benchmarks.suite [--sizes 10 100 1000 10000 100000] [--latency 0.02]
+                               [-o result.json] [--compare baseline.json]
+"""
+
+import argparse
+import contextlib
+import io
+import ipaddress
+import json
+import platform
+import sys
+import time
+from typing import Callable, Optional
+
+from wg_manager import __version__, crypto
+from wg_manager.add_peer import _add_peer_flow
+from wg_manager.parser import allocate_ip, parse_config, parse_peers, remove_peer_sections
+from wg_manager.remove_peer import _list_peers_flow, _remove_peer_flow
+from wg_manager.transport import run_flow
+
+from .fake_transport import FakeRemote
+
+# 结果格式版本，字段变化时递增
+RESULT_VERSION = 1
+
+
+def synthetic_config(n: int, private_key: str) -> str:
+    """生成包含 n 个 Peer 的服务端配置，网段大小按 n 选择"""
+    prefixlen = min(24, 32 - (n + 2).bit_length())
+    network = ipaddress.ip_network(f"10.0.0.0/{prefixlen}")
+    base = int(network.network_address)
+    lines = [
+        "[Interface]",
+        f"PrivateKey = {private_key}",
+        f"Address = {ipaddress.ip_address(base + 1)}/{prefixlen}",
+        "ListenPort = 51820",
+        "",
+    ]
+    for i in range(n):
+        lines += [
+            "[Peer]",
+            f"# peer-{i}",
+            f"PublicKey = {i:043d}=",
+            f"PresharedKey = {i:043d}=",
+            f"AllowedIPs = {ipaddress.ip_address(base + i + 2)}/32",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+def measure(func: Callable[[], object], repeat: int) -> tuple[float, float]:
+    """多次运行取最小值，返回 (墙钟时间, CPU 时间)"""
+    best_wall = best_cpu = float("inf")
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        func()
+        best_wall = min(best_wall, time.perf_counter() - wall)
+        best_cpu = min(best_cpu, time.process_time() - cpu)
+    return best_wall, best_cpu
+
+
+def bench_functions(n: int, private_key: str, repeat: int, keygen_max: int) -> list[dict]:
+    """热点函数的耗时"""
+    content = synthetic_config(n, private_key)
+    server_config, used_ips = parse_config(content)
+    keys = {f"{i:043d}=" for i in range(0, n, 10)}
+    keygen_n = min(n, keygen_max)
+
+    cases = [
+        ("parse_config", n, lambda: parse_config(content)),
+        ("parse_peers", n, lambda: parse_peers(content)),
+        ("allocate_ip", n, lambda: allocate_ip(server_config["address"], used_ips)),
+        ("remove_peer_sections", n, lambda: remove_peer_sections(content, keys)),
+        ("generate_keypairs", keygen_n, lambda: crypto.generate_keypairs(keygen_n, workers=1)),
+    ]
+    results = []
+    for name, count, func in cases:
+        wall, cpu = measure(func, 1 if name == "generate_keypairs" else repeat)
+        results.append({
+            "name": name, "peers": n, "count": count,
+            "wall_s": round(wall, 6), "cpu_s": round(cpu, 6),
+            "cpu_us_per_item": round(cpu / max(count, 1) * 1e6, 3),
+        })
+    return results
+
+
+def _run_quiet(remote: FakeRemote, latency: float, make_flow) -> tuple[float, float, int]:
+    """在新的模拟连接上执行流程，返回 (墙钟时间, CPU 时间, 往返次数)"""
+    ssh = remote.client(latency)
+    out, err = io.StringIO(), io.StringIO()
+    wall, cpu = time.perf_counter(), time.process_time()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        success = run_flow(ssh, make_flow(ssh))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    if not success:
+        raise RuntimeError(f"流程执行失败: {err.getvalue().strip()}")
+    return wall, cpu, ssh.round_trips
+
+
+def bench_e2e(n: int, private_key: str, latency: float, repeat: int) -> list[dict]:
+    """list / add / remove 在模拟传输上的耗时与往返次数"""
+    flows = {
+        "e2e.list_peers": lambda ssh: _list_peers_flow(ssh, "wg0"),
+        "e2e.add_peer": lambda ssh: _add_peer_flow(
+            ssh, "bench.invalid", "root@bench.invalid", "bench-new", "", "wg0", ""
+        ),
+        "e2e.remove_peer": lambda ssh: _remove_peer_flow(ssh, "bench-new", "wg0"),
+    }
+    samples: dict[str, list[tuple[float, float, int]]] = {name: [] for name in flows}
+    with FakeRemote() as remote:
+        remote.write_config("wg0", synthetic_config(n, private_key))
+        for _ in range(repeat):
+            # add 之后 remove，每轮结束时配置恢复为 n 个 Peer
+            for name, make_flow in flows.items():
+                samples[name].append(_run_quiet(remote, latency, make_flow))
+        if len(remote.running_peers("wg0")) != n:
+            raise RuntimeError("运行中的接口状态与配置不一致")
+
+    results = []
+    for name, runs in samples.items():
+        results.append({
+            "name": name, "peers": n, "latency_s": latency,
+            "wall_s": round(min(r[0] for r in runs), 6),
+            "cpu_s": round(min(r[1] for r in runs), 6),
+            "round_trips": max(r[2] for r in runs),
+        })
+    return results
+
+
+def compare(
+    results: list[dict],
+    baseline: list[dict],
+    tolerance: float,
+    min_delta: float
+) -> list[str]:
+    """与基线比较，返回退化项的说明
+
+    CPU 时间超出基线 tolerance 比例且绝对差值大于 min_delta 秒、
+    或往返次数增加时视为退化。
+    """
+    def key(r: dict) -> tuple:
+        return r["name"], r["peers"], r.get("count"), r.get("latency_s")
+
+    base = {key(r): r for r in baseline}
+    regressions = []
+    for result in results:
+        old = base.get(key(result))
+        if old is None:
+            continue
+        label = f"{result['name']} ({result['peers']} peers)"
+        cpu, old_cpu = result["cpu_s"], old["cpu_s"]
+        if cpu > old_cpu * (1 + tolerance) and cpu - old_cpu > min_delta:
+            regressions.append(f"{label}: CPU {old_cpu:.4f}s -> {cpu:.4f}s")
+        if result.get("round_trips", 0) > old.get("round_trips", 0):
+            regressions.append(
+                f"{label}: 往返 {old.get('round_trips', 0)} -> {result['round_trips']}"
+            )
+    return regressions
+
+
+def print_row(result: dict) -> None:
+    """在 stderr 输出一行可读的结果"""
+    trips = f"{result['round_trips']:>4} 次往返" if "round_trips" in result else ""
+    print(f"{result['name']:<22} {result['peers']:>7} peers  {result['wall_s']:>9.4f}s  "
+          f"CPU {result['cpu_s']:>9.4f}s  {trips}", file=sys.stderr)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="基准测试套件")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000],
+                        help="热点函数测试的 Peer 数量档位")
+    parser.add_argument("--e2e-sizes", type=int, nargs="*", default=[10, 1000, 10000],
+                        help="端到端流程测试的 Peer 数量档位（留空跳过）")
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="模拟的每次往返延迟（秒，默认: 0.02）")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数，取最小值（默认: 3）")
+    parser.add_argument("--keygen-max", type=int, default=1000,
+                        help="每档最多生成的密钥对数量（默认: 1000）")
+    parser.add_argument("-o", "--output", help="结果写入文件（默认输出到 stdout）")
+    parser.add_argument("--compare", metavar="BASELINE", help="与之前保存的结果比较")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="允许的 CPU 时间增幅比例（默认: 0.25）")
+    parser.add_argument("--min-delta", type=float, default=0.002,
+                        help="忽略小于该值的 CPU 时间差（秒，默认: 0.002）")
+    args = parser.parse_args(argv)
+
+    crypto.set_key_backend("auto")
+    private_key, _ = crypto.generate_keypair()
+
+    results = []
+    for n in args.sizes:
+        for result in bench_functions(n, private_key, args.repeat, args.keygen_max):
+            print_row(result)
+            results.append(result)
+    for n in args.e2e_sizes:
+        for result in bench_e2e(n, private_key, args.latency, args.repeat):
+            print_row(result)
+            results.append(result)
+
+    report = {
+        "version": RESULT_VERSION,
+        "wg_manager": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "key_backend": crypto.get_key_backend(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance, args.min_delta)
+        for line in regressions:
+            print(f"退化: {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("与基线相比没有退化", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
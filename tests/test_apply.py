@@ -0,0 +1,136 @@
+"""apply 执行计划的生成测试（不连接服务器）"""
+
+import pytest
+
+from wg_manager.apply import DesiredInterface, DesiredPeer, HostState, plan_host
+from wg_manager.deploy import HostSnapshot
+from wg_manager.inventory import InventoryHost
+from wg_manager.model import parse_wg_config
+from wg_manager.parser import InterfaceConfig
+from wg_manager.reconcile import PeerState, normalize_networks
+
+
+WG0 = """\
+[Interface]
+PrivateKey = cHJpdmF0ZS1rZXktcHJpdmF0ZS1rZXktcHJpdmF0ZT0=
+Address = 10.0.0.1/24
+ListenPort = 51820
+
+[Peer]
+# alice
+PublicKey = AAA=
+AllowedIPs = 10.0.0.2/32
+
+[Peer]
+# bob
+PublicKey = BBB=
+AllowedIPs = 10.0.0.3/32
+"""
+
+
+def _path(name: str) -> str:
+    return f"/etc/wireguard/{name}.conf"
+
+
+def _snapshot() -> HostSnapshot:
+    return HostSnapshot(
+        interfaces=[InterfaceConfig("wg0", _path("wg0"), WG0, "fp0")],
+        ports={22, 51820},
+        links={"eth0", "lo"},
+        default_iface="eth0",
+    )
+
+
+def _state(*interfaces: DesiredInterface) -> HostState:
+    return HostState(InventoryHost("h", "root@h"), list(interfaces))
+
+
+def test_plan_add_remove_update_and_create():
+    state = _state(
+        DesiredInterface("wg0", peers=[
+            DesiredPeer("alice", allowed_ips=["10.0.0.9/32"]),
+            DesiredPeer("carol", public_key="CCC="),
+        ]),
+        DesiredInterface("wg1", address="10.1.0.1/24", peers=[DesiredPeer("dave", public_key="DDD=")]),
+    )
+    host = _snapshot()
+
+    plan = plan_host(state, host, _path, generate=False)
+
+    assert [(s.action, s.interface) for s in plan.steps] == [
+        ("create", "wg1"), ("add", "wg0"), ("add", "wg1"), ("remove", "wg0"), ("update", "wg0")
+    ]
+    # 新接口使用第一个未占用的端口，快照本身不被修改
+    assert "端口 51821" in plan.steps[0].detail
+    assert len(host.interfaces) == 1 and host.ports == {22, 51820}
+
+    (path0, content0, fp0), (path1, content1, fp1) = plan.writes
+    assert (path0, fp0) == (_path("wg0"), "fp0")
+    assert (path1, fp1) == (_path("wg1"), None)
+    peers = {p.name: p.allowed_ips for p in parse_wg_config(content0).peers}
+    # carol 分配到第一个空闲地址（alice 改用新地址后释放的地址）
+    assert peers == {"alice": ["10.0.0.9/32"], "carol": ["10.0.0.2/32"]}
+    assert [p.name for p in parse_wg_config(content1).peers] == ["dave"]
+    assert plan.live == [
+        ("启用 wg-quick@wg1", "systemctl enable wg-quick@wg1"),
+        ("启动 wg-quick@wg1", "systemctl start wg-quick@wg1"),
+    ]
+
+
+def test_plan_live_commands_follow_running_peers():
+    state = _state(DesiredInterface("wg0", peers=[
+        DesiredPeer("alice"), DesiredPeer("bob"), DesiredPeer("carol", public_key="CCC=")
+    ]))
+    host = _snapshot()
+    host.running = {"wg0"}
+
+    # 运行状态未知：与原配置文件比较
+    plan = plan_host(state, host, _path)
+    assert plan.live == [("wg set wg0", "wg set wg0 peer CCC= allowed-ips 10.0.0.4/32")]
+
+    # 运行中的接口与配置文件不一致：按实际运行的 peer 修正
+    host.peers = {"wg0": {
+        "AAA=": PeerState("AAA=", "", normalize_networks(["10.0.0.2/32"])),
+        "ZZZ=": PeerState("ZZZ=", "", normalize_networks(["10.0.0.9/32"])),
+    }}
+    plan = plan_host(state, host, _path)
+    assert plan.live == [(
+        "wg set wg0",
+        "wg set wg0 peer ZZZ= remove peer BBB= allowed-ips 10.0.0.3/32 peer CCC= allowed-ips 10.0.0.4/32"
+    )]
+
+
+def test_plan_without_prune_keeps_unlisted_peers():
+    state = _state(DesiredInterface("wg0", peers=[DesiredPeer("alice")]))
+
+    assert plan_host(state, _snapshot(), _path, prune=False).writes == []
+    plan = plan_host(state, _snapshot(), _path)
+    assert [(s.action, s.detail) for s in plan.steps] == [("remove", "bob: 10.0.0.3/32")]
+
+
+def test_plan_unchanged_host_is_empty():
+    state = _state(DesiredInterface("wg0", peers=[DesiredPeer("alice"), DesiredPeer("bob")]))
+
+    plan = plan_host(state, _snapshot(), _path)
+    assert (plan.steps, plan.writes, plan.live) == ([], [], [])
+
+
+@pytest.mark.parametrize("interface", [
+    DesiredInterface("wg1"),
+    DesiredInterface("wg1", address="10.0.0.5/24"),
+    DesiredInterface("wg1", address="10.1.0.1/24", port=51820),
+    DesiredInterface("eth0", address="10.1.0.1/24"),
+    DesiredInterface("bad name", address="10.1.0.1/24"),
+])
+def test_plan_rejects_invalid_new_interface(interface):
+    with pytest.raises(ValueError):
+        plan_host(_state(interface), _snapshot(), _path, generate=False)
+
+
+def test_plan_checks_new_interfaces_against_each_other():
+    state = _state(
+        DesiredInterface("wg1", address="10.1.0.1/24"),
+        DesiredInterface("wg2", address="10.1.0.129/25"),
+    )
+    with pytest.raises(ValueError):
+        plan_host(state, _snapshot(), _path, generate=False)
@@ -0,0 +1,101 @@
+"""地址池与本地状态库按空隙分配地址的正确性测试"""
+
+import ipaddress
+
+import pytest
+
+from wg_manager.ipam import AddressPool
+from wg_manager.model import parse_wg_config
+from wg_manager.parser import InterfaceConfig
+from wg_manager.store import Store
+
+
+def _ips(addresses) -> list[str]:
+    return [str(a) for a in addresses]
+
+
+def test_pool_skips_network_broadcast_and_used():
+    pool = AddressPool("10.0.0.1/29", used=["10.0.0.1", "10.0.0.3/32"])
+
+    assert pool.free_count == 4
+    assert _ips(pool.allocate_many(4)) == ["10.0.0.2", "10.0.0.4", "10.0.0.5", "10.0.0.6"]
+    with pytest.raises(RuntimeError):
+        pool.allocate()
+
+
+def test_pool_reserved_ranges_and_outside_cidrs():
+    pool = AddressPool(
+        "10.0.0.0/24",
+        reserved=["10.0.0.1-10.0.0.9", "10.0.0.16/30"],
+        # 网段外的地址、未完全包含在网段内的 CIDR 和无效值不占用地址
+        used=["0.0.0.0/0", "192.168.1.5", "not-an-ip", "10.0.0.10"]
+    )
+
+    assert "10.0.0.5" in pool
+    assert "10.0.0.11" not in pool
+    assert _ips(pool.allocate_many(6)) == [
+        "10.0.0.11", "10.0.0.12", "10.0.0.13", "10.0.0.14", "10.0.0.15", "10.0.0.20"
+    ]
+
+
+def test_pool_allocate_many_is_all_or_nothing():
+    pool = AddressPool("10.0.0.0/30")
+
+    with pytest.raises(RuntimeError):
+        pool.allocate_many(3)
+    assert pool.free_count == 2
+
+
+def test_pool_reuses_released_address():
+    pool = AddressPool("fd00::1/120", used=["fd00::1"])
+    first, second = pool.allocate_many(2)
+
+    assert pool.release(str(first))
+    assert not pool.release(str(first))
+    assert pool.allocate() == first
+    assert pool.allocate() == ipaddress.ip_address("fd00::4")
+    assert second == ipaddress.ip_address("fd00::3")
+
+
+WG0 = """\
+[Interface]
+PrivateKey = cHJpdmF0ZS1rZXktcHJpdmF0ZS1rZXktcHJpdmF0ZT0=
+Address = 10.0.0.1/28
+ListenPort = 51820
+
+[Peer]
+# alice
+PublicKey = AAA=
+AllowedIPs = 10.0.0.2/32
+
+[Peer]
+# bob
+PublicKey = BBB=
+AllowedIPs = 10.0.0.3/32, 10.0.0.5/32
+"""
+
+
+def test_store_allocates_from_gaps(tmp_path):
+    with Store(str(tmp_path / "state.db")) as store:
+        iface = InterfaceConfig("wg0", "/etc/wireguard/wg0.conf", WG0, "fp1")
+
+        assert store.allocate("h", iface, 3) == ["10.0.0.4/32", "10.0.0.6/32", "10.0.0.7/32"]
+        # 分配本身不记录，重复分配得到相同结果
+        assert store.allocate("h", iface, 1) == ["10.0.0.4/32"]
+        assert store.allocate("h", iface, 2, reserved=["10.0.0.4-10.0.0.6"]) == [
+            "10.0.0.7/32", "10.0.0.8/32"
+        ]
+
+
+def test_store_allocate_after_record_and_when_full(tmp_path):
+    with Store(str(tmp_path / "state.db")) as store:
+        iface = InterfaceConfig("wg0", "/etc/wireguard/wg0.conf", WG0, "fp1")
+        store.allocate("h", iface, 1)
+        peers = parse_wg_config("[Peer]\n# carol\nPublicKey = CCC=\nAllowedIPs = 10.0.0.4/32\n").peers
+        store.record_peers("h", "wg0", peers, fingerprint="fp1")
+
+        assert store.allocate("h", iface, 1) == ["10.0.0.6/32"]
+        # /28 共 14 个可用地址，已用 .1-.5
+        assert len(store.allocate("h", iface, 9)) == 9
+        with pytest.raises(RuntimeError):
+            store.allocate("h", iface, 10)
@@ -0,0 +1,135 @@
+"""配置对象模型与按区间删除 [Peer] 段的正确性测试"""
+
+from wg_manager.model import parse_wg_config, remove_spans
+from wg_manager.parser import parse_peers, remove_peer_sections
+
+
+INTERFACE = """\
+[Interface]
+PrivateKey = cHJpdmF0ZS1rZXktcHJpdmF0ZS1rZXktcHJpdmF0ZT0=
+Address = 10.0.0.1/24
+ListenPort = 51820
+"""
+
+
+def _peer(name: str, key: str, ip: str) -> str:
+    return f"\n[Peer]\n# {name}\nPublicKey = {key}\nAllowedIPs = {ip}\n"
+
+
+def test_round_trip_is_lossless():
+    content = (
+        "# managed by wg-manager\n\n"
+        + INTERFACE
+        + "# Clients below\n"
+        + "\n# laptop\n[Peer]  # inline header comment\n"
+        + "PublicKey = BBB=  # inline value comment\n"
+        + "AllowedIPs = 10.0.0.3/32,  10.1.0.0/24\n"
+        + "PostUp = echo a#b\n"
+    )
+    assert parse_wg_config(content).serialize() == content
+
+
+def test_remove_several_spans_in_one_pass():
+    content = (
+        INTERFACE
+        + _peer("alice", "AAA=", "10.0.0.2/32")
+        + _peer("bob", "BBB=", "10.0.0.3/32")
+        + _peer("carol", "CCC=", "10.0.0.4/32")
+        + _peer("dave", "DDD=", "10.0.0.5/32")
+    )
+    new_content, removed = remove_peer_sections(content, {"AAA=", "CCC=", "DDD="})
+
+    assert removed == 3
+    # 段之间的空行属于上一段，删除最后一段时其前的空行保留
+    assert new_content == INTERFACE + _peer("bob", "BBB=", "10.0.0.3/32") + "\n"
+    assert [p["name"] for p in parse_peers(new_content)] == ["bob"]
+
+
+def test_remove_spans_accepts_unsorted_and_overlapping_spans():
+    assert remove_spans("0123456789", [(6, 8), (1, 3), (2, 4)]) == "04589"
+
+
+def test_comment_above_header_belongs_to_peer():
+    content = INTERFACE + "\n# alice\n[Peer]\nPublicKey = AAA=\nAllowedIPs = 10.0.0.2/32\n"
+    peer, = parse_wg_config(content).peers
+
+    assert peer.name == "alice"
+    new_content, removed = remove_peer_sections(content, {"AAA="})
+    assert removed == 1
+    assert new_content == INTERFACE + "\n"
+
+
+def test_comment_without_blank_line_stays_with_previous_section():
+    content = INTERFACE + (
+        "# Clients below\n[Peer]\n# phone\nPublicKey = AAA=\nAllowedIPs = 10.0.0.2/32\n"
+    )
+    config = parse_wg_config(content)
+
+    assert config.peers[0].leading == []
+    assert "Clients below" in config.interface.comments
+    assert [p["name"] for p in parse_peers(content)] == ["phone"]
+
+    new_content, _ = remove_peer_sections(content, {"AAA="})
+    assert new_content == INTERFACE + "# Clients below\n"
+
+
+def test_comment_below_header_is_name_and_trailing_comment_is_kept():
+    content = (
+        INTERFACE
+        + _peer("alice", "AAA=", "10.0.0.2/32")
+        + "# alice's phone is lost, re-issue\n"
+        + _peer("bob", "BBB=", "10.0.0.3/32")
+    )
+    config = parse_wg_config(content)
+
+    assert [p.name for p in config.peers] == ["alice", "bob"]
+    new_content, _ = remove_peer_sections(content, {"BBB="})
+    assert new_content == (
+        INTERFACE + _peer("alice", "AAA=", "10.0.0.2/32") + "# alice's phone is lost, re-issue\n\n"
+    )
+
+
+def test_inline_comments_are_not_part_of_values():
+    content = INTERFACE + (
+        "\n[Peer] # tablet\nPublicKey = AAA= # tablet key\nAllowedIPs = 10.0.0.2/32 # only one\n"
+    )
+    peer, = parse_wg_config(content).peers
+
+    assert peer.public_key == "AAA="
+    assert peer.allowed_ips == ["10.0.0.2/32"]
+    assert remove_peer_sections(content, {"AAA="}) == (INTERFACE + "\n", 1)
+
+
+def test_crlf_line_endings():
+    content = (
+        INTERFACE + _peer("alice", "AAA=", "10.0.0.2/32") + _peer("bob", "BBB=", "10.0.0.3/32")
+    ).replace("\n", "\r\n")
+    config = parse_wg_config(content)
+
+    assert config.serialize() == content
+    assert config.interface.address == "10.0.0.1/24"
+    assert [(p.name, p.public_key, p.allowed_ips) for p in config.peers] == [
+        ("alice", "AAA=", ["10.0.0.2/32"]),
+        ("bob", "BBB=", ["10.0.0.3/32"]),
+    ]
+
+    config.peers[1].set("AllowedIPs", "10.0.0.3/32, 10.1.0.0/24")
+    assert config.serialize().endswith("AllowedIPs = 10.0.0.3/32, 10.1.0.0/24\r\n")
+
+    new_content, _ = remove_peer_sections(content, {"AAA="})
+    assert new_content == (INTERFACE + _peer("bob", "BBB=", "10.0.0.3/32")).replace("\n", "\r\n")
+
+
+def test_trailing_peer_without_final_newline():
+    last = "\n[Peer]\n# bob\nPublicKey = BBB=\nAllowedIPs = 10.0.0.3/32"
+    content = INTERFACE + _peer("alice", "AAA=", "10.0.0.2/32") + last
+    config = parse_wg_config(content)
+
+    assert config.serialize() == content
+    assert config.peers[-1].allowed_ips == ["10.0.0.3/32"]
+    assert config.peers[-1].end == len(content)
+
+    assert remove_peer_sections(content, {"BBB="}) == (
+        INTERFACE + _peer("alice", "AAA=", "10.0.0.2/32") + "\n", 1
+    )
+    assert remove_peer_sections(content, {"AAA="}) == (INTERFACE + last, 1)
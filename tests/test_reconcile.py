@@ -0,0 +1,91 @@
+"""配置文件与运行中接口的 peer 比较及 wg set 命令生成测试"""
+
+from wg_manager.model import parse_wg_config
+from wg_manager.reconcile import InterfacePlan, PeerState, diff_peers, normalize_networks
+
+
+PEERS = """\
+[Peer]
+# alice
+PublicKey = AAA=
+AllowedIPs = 10.0.0.2/32
+
+[Peer]
+# bob
+PublicKey = BBB=
+PresharedKey = cHNrLXBzay1wc2stcHNrLXBzay1wc2stcHNrLXBzaz0=
+AllowedIPs = 10.0.0.3/32
+
+[Peer]
+# carol
+PublicKey = CCC=
+AllowedIPs = 10.0.0.4/32, 10.1.0.0/24
+"""
+
+
+def _state(key: str, *allowed_ips: str, psk: str = "") -> PeerState:
+    return PeerState(key, psk, normalize_networks(allowed_ips))
+
+
+def test_normalize_networks():
+    assert normalize_networks(["10.0.0.1/24", " 10.0.0.0/24", "(none)", ""]) == {"10.0.0.0/24"}
+
+
+def test_diff_peers_orders_remove_add_update():
+    desired = parse_wg_config(PEERS).peers
+    current = {
+        "ZZZ=": _state("ZZZ=", "10.0.0.9/32"),
+        "AAA=": _state("AAA=", "10.0.0.2/32"),
+        "CCC=": _state("CCC=", "10.1.0.1/24", "10.0.0.4/32"),
+        "BBB=": _state("BBB=", "10.0.0.5/32"),
+    }
+
+    changes = diff_peers("wg0", desired, current)
+
+    # alice 不变；carol 的 AllowedIPs 规范化后相同
+    assert [(c.action, c.public_key) for c in changes] == [("remove", "ZZZ="), ("update", "BBB=")]
+    update = changes[1]
+    assert update.allowed_ips_from == {"10.0.0.5/32"}
+    assert update.psk
+
+
+def test_diff_peers_adds_missing_peers():
+    changes = diff_peers("wg0", parse_wg_config(PEERS).peers, {})
+
+    assert [(c.action, c.name) for c in changes] == [("add", "alice"), ("add", "bob"), ("add", "carol")]
+
+
+def test_commands_merge_changes_without_psk():
+    desired = parse_wg_config(PEERS).peers
+    current = {
+        "ZZZ=": _state("ZZZ=", "10.0.0.9/32"),
+        "BBB=": _state("BBB=", "10.0.0.3/32", psk="old"),
+        "CCC=": _state("CCC=", "10.0.0.4/32"),
+    }
+
+    commands = InterfacePlan("wg0", diff_peers("wg0", desired, current)).commands()
+
+    assert commands == [
+        "wg set wg0 peer ZZZ= remove peer AAA= allowed-ips 10.0.0.2/32 "
+        "peer CCC= allowed-ips 10.0.0.4/32,10.1.0.0/24",
+        # 预共享密钥经 stdin 传入，每个 peer 一条命令
+        "printf '%s\\n' cHNrLXBzay1wc2stcHNrLXBzay1wc2stcHNrLXBzaz0= | "
+        "wg set wg0 peer BBB= preshared-key /dev/stdin allowed-ips 10.0.0.3/32",
+    ]
+
+
+def test_commands_clear_psk():
+    desired = parse_wg_config("[Peer]\nPublicKey = AAA=\nAllowedIPs = 10.0.0.2/32\n").peers
+    current = {"AAA=": _state("AAA=", "10.0.0.2/32", psk="old")}
+
+    assert InterfacePlan("wg0", diff_peers("wg0", desired, current)).commands() == [
+        "wg set wg0 peer AAA= preshared-key /dev/null"
+    ]
+
+
+def test_no_changes_no_commands():
+    desired = parse_wg_config(PEERS).peers
+    current = {p.public_key: PeerState.from_peer(p) for p in desired}
+
+    assert diff_peers("wg0", desired, current) == []
+    assert InterfacePlan("wg0", []).commands() == []
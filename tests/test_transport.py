@@ -0,0 +1,89 @@
+"""批量脚本的输出分帧与按指纹条件写入的正确性测试"""
+
+import shlex
+import subprocess
+
+from wg_manager.transport import (
+    FINGERPRINT_MISMATCH, BatchStep, LocalTransport, build_batch_script, parse_batch_output,
+    remote_fingerprint
+)
+
+
+TOKEN = "WGM_TEST_TOKEN"
+
+
+def _run_script(steps: list[BatchStep], stop_on_error: bool = True):
+    script = build_batch_script(steps, stop_on_error, TOKEN)
+    output = subprocess.run(["sh", "-s"], input=script, capture_output=True, text=True).stdout
+    return parse_batch_output(output, steps, TOKEN)
+
+
+def test_batch_output_is_framed_per_step():
+    steps = [
+        BatchStep("ok", "echo hello; echo world"),
+        # 输出中出现与分隔行相同的内容不影响解析
+        BatchStep("fake", f"echo '{TOKEN} 5 0'; echo oops >&2; exit 3", check=False),
+        BatchStep("empty", "true"),
+    ]
+    results = _run_script(steps)
+
+    assert [(r.step, r.returncode) for r in results] == [("ok", 0), ("fake", 3), ("empty", 0)]
+    assert results[0].output == "hello\nworld"
+    assert results[1].output == f"{TOKEN} 5 0\noops"
+    assert results[2].output == ""
+
+
+def test_batch_stops_after_failed_step():
+    steps = [BatchStep("fail", "exit 1"), BatchStep("never", "echo never")]
+
+    assert [r.step for r in _run_script(steps)] == ["fail"]
+    assert [r.returncode for r in _run_script(steps, stop_on_error=False)] == [1, 0]
+
+
+def test_parse_batch_output_ignores_unrelated_lines():
+    steps = [BatchStep("a", "")]
+    output = f"motd banner\n{TOKEN} 0 2\naGk=\n"
+
+    result, = parse_batch_output(output, steps, TOKEN)
+    assert (result.step, result.returncode, result.output) == ("a", 2, "hi")
+
+
+def test_append_only_when_fingerprint_matches(tmp_path):
+    path = str(tmp_path / "wg0.conf")
+    local = LocalTransport(str(tmp_path))
+
+    ok, results = local.batch().write_file(path, "[Interface]\n").execute()
+    assert ok
+    fingerprint = results[0].output
+
+    ok, results = local.batch().append_file(path, "\n[Peer]\n", fingerprint).execute()
+    assert ok
+    assert results[0].output != fingerprint
+    with open(path) as f:
+        assert f.read() == "[Interface]\n\n[Peer]\n"
+
+    # 文件已在读取后被修改：不追加
+    ok, results = local.batch().append_file(path, "\n[Peer]\n", fingerprint).execute()
+    assert not ok
+    assert results[0].returncode == FINGERPRINT_MISMATCH
+    with open(path) as f:
+        assert f.read() == "[Interface]\n\n[Peer]\n"
+
+
+def test_write_only_when_fingerprint_matches(tmp_path):
+    path = str(tmp_path / "wg0.conf")
+    local = LocalTransport(str(tmp_path))
+    fingerprint = local.batch().write_file(path, "old\n").execute()[1][0].output
+    local.batch().append_file(path, "more\n", fingerprint).execute()
+
+    ok, results = local.batch().write_file(path, "new\n", fingerprint=fingerprint).execute()
+    assert not ok
+    assert results[0].returncode == FINGERPRINT_MISMATCH
+    with open(path) as f:
+        assert f.read() == "old\nmore\n"
+
+    fingerprint = local.run_command(f'echo "{remote_fingerprint(shlex.quote(path))}"')[1]
+    ok, results = local.batch().write_file(path, "new\n", fingerprint=fingerprint).execute()
+    assert ok
+    with open(path) as f:
+        assert f.read() == "new\n"
@@ -3,7 +3,17 @@
 __version__ = "0.2.0"
 
 from .deploy import deploy_server
-from .add_peer import add_peer
-from .remove_peer import remove_peer, list_peers
+from .add_peer import add_peer, add_peers
+from .remove_peer import remove_peer, remove_peers, list_peers
+from .status import show_status
+from .find import find_peers
+from .reconcile import reconcile
+from .sync import sync_hosts
+from .apply import apply_state
+from .aio import AsyncSSHClient
 
-__all__ = ["deploy_server", "add_peer", "remove_peer", "list_peers"]
+__all__ = [
+    "deploy_server", "add_peer", "add_peers", "remove_peer", "remove_peers", "list_peers",
+    "show_status", "find_peers", "sync_hosts", "reconcile", "apply_state",
+    "AsyncSSHClient",
+]
@@ -1,12 +1,20 @@
 """添加 WireGuard 客户端节点模块"""
 
 import sys
-from typing import Optional
+import time
+from typing import Iterable, Optional
 
-from .config import REMOTE_WG_DIR
-from .crypto import generate_keypair, generate_preshared_key
-from .parser import parse_config, scan_interfaces, get_network, allocate_ip
-from .ssh import connect_ssh
+from . import trace
+from .crypto import generate_keypair, generate_keypairs, generate_preshared_key
+from .export import ClientExport, build_client_config, check_qr_formats, export_clients
+from .model import Peer
+from .ipam import host_prefix
+from .parser import InterfaceConfig, scan_interfaces_flow, select_interface, get_network
+from .session import connect_ssh
+from .transport import (
+    FINGERPRINT_MISMATCH, Flow, RemoteBatch, RemoteCommand, Transport, run_flow
+)
+from .wgctl import add_peers_command, syncconf_command, verify_peers_command
 
 
 def add_peer(
@@ -16,7 +24,9 @@ def add_peer(
     interface: Optional[str] = None,
     ssh_port: int = 22,
     key_file: Optional[str] = None,
-    dns: str = ""
+    dns: str = "",
+    reserved: Iterable[str] = (),
+    interactive: bool = True
 ) -> bool:
     """添加客户端节点
 
@@ -28,6 +38,8 @@ def add_peer(
         ssh_port: SSH 端口，默认 22
         key_file: SSH 私钥文件路径
         dns: DNS 服务器（留空则不设置）
+        reserved: 不参与分配的地址或范围（地址、CIDR 或 "起始-结束"）
+        interactive: 有多个接口且未指定时是否询问用户（否则报错）
 
     Returns:
         是否成功
@@ -36,62 +48,256 @@ def add_peer(
     if ssh is None:
         return False
 
-    # 扫描配置文件
+    with ssh:
+        return run_flow(ssh, _add_peer_flow(
+            ssh, server, host, name, allowed_ips, interface, dns, reserved, interactive
+        ))
+
+
+def build_peer(name: str, public_key: str, psk: str, ip: str) -> Peer:
+    """构建服务端配置中的 [Peer] 段对象
+
+    Args:
+        name: 客户端名称（写入注释）
+        public_key: 客户端公钥
+        psk: 预共享密钥
+        ip: 分配的客户端 IP，如 10.0.0.2/32
+    """
+    return Peer.build([
+        ("PublicKey", public_key),
+        ("PresharedKey", psk),
+        ("AllowedIPs", host_prefix(ip)),
+    ], comment=name)
+
+
+def build_peer_section(name: str, public_key: str, psk: str, ip: str) -> str:
+    """构建服务端配置中的 [Peer] 段文本（以空行开头，可直接追加到配置末尾）
+
+    参数同 build_peer
+    """
+    return "\n" + build_peer(name, public_key, psk, ip).serialize()
+
+
+@trace.traced("add_peer.select")
+def _select_target(
+    ssh: Transport,
+    host: str,
+    interface: Optional[str],
+    interactive: bool = True
+) -> Flow[Optional[InterfaceConfig]]:
+    """扫描并选择要添加客户端的接口"""
     print("扫描 WireGuard 配置...")
-    interfaces = scan_interfaces(ssh)
+    interfaces = yield from scan_interfaces_flow(ssh)
 
     if not interfaces:
         print("错误: 服务器上没有 WireGuard 配置文件", file=sys.stderr)
         print(f"请先使用 'wg-manager deploy {host}' 部署服务", file=sys.stderr)
-        return False
+        return None
 
-    # 选择接口
-    if interface:
-        # 指定了接口，验证是否存在
-        matching = [(iface, net) for iface, net in interfaces if iface == interface]
-        if not matching:
-            print(f"错误: 接口 {interface} 不存在", file=sys.stderr)
-            print(f"可用接口: {', '.join(i[0] for i in interfaces)}", file=sys.stderr)
-            return False
-        selected_interface, network = matching[0]
-    elif len(interfaces) == 1:
-        selected_interface, network = interfaces[0]
-        print(f"使用接口: {selected_interface} ({network})")
+    selected = select_interface(interfaces, interface, interactive)
+    if selected is None:
+        return None
+
+    if not selected.server_config["private_key"]:
+        print("错误: 配置文件中未找到 PrivateKey", file=sys.stderr)
+        return None
+
+    return selected
+
+
+def _check_duplicates(
+    ssh: Transport,
+    selected: InterfaceConfig,
+    names: Iterable[str] = (),
+    public_keys: Iterable[str] = ()
+) -> bool:
+    """检查新客户端的名称和公钥是否已被使用
+
+    名称只需在选中接口内唯一（不同接口、不同主机上可以有同名客户端，
+    如 fleet add 在每台主机上添加同名客户端）。
+    公钥检查选中接口，有客户端索引（ssh.index）时还检查索引中的所有主机。
+    """
+    existing = selected.model.peers
+    used_names = {p.name for p in existing}
+    used_keys = {p.public_key for p in existing}
+
+    conflicts = [("名称", name, None) for name in names if name in used_names]
+    for public_key in public_keys:
+        if public_key in used_keys:
+            conflicts.append(("公钥", public_key, None))
+        elif ssh.index is not None:
+            conflicts.extend(("公钥", public_key, loc) for loc in ssh.index.find_key(public_key))
+    for label, value, loc in conflicts:
+        where = f"{loc.host} {loc.interface} ({loc.allowed_ips})" if loc else selected.name
+        print(f"错误: 客户端{label} {value} 已存在: {where}", file=sys.stderr)
+    return not conflicts
+
+
+def _allocate(
+    ssh: Transport,
+    selected: InterfaceConfig,
+    count: int,
+    reserved: Iterable[str] = ()
+) -> list[str]:
+    """为新客户端分配地址
+
+    有本地状态库（ssh.store）时查表分配（扫描得到的指纹与库中一致时不解析 Peer 段），
+    否则按扫描到的配置新建地址池。
+
+    Raises:
+        RuntimeError: 地址不足
+        ValueError: 接口未配置 Address 或保留范围格式无效
+    """
+    with trace.span("ipam.allocate", count=count, store=ssh.store is not None):
+        if ssh.store is not None:
+            return ssh.store.allocate(ssh.cache_key, selected, count, reserved)
+        pool = selected.address_pool(reserved)
+        return [host_prefix(str(ip)) for ip in pool.allocate_many(count)]
+
+
+def _record_added(
+    ssh: Transport,
+    selected: InterfaceConfig,
+    peers: list[Peer],
+    fingerprint: str = ""
+) -> None:
+    """把已写入服务端配置的客户端记入客户端索引和本地状态库
+
+    fingerprint 为写入后配置文件的远程指纹，未知时为空字符串。
+    """
+    if ssh.index is not None:
+        ssh.index.add_peers(ssh.cache_key, selected.name, peers, selected.path, fingerprint)
+    if ssh.store is not None:
+        ssh.store.record_peers(ssh.cache_key, selected.name, peers, fingerprint)
+
+
+def _current_content(
+    ssh: Transport,
+    selected: InterfaceConfig,
+    new_ips: list[str]
+) -> Flow[tuple[Optional[str], str]]:
+    """重新读取已被修改的配置，确认新分配的地址仍未被占用，返回 (当前内容, 读取时的指纹)"""
+    interfaces = yield from scan_interfaces_flow(ssh)
+    current = next((i for i in interfaces if i.name == selected.name), None)
+    if current is None:
+        print(f"错误: 接口 {selected.name} 的配置文件已不存在", file=sys.stderr)
+        return None, ""
+    try:
+        pool = current.address_pool()
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return None, ""
+    taken = [ip for ip in new_ips if ip in pool]
+    if taken:
+        print(f"错误: 地址 {', '.join(taken)} 已被其他操作占用，请重试", file=sys.stderr)
+        return None, ""
+    return current.content, current.fingerprint
+
+
+@trace.traced("add_peer.update_server")
+def _update_server(
+    ssh: Transport,
+    selected: InterfaceConfig,
+    peers: list[Peer]
+) -> Flow[bool]:
+    """追加 Peer 段到服务端配置并下发到运行中的接口（不断线），正常情况一次往返完成
+
+    配置文件自扫描后未被修改（指纹一致）时只追加新的 Peer 段；
+    否则重新读取当前内容，确认新地址未被占用后完整写入（原子替换）。
+
+    新 peer 通过 wg set（多个时 wg addconf）逐个下发并校验，
+    失败时才用 wg syncconf 同步整个接口，最后才重启服务。
+    """
+    interface = selected.name
+    config_path = ssh.config_path(interface)
+    new_sections = "".join("\n" + peer.serialize() for peer in peers)
+    public_keys = [peer.public_key for peer in peers]
+
+    def write_and_push(content: Optional[str], fingerprint: str) -> RemoteBatch:
+        batch = ssh.batch()
+        if content is None:
+            batch.append_file(config_path, new_sections, fingerprint)
+        else:
+            batch.write_file(config_path, content.rstrip() + "\n" + new_sections,
+                             fingerprint=fingerprint or None)
+        batch.run(add_peers_command(interface, peers),
+                  description=f"下发 {len(peers)} 个 peer 到 {interface}")
+        batch.run(verify_peers_command(interface, public_keys), description="校验 peer 已生效")
+        return batch
+
+    print("更新服务端配置并下发新客户端...")
+    appended = bool(selected.fingerprint)
+    if appended:
+        success, results = yield write_and_push(None, selected.fingerprint)
     else:
-        # 多个接口，询问用户
-        print("\n发现多个 WireGuard 接口:")
-        for i, (iface, net) in enumerate(interfaces, 1):
-            print(f"  {i}. {iface} ({net})")
-        try:
-            choice = input(f"请选择 [1-{len(interfaces)}]: ").strip()
-            idx = int(choice) - 1
-            if 0 <= idx < len(interfaces):
-                selected_interface, network = interfaces[idx]
-            else:
-                print("无效选择", file=sys.stderr)
-                return False
-        except (ValueError, KeyboardInterrupt):
-            print("\n已取消", file=sys.stderr)
+        success, results = yield write_and_push(selected.content, "")
+
+    if results and results[0].returncode == FINGERPRINT_MISMATCH:
+        print("配置文件在读取后已被修改，重新读取后完整写入...")
+        new_ips = [ip for p in peers for ip in p.allowed_ips]
+        content, fingerprint = yield from _current_content(ssh, selected, new_ips)
+        if content is None:
             return False
+        appended = False
+        success, results = yield write_and_push(content, fingerprint)
+
+    if not results or not results[0].success:
+        msg = results[0].output if results else ""
+        print(f"写入配置失败: {msg}", file=sys.stderr)
+        return False
+    written = "追加" if appended else "完整写入"
+    # 只追加时输出即追加后的指纹，状态库可直接沿用；完整写入后下次使用前重新导入
+    _record_added(ssh, selected, peers, results[0].output.strip() if appended else "")
+
+    if success:
+        command = "wg set" if len(peers) == 1 else "wg addconf"
+        print(f"配置文件: {written}；运行中的接口: 已通过 {command} 下发新客户端（未重载接口）")
+        return True
+
+    failed = results[-1]
+    detail = f": {failed.output}" if failed.output else ""
+    print(f"警告: {failed.step}失败{detail}，改用 wg syncconf 同步整个接口...", file=sys.stderr)
+    batch = ssh.batch()
+    batch.run(syncconf_command(interface, config_path), description=f"wg syncconf {interface}")
+    batch.run(verify_peers_command(interface, public_keys), description="校验 peer 已生效")
+    success, results = yield batch
+    if success:
+        print(f"配置文件: {written}；运行中的接口: 已通过 wg syncconf 同步")
+        return True
 
-    # 读取配置文件
-    config_path = f"{REMOTE_WG_DIR}/{selected_interface}.conf"
-    success, config_content = ssh.read_remote_file(config_path)
+    print(f"警告: 热重载失败，尝试重启服务...", file=sys.stderr)
+    success, msg = yield RemoteCommand(f"systemctl restart wg-quick@{interface}")
     if not success:
-        print(f"读取配置失败: {config_content}", file=sys.stderr)
+        print(f"重启服务失败: {msg}", file=sys.stderr)
         return False
+    print(f"配置文件: {written}；运行中的接口: 已重启服务（现有连接短暂中断）")
+    return True
 
-    # 解析配置
-    server_config, used_ips = parse_config(config_content)
 
-    if not server_config["private_key"]:
-        print("错误: 配置文件中未找到 PrivateKey", file=sys.stderr)
+@trace.traced("add_peer")
+def _add_peer_flow(
+    ssh: Transport,
+    server: str,
+    host: str,
+    name: str,
+    allowed_ips: str,
+    interface: Optional[str],
+    dns: str,
+    reserved: Iterable[str] = (),
+    interactive: bool = True
+) -> Flow[bool]:
+    """在已建立的连接上添加客户端节点（远程操作流程）"""
+    selected = yield from _select_target(ssh, host, interface, interactive)
+    if selected is None:
         return False
+    if not _check_duplicates(ssh, selected, [name]):
+        return False
+    server_config = selected.server_config
 
     # 分配新 IP
     try:
-        new_ip = allocate_ip(server_config["address"], used_ips)
-    except RuntimeError as e:
+        new_ip, = _allocate(ssh, selected, 1, reserved)
+    except (RuntimeError, ValueError) as e:
         print(f"错误: {e}", file=sys.stderr)
         return False
 
@@ -101,60 +307,23 @@ def add_peer(
     print("生成客户端密钥...")
     private_key, public_key = generate_keypair()
     psk = generate_preshared_key()
+    if not _check_duplicates(ssh, selected, public_keys=[public_key]):
+        return False
 
     # 如果未指定 allowed_ips，使用服务端网段
     if not allowed_ips:
         allowed_ips = get_network(server_config["address"])
 
-    # 构建新的 Peer 配置段
-    new_peer_section = f"""
-[Peer]
-# {name}
-PublicKey = {public_key}
-PresharedKey = {psk}
-AllowedIPs = {new_ip.split('/')[0]}/32
-"""
-
     # 更新服务端配置
-    updated_config = config_content.rstrip() + "\n" + new_peer_section
-    print("更新服务端配置...")
-    success, msg = ssh.write_remote_file(config_path, updated_config)
-    if not success:
-        print(f"写入配置失败: {msg}", file=sys.stderr)
+    peer = build_peer(name, public_key, psk, new_ip)
+    updated = yield from _update_server(ssh, selected, [peer])
+    if not updated:
         return False
 
-    # 热重载（不断线）
-    print("热重载配置...")
-    # 使用临时文件避免进程替换问题
-    reload_cmd = (
-        f"wg-quick strip {selected_interface} > /tmp/{selected_interface}_strip.conf && "
-        f"wg syncconf {selected_interface} /tmp/{selected_interface}_strip.conf && "
-        f"rm -f /tmp/{selected_interface}_strip.conf"
-    )
-    success, msg = ssh.run_command(reload_cmd)
-    if not success:
-        print(f"警告: 热重载失败，尝试重启服务...", file=sys.stderr)
-        success, msg = ssh.run_command(f"systemctl restart wg-quick@{selected_interface}")
-        if not success:
-            print(f"重启服务失败: {msg}", file=sys.stderr)
-            return False
-
-    # 客户端地址使用 /24 网段
-    client_address = new_ip.replace('/32', '/24')
-
     # 生成客户端配置
-    dns_line = f"DNS = {dns}\n" if dns else ""
-    client_config = f"""[Interface]
-Address = {client_address}
-PrivateKey = {private_key}
-{dns_line}
-[Peer]
-PublicKey = {server_config['public_key']}
-PresharedKey = {psk}
-AllowedIPs = {allowed_ips}
-Endpoint = {server}:{server_config['port']}
-PersistentKeepalive = 25
-"""
+    client_config = build_client_config(
+        new_ip, private_key, psk, server_config, server, allowed_ips, dns
+    )
 
     # 输出结果
     print()
@@ -165,3 +334,146 @@ PersistentKeepalive = 25
     print(client_config)
 
     return True
+
+
+def add_peers(
+    host: str,
+    peers: list[dict],
+    output_dir: str,
+    interface: Optional[str] = None,
+    ssh_port: int = 22,
+    key_file: Optional[str] = None,
+    allowed_ips: str = "",
+    dns: str = "",
+    reserved: Iterable[str] = (),
+    qr_formats: Iterable[str] = (),
+    workers: Optional[int] = None
+) -> bool:
+    """批量添加客户端节点
+
+    一次扫描、一次分配全部 IP、一次写入服务端配置并只热重载一次，
+    客户端配置写入 output_dir/<name>.conf（可同时生成二维码，见 export.export_clients）。
+
+    Args:
+        host: 服务器地址 (user@host 格式)
+        peers: 客户端列表，每项包含 name，可选 allowed_ips、dns
+        output_dir: 客户端配置输出目录，以 .zip 结尾时写入 zip 归档
+        interface: 指定接口名称（留空则自动检测/询问）
+        ssh_port: SSH 端口，默认 22
+        key_file: SSH 私钥文件路径
+        allowed_ips: 未单独指定时的客户端 AllowedIPs（留空使用服务端网段）
+        dns: 未单独指定时的 DNS 服务器（留空则不设置）
+        reserved: 不参与分配的地址或范围（地址、CIDR 或 "起始-结束"）
+        qr_formats: 同时生成的二维码格式（png / svg）
+        workers: 渲染客户端配置和二维码的进程数，默认 CPU 核数
+
+    Returns:
+        是否成功
+    """
+    if not _check_peer_list(peers):
+        return False
+
+    ssh, server = connect_ssh(host, ssh_port, key_file)
+    if ssh is None:
+        return False
+
+    with ssh:
+        return run_flow(ssh, _add_peers_flow(
+            ssh, server, host, peers, output_dir, interface, allowed_ips, dns, reserved,
+            qr_formats=qr_formats, workers=workers
+        ))
+
+
+def _check_peer_list(peers: list[dict]) -> bool:
+    """检查批量添加的客户端列表：非空、每项都有 name 且名称不重复"""
+    names = [str(p.get("name", "")).strip() for p in peers]
+    if not peers:
+        print("错误: 客户端列表为空", file=sys.stderr)
+        return False
+    if not all(names):
+        print("错误: 客户端列表中存在缺少 name 的条目", file=sys.stderr)
+        return False
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        print(f"错误: 客户端名称重复: {', '.join(duplicates)}", file=sys.stderr)
+        return False
+    return True
+
+
+@trace.traced("add_peers")
+def _add_peers_flow(
+    ssh: Transport,
+    server: str,
+    host: str,
+    peers: list[dict],
+    output_dir: str,
+    interface: Optional[str],
+    allowed_ips: str,
+    dns: str,
+    reserved: Iterable[str] = (),
+    interactive: bool = True,
+    qr_formats: Iterable[str] = (),
+    workers: Optional[int] = None
+) -> Flow[bool]:
+    """在已建立的连接上批量添加客户端节点（远程操作流程）"""
+    start = time.monotonic()
+    try:
+        check_qr_formats(qr_formats)
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return False
+
+    selected = yield from _select_target(ssh, host, interface, interactive)
+    if selected is None:
+        return False
+    if not _check_duplicates(ssh, selected, [str(p["name"]).strip() for p in peers]):
+        return False
+    server_config = selected.server_config
+
+    # 一次分配全部 IP
+    try:
+        new_ips = _allocate(ssh, selected, len(peers), reserved)
+    except (RuntimeError, ValueError) as e:
+        print(f"错误: {e}（需要 {len(peers)} 个地址）", file=sys.stderr)
+        return False
+
+    print(f"生成 {len(peers)} 个客户端密钥...")
+    keys = generate_keypairs(len(peers))
+    if not _check_duplicates(ssh, selected, public_keys=[public_key for _, public_key, _ in keys]):
+        return False
+
+    default_allowed_ips = allowed_ips or get_network(server_config["address"])
+    new_peers = []
+    clients = []
+    for peer, ip, (private_key, public_key, psk) in zip(peers, new_ips, keys):
+        name = str(peer["name"]).strip()
+        new_peers.append(build_peer(name, public_key, psk, ip))
+        clients.append(ClientExport(
+            name, ip, private_key, psk,
+            peer.get("allowed_ips") or default_allowed_ips,
+            peer.get("dns") or dns
+        ))
+
+    # 一次写入服务端配置并热重载
+    updated = yield from _update_server(ssh, selected, new_peers)
+    if not updated:
+        return False
+
+    # 写入客户端配置（和二维码）
+    print("导出客户端配置...")
+    try:
+        export_clients(clients, server_config, server, output_dir, qr_formats, workers)
+    except OSError as e:
+        print(f"错误: 写入客户端配置失败: {e}", file=sys.stderr)
+        print("服务端已添加这些客户端，但客户端私钥未能保存，请删除后重新添加", file=sys.stderr)
+        return False
+
+    elapsed = time.monotonic() - start
+    print()
+    print(f"已添加 {len(clients)} 个客户端到 {selected.name}!")
+    for client in clients:
+        print(f"  - {client.name}: {client.ip}")
+    print(f"客户端配置已写入: {output_dir}")
+    print(f"用时 {elapsed:.2f}s（{len(clients) / max(elapsed, 1e-6):.1f} 个/秒）")
+
+    return True
@@ -0,0 +1,600 @@
+"""基于 asyncio 的远程管理接口
+
+AsyncSSHClient 用 asyncio.create_subprocess_exec 调用系统 ssh，
+同一个事件循环中可以并发管理成百上千台服务器，而不需要为每台服务器占用一个线程。
+
+各操作与同步版本共用同一套远程操作流程（见 transport.Flow），
+执行的远程命令、往返次数和返回值与同步版本一致。异步版本不会询问用户：
+服务器上有多个接口时必须指定 interface，deploy_server 总是非交互模式。
+流程中的本地计算和磁盘读写（生成密钥、导出客户端配置、缓存、索引和状态库）
+在线程池中执行，不会阻塞事件循环。host 为 local 或 local:<根目录> 时
+使用 AsyncLocalTransport 在本机执行，同 session.connect_ssh。
+
+取消（task.cancel()）和超时（asyncio.wait_for）随时生效：
+正在执行的 ssh 进程会被终止，复用会话在 async with 退出时关闭。
+
+示例::
+
+    results = await asyncio.gather(*(
+        aio.add_peer(host, "alice", interface="wg0") for host in hosts
+    ))
+"""
+
+import os
+import sys
+import shutil
+import signal
+import shlex
+import socket
+import asyncio
+import tempfile
+import threading
+import subprocess
+import contextvars
+import weakref
+from typing import Iterable, Optional, Union
+
+from . import trace
+from .parser import InterfaceConfig, scan_interfaces_flow
+from .session import attach_state
+from .ssh import CONNECT_TIMEOUT, BaseSSHClient, SSHConfig, parse_host
+from .transport import (
+    BatchResult, Flow, LocalTransport, RemoteBatch, T, parse_local_target
+)
+from .add_peer import _add_peer_flow, _add_peers_flow, _check_peer_list
+from .remove_peer import (
+    _check_selection, _list_peers_flow, _remove_peer_flow, _remove_peers_flow
+)
+from .deploy import _deploy_server_flow
+
+
+def _kill_master(master: asyncio.subprocess.Process, control_dir: str) -> None:
+    """强制终止 ControlMaster 进程并清理控制目录（可在事件循环外调用）"""
+    if master.returncode is None:
+        try:
+            os.kill(master.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    shutil.rmtree(control_dir, ignore_errors=True)
+
+
+async def _terminate(process: asyncio.subprocess.Process, timeout: float = 5) -> None:
+    """终止子进程并等待退出"""
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+        await asyncio.wait_for(process.wait(), timeout)
+    except ProcessLookupError:
+        pass
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+def _kill(process: asyncio.subprocess.Process, group: bool) -> None:
+    """强制终止子进程，group 为 True 时终止其所在的整个进程组"""
+    if process.returncode is not None:
+        return
+    try:
+        if group:
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (OSError, ProcessLookupError):
+        pass
+
+
+async def _run(
+    cmd: list[str],
+    input: Optional[str],
+    timeout: float,
+    env: Optional[dict[str, str]] = None,
+    new_session: bool = False
+) -> subprocess.CompletedProcess:
+    """运行本地子进程，超时抛出 subprocess.TimeoutExpired
+
+    超时或被取消时终止子进程；new_session 为 True 时子进程在独立的进程组中运行，
+    终止时连同其子进程一起终止（见 transport.Transport._run_process）。
+    """
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        # 不继承本地 stdin，避免 ssh 读取终端或管道导致阻塞（等同 ssh -n）
+        stdin=subprocess.DEVNULL if input is None else subprocess.PIPE,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        env=env, start_new_session=new_session
+    )
+    data = None if input is None else input.encode()
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(data), timeout)
+    except asyncio.TimeoutError:
+        if new_session:
+            _kill(process, group=True)
+            await process.wait()
+        else:
+            await _terminate(process, timeout=0)
+        raise subprocess.TimeoutExpired(cmd, timeout) from None
+    except BaseException:
+        _kill(process, group=new_session)
+        raise
+    return subprocess.CompletedProcess(
+        cmd, process.returncode,
+        stdout.decode(errors="replace"), stderr.decode(errors="replace")
+    )
+
+
+class _AsyncCommands:
+    """异步传输共用的方法：在协程 _exec 之上实现命令执行、文件读写和批量执行"""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+        self._report()
+
+    def _close_now(self) -> None:
+        """close 为协程，abort() 中不能调用；没有需要关闭的连接时不做任何操作"""
+
+    async def run_command(self, command: str, timeout: int = 30) -> tuple[bool, str]:
+        """执行远程命令"""
+        try:
+            result = await self._exec(command, timeout=timeout)
+            if result.returncode == 0:
+                return True, result.stdout.strip()
+            return False, result.stderr.strip() or result.stdout.strip()
+        except subprocess.TimeoutExpired:
+            return False, "命令执行超时"
+        except Exception as e:
+            return False, str(e)
+
+    async def read_remote_file(self, remote_path: str) -> tuple[bool, str]:
+        """读取远程文件内容"""
+        return await self.run_command(f"cat {shlex.quote(remote_path)}")
+
+    async def write_remote_file(self, remote_path: str, content: str) -> tuple[bool, str]:
+        """原子写入远程文件，见 RemoteBatch.write_file"""
+        success, results = await self.batch().write_file(remote_path, content).execute()
+        if success:
+            return True, "写入成功"
+        return False, results[-1].output if results else ""
+
+    def batch(self) -> "AsyncRemoteBatch":
+        """创建批量执行队列，多个命令和文件写入在一次往返中完成"""
+        return AsyncRemoteBatch(self)
+
+
+class AsyncSSHClient(_AsyncCommands, BaseSSHClient):
+    """异步 SSH 客户端 - 使用系统 ssh 命令
+
+    与 SSHClient 相同，默认通过 ControlMaster 维持一个多路复用会话；
+    test_connection、close、run_command 等方法均为协程。
+    应使用 async with 确保会话关闭，对象被回收时也会终止主连接进程。
+    """
+
+    def __init__(self, config: SSHConfig, multiplex: bool = True):
+        super().__init__(config, multiplex)
+        self._master: Optional[asyncio.subprocess.Process] = None
+
+    @property
+    def multiplexed(self) -> bool:
+        """复用会话是否可用"""
+        return self._master is not None and self._master.returncode is None
+
+    async def _start_master(self) -> tuple[bool, str]:
+        """启动 ControlMaster 进程，等待控制套接字就绪"""
+        self._control_dir = tempfile.mkdtemp(prefix="wg-manager-ssh-")
+        control_path = self.control_path
+        log_path = os.path.join(self._control_dir, "master.log")
+
+        with open(log_path, "wb") as log:
+            master = await asyncio.create_subprocess_exec(
+                *self._master_cmd(),
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=log
+            )
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + CONNECT_TIMEOUT
+        try:
+            while loop.time() < deadline:
+                # 控制套接字在认证完成后才会创建
+                if os.path.exists(control_path):
+                    self._master = master
+                    self._finalizer = weakref.finalize(
+                        self, _kill_master, master, self._control_dir
+                    )
+                    return True, "连接成功"
+                if master.returncode is not None:
+                    break
+                await asyncio.sleep(0.02)
+        except BaseException:
+            # 连接过程中被取消
+            _kill_master(master, self._control_dir)
+            self._control_dir = None
+            raise
+
+        timed_out = master.returncode is None
+        await _terminate(master)
+        with open(log_path, "rb") as log:
+            error = log.read().decode(errors="replace").strip()
+        shutil.rmtree(self._control_dir, ignore_errors=True)
+        self._control_dir = None
+        if timed_out:
+            return False, "连接超时"
+        return False, error or "连接失败"
+
+    async def test_connection(self) -> tuple[bool, str]:
+        """测试 SSH 连接（启用复用时同时建立持久会话）"""
+        with trace.span("ssh.connect"):
+            return await self._test_connection()
+
+    async def _test_connection(self) -> tuple[bool, str]:
+        self.round_trips += 1
+        self.handshakes += 1
+
+        if self.multiplex and not self.multiplexed:
+            try:
+                success, msg = await self._start_master()
+            except Exception as e:
+                success, msg = False, str(e)
+            if success:
+                self._connected = True
+                return True, msg
+            # 复用会话不可用（如 ssh 不支持 ControlMaster），退回逐条连接
+            self.multiplex = False
+
+        try:
+            result = await _run(self._build_ssh_cmd(["echo", "ok"]), None, CONNECT_TIMEOUT)
+            if result.returncode == 0:
+                self._connected = True
+                return True, "连接成功"
+            return False, result.stderr.strip() or "连接失败"
+        except subprocess.TimeoutExpired:
+            return False, "连接超时"
+        except Exception as e:
+            return False, str(e)
+
+    async def close(self) -> None:
+        """关闭复用会话"""
+        if self._master is not None:
+            try:
+                exit_master = await asyncio.create_subprocess_exec(
+                    *self._exit_master_cmd(),
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                )
+                try:
+                    await asyncio.wait_for(exit_master.wait(), 5)
+                except asyncio.TimeoutError:
+                    await _terminate(exit_master, timeout=0)
+                await _terminate(self._master)
+            except Exception:
+                pass
+            finally:
+                # 被取消时同样保证主连接进程终止、控制目录删除
+                self._finalizer()
+                self._master = None
+                self._control_dir = None
+        self._connected = False
+
+    def _close_now(self) -> None:
+        """abort() 中强制终止主连接进程并清理控制目录（可在事件循环外调用）"""
+        if self._master is not None:
+            self._finalizer()
+            self._master = None
+            self._control_dir = None
+        self._connected = False
+
+    async def _exec(
+        self, command: str, input: Optional[str] = None, timeout: int = 30
+    ) -> subprocess.CompletedProcess:
+        """执行一次远程调用（一个往返），超时抛出 subprocess.TimeoutExpired"""
+        cmd = self._build_ssh_cmd([command])
+        self._count_round_trip()
+        with trace.span("ssh.exec") as span:
+            self._trace_exec(span, command, input)
+            result = await _run(cmd, input, timeout)
+            self._trace_result(span, result)
+            return result
+
+
+class AsyncLocalTransport(_AsyncCommands, LocalTransport):
+    """异步本地传输：在本机直接执行命令和读写文件，参数同 LocalTransport
+
+    test_connection、close、run_command 等方法均为协程，文件读写在线程池中执行。
+    """
+
+    async def test_connection(self) -> tuple[bool, str]:
+        """检查根目录是否存在"""
+        return LocalTransport.test_connection(self)
+
+    async def close(self) -> None:
+        pass
+
+    async def _exec(
+        self, command: str, input: Optional[str] = None, timeout: int = 30
+    ) -> subprocess.CompletedProcess:
+        """用本机 sh 执行命令，超时抛出 subprocess.TimeoutExpired"""
+        self.round_trips += 1
+        with trace.span("local.exec") as span:
+            self._trace_exec(span, command, input)
+            result = await _run(["sh", "-c", command], input, timeout, self.env, new_session=True)
+            self._trace_result(span, result)
+            return result
+
+    async def read_remote_file(self, remote_path: str) -> tuple[bool, str]:
+        """直接读取文件内容"""
+        return await asyncio.to_thread(LocalTransport.read_remote_file, self, remote_path)
+
+    async def write_remote_file(self, remote_path: str, content: str) -> tuple[bool, str]:
+        """原子写入文件，见 LocalTransport.write_remote_file"""
+        return await asyncio.to_thread(
+            LocalTransport.write_remote_file, self, remote_path, content
+        )
+
+
+# 异步传输：aio 中的流程可由任意一种驱动
+AsyncTransport = Union[AsyncSSHClient, AsyncLocalTransport]
+
+
+class AsyncRemoteBatch(RemoteBatch):
+    """异步的远程批量执行队列，execute 为协程，其余同 RemoteBatch"""
+
+    _client: AsyncTransport
+
+    async def execute(
+        self, stop_on_error: bool = True, timeout: int = 60
+    ) -> tuple[bool, list[BatchResult]]:
+        """在一次往返中执行所有步骤，参数和返回值同 RemoteBatch.execute"""
+        if not self.steps:
+            return True, []
+
+        with trace.span("ssh.batch") as span:
+            self._trace_steps(span)
+            token, script = self._prepare(stop_on_error)
+            try:
+                result = await self._client._exec("sh -s", input=script, timeout=timeout)
+            except Exception as e:
+                return self._failed(e)
+            return self._trace_outcome(span, self._collect(result, token))
+
+
+class _FlowSteps:
+    """在线程池中逐步推进远程操作流程
+
+    各步骤在同一个 contextvars 上下文中执行，流程中的 Span 因此能正确嵌套。
+    流程被取消时若仍有步骤在线程中执行，由该步骤执行完后关闭流程。
+    """
+
+    def __init__(self, flow: Flow):
+        self.flow = flow
+        self.context = contextvars.copy_context()
+        self._lock = threading.Lock()
+        self._running = False
+        self._closed = False
+
+    def advance(self, response: object) -> tuple[bool, object]:
+        """把上一次远程调用的结果交给流程（在线程池中调用）
+
+        Returns:
+            (流程是否已结束, 下一个请求或流程的返回值)
+        """
+        with self._lock:
+            if self._closed:
+                return True, None
+            self._running = True
+        try:
+            return False, self.context.run(self.flow.send, response)
+        except StopIteration as stop:
+            return True, stop.value
+        finally:
+            with self._lock:
+                self._running = False
+                closed = self._closed
+            if closed:
+                self.context.run(self.flow.close)
+
+    def close(self) -> None:
+        """关闭流程；步骤仍在线程中执行时由其执行完后关闭"""
+        with self._lock:
+            self._closed = True
+            if self._running:
+                return
+        self.context.run(self.flow.close)
+
+
+async def run_flow(ssh: AsyncTransport, flow: Flow[T]) -> T:
+    """用异步传输执行远程操作流程，见 transport.run_flow
+
+    两次远程调用之间的流程代码（生成密钥、导出客户端配置、读写缓存和状态库等）
+    在线程池中执行；远程调用在事件循环中执行，仍记录为流程 Span 的子 Span。
+    """
+    loop = asyncio.get_running_loop()
+    steps = _FlowSteps(flow)
+    try:
+        done, request = await loop.run_in_executor(None, steps.advance, None)
+        while not done:
+            with trace.within(steps.context.run(trace.current)):
+                if isinstance(request, RemoteBatch):
+                    response = await request.execute()
+                else:
+                    response = await ssh.run_command(request.command, timeout=request.timeout)
+            done, request = await loop.run_in_executor(None, steps.advance, response)
+        return request
+    finally:
+        steps.close()
+
+
+async def connect_ssh(
+    host: str,
+    ssh_port: int = 22,
+    key_file: Optional[str] = None,
+    multiplex: bool = True,
+    use_cache: Optional[bool] = None
+) -> tuple[Optional[AsyncTransport], str]:
+    """创建并测试异步连接，参数和返回值同 session.connect_ssh
+
+    host 为 local 或 local:<根目录> 时返回 AsyncLocalTransport。
+    调用方使用完毕后应 await close()（或使用 async with 语句）关闭会话
+    """
+    root = parse_local_target(host)
+    if root is not None:
+        local = AsyncLocalTransport(root)
+        success, msg = await local.test_connection()
+        if not success:
+            print(f"本地执行失败: {msg}", file=sys.stderr)
+            return None, host
+        # 打开缓存、索引和状态库需要读写磁盘，在线程池中执行
+        await asyncio.to_thread(attach_state, local, use_cache)
+        return local, await asyncio.to_thread(socket.getfqdn)
+
+    user, server = parse_host(host)
+
+    ssh_config = SSHConfig(host=server, port=ssh_port, user=user, key_file=key_file)
+    ssh = AsyncSSHClient(ssh_config, multiplex=multiplex)
+    await asyncio.to_thread(attach_state, ssh, use_cache)
+
+    print(f"连接到 {user}@{server}...")
+    try:
+        success, msg = await ssh.test_connection()
+    except BaseException:
+        await ssh.close()
+        raise
+    if not success:
+        await ssh.close()
+        print(f"SSH 连接失败: {msg}", file=sys.stderr)
+        return None, server
+
+    return ssh, server
+
+
+async def scan_interfaces(
+    ssh: AsyncTransport,
+    wg_dir: Optional[str] = None,
+    use_cache: bool = True
+) -> list[InterfaceConfig]:
+    """扫描服务器上的 WireGuard 配置文件，见 parser.scan_interfaces"""
+    return await run_flow(ssh, scan_interfaces_flow(ssh, wg_dir, use_cache))
+
+
+async def add_peer(
+    host: str,
+    name: str,
+    allowed_ips: str = "",
+    interface: Optional[str] = None,
+    ssh_port: int = 22,
+    key_file: Optional[str] = None,
+    dns: str = "",
+    reserved: Iterable[str] = ()
+) -> bool:
+    """添加客户端节点，参数和返回值同 add_peer.add_peer"""
+    ssh, server = await connect_ssh(host, ssh_port, key_file)
+    if ssh is None:
+        return False
+
+    async with ssh:
+        return await run_flow(ssh, _add_peer_flow(
+            ssh, server, host, name, allowed_ips, interface, dns, reserved, interactive=False
+        ))
+
+
+async def add_peers(
+    host: str,
+    peers: list[dict],
+    output_dir: str,
+    interface: Optional[str] = None,
+    ssh_port: int = 22,
+    key_file: Optional[str] = None,
+    allowed_ips: str = "",
+    dns: str = "",
+    reserved: Iterable[str] = (),
+    qr_formats: Iterable[str] = (),
+    workers: Optional[int] = None
+) -> bool:
+    """批量添加客户端节点，参数和返回值同 add_peer.add_peers"""
+    if not _check_peer_list(peers):
+        return False
+
+    ssh, server = await connect_ssh(host, ssh_port, key_file)
+    if ssh is None:
+        return False
+
+    async with ssh:
+        return await run_flow(ssh, _add_peers_flow(
+            ssh, server, host, peers, output_dir, interface, allowed_ips, dns, reserved,
+            interactive=False, qr_formats=qr_formats, workers=workers
+        ))
+
+
+async def remove_peer(
+    host: str,
+    name: str,
+    interface: Optional[str] = None,
+    ssh_port: int = 22,
+    key_file: Optional[str] = None
+) -> bool:
+    """删除客户端节点，参数和返回值同 remove_peer.remove_peer"""
+    ssh, _ = await connect_ssh(host, ssh_port, key_file)
+    if ssh is None:
+        return False
+
+    async with ssh:
+        return await run_flow(ssh, _remove_peer_flow(ssh, name, interface, interactive=False))
+
+
+async def remove_peers(
+    host: str,
+    names: Optional[list[str]] = None,
+    public_keys: Optional[list[str]] = None,
+    pattern: Optional[str] = None,
+    regex: bool = False,
+    interface: Optional[str] = None,
+    ssh_port: int = 22,
+    key_file: Optional[str] = None
+) -> bool:
+    """批量删除客户端节点，参数和返回值同 remove_peer.remove_peers"""
+    if not _check_selection(names, public_keys, pattern, regex):
+        return False
+
+    ssh, _ = await connect_ssh(host, ssh_port, key_file)
+    if ssh is None:
+        return False
+
+    async with ssh:
+        return await run_flow(ssh, _remove_peers_flow(
+            ssh, names, public_keys, pattern, regex, interface, interactive=False
+        ))
+
+
+async def list_peers(
+    host: str,
+    interface: Optional[str] = None,
+    ssh_port: int = 22,
+    key_file: Optional[str] = None
+) -> bool:
+    """列出所有客户端节点，参数和返回值同 remove_peer.list_peers"""
+    ssh, _ = await connect_ssh(host, ssh_port, key_file)
+    if ssh is None:
+        return False
+
+    async with ssh:
+        return await run_flow(ssh, _list_peers_flow(ssh, interface))
+
+
+async def deploy_server(
+    host: str,
+    address: Optional[str] = None,
+    port: Optional[int] = None,
+    interface: Optional[str] = None,
+    ssh_port: int = 22,
+    key_file: Optional[str] = None
+) -> bool:
+    """在服务器上部署新的 WireGuard 接口（非交互模式），参数同 deploy.deploy_server"""
+    ssh, server = await connect_ssh(host, ssh_port, key_file)
+    if ssh is None:
+        return False
+
+    async with ssh:
+        return await run_flow(ssh, _deploy_server_flow(
+            ssh, server, address, port, interface, interactive=False
+        ))
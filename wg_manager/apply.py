@@ -0,0 +1,599 @@
+"""声明式状态应用
+
+状态文件（JSON / YAML）按主机描述接口和客户端::
+
+    defaults:                  # 可选，同主机清单
+      user: root
+    hosts:
+      gw-tokyo-1:
+        host: 1.2.3.4          # 省略时使用 -I 清单中的同名主机，或把名称作为地址
+        endpoint: vpn.example.com   # 可选，导出客户端配置的 Endpoint
+        interfaces:
+          wg0:
+            address: 10.0.0.1/24    # 创建接口时使用
+            port: 51820        # 可选，创建时省略则使用第一个未占用的端口
+            peers:
+              - name: alice         # 未指定公钥时按名称匹配现有客户端
+              - name: bob
+                public_key: xxxx=
+                allowed_ips: 10.0.0.10/32, 192.168.5.0/24
+
+每台主机在一次往返中取回配置文件（带本地缓存的指纹）、运行中的接口及其 peer、
+监听端口和路由（同 deploy 的探测），在本地与现有配置比较，生成有序的计划（创建接口、添加、删除、
+修改 AllowedIPs）；新接口的名称、网段和端口按 deploy 的规则校验（也与同一计划中的
+其他新接口比较），校验失败时不做任何修改。再在一次往返中完成所有配置文件写入
+（按读取时的指纹保护）和运行中接口的更新（按实际运行的 peer 计算最少的 wg set，
+新接口用 wg-quick 启动）。
+多台主机并发执行。
+
+每次成功应用后记录状态的摘要、配置文件指纹和是否删除了多余客户端；
+再次应用未变化的状态时，指纹一致即跳过，不解析配置文件。
+
+未指定公钥的新客户端在本地生成密钥、自动分配地址，客户端配置写入 -o 目录。
+"""
+
+import os
+import sys
+import json
+import hashlib
+import shlex
+import tempfile
+from dataclasses import dataclass, field, replace
+from typing import Optional
+
+from . import trace
+from .cache import cache_enabled, default_cache_dir
+from .crypto import generate_keypair, generate_keypairs
+from .deploy import HostSnapshot, build_interface_config, probe_host
+from .export import ClientExport, export_clients
+from .fleet import DEFAULT_PARALLEL, DEFAULT_HOST_TIMEOUT, run_on_hosts, summarize
+from .inventory import Inventory, InventoryHost, parse_host_entry
+from .ipam import AddressPool, host_prefix
+from .loader import load_data
+from .model import Peer, parse_wg_config
+from .parser import InterfaceConfig, get_network, server_config_from_model
+from .reconcile import InterfacePlan, PeerState, diff_peers, normalize_networks
+from .session import connect_ssh
+from .transport import FINGERPRINT_MISMATCH, Flow, Transport, run_flow
+
+
+@dataclass
+class DesiredPeer:
+    """状态文件中的一个客户端"""
+    name: str
+    # 未指定时按名称匹配现有客户端，没有则生成密钥
+    public_key: str = ""
+    # 服务端 AllowedIPs，未指定时现有客户端保持不变、新客户端自动分配一个地址
+    allowed_ips: list[str] = field(default_factory=list)
+    preshared_key: str = ""
+    # 导出客户端配置时使用
+    dns: str = ""
+
+
+@dataclass
+class DesiredInterface:
+    """状态文件中的一个接口"""
+    name: str
+    address: str = ""
+    # 创建时未指定则使用第一个未占用的端口
+    port: Optional[int] = None
+    dns: str = ""
+    peers: list[DesiredPeer] = field(default_factory=list)
+
+
+@dataclass
+class HostState:
+    """一台主机的目标状态"""
+    host: InventoryHost
+    interfaces: list[DesiredInterface]
+    endpoint: str = ""
+    # 状态内容的摘要，与上次成功应用的记录比较
+    digest: str = ""
+
+
+@dataclass
+class PlanStep:
+    """计划中的一项"""
+    action: str
+    interface: str
+    detail: str
+
+    _MARKS = {"create": "*", "add": "+", "remove": "-", "update": "~"}
+
+    def describe(self) -> str:
+        return f"  {self._MARKS[self.action]} {self.interface} {self.detail}"
+
+
+@dataclass
+class HostPlan:
+    """一台主机的执行计划"""
+    steps: list[PlanStep] = field(default_factory=list)
+    # (路径, 新内容, 读取时的指纹；新建文件为 None)
+    writes: list[tuple[str, str, Optional[str]]] = field(default_factory=list)
+    # 运行中接口的更新 (步骤描述, 命令)
+    live: list[tuple[str, str]] = field(default_factory=list)
+    # 需要导出配置的新客户端，每个接口一项 [(服务端配置, [客户端, ...]), ...]
+    clients: list[tuple[dict, list[ClientExport]]] = field(default_factory=list)
+    # 写入后的接口内容 {接口: (路径, 内容)}
+    contents: dict[str, tuple[str, str]] = field(default_factory=dict)
+
+
+def _split(value) -> list[str]:
+    if isinstance(value, (list, tuple)):
+        value = ",".join(str(v) for v in value)
+    return [v.strip() for v in str(value or "").split(",") if v.strip()]
+
+
+def _parse_peer(entry, where: str) -> DesiredPeer:
+    if isinstance(entry, str):
+        entry = {"name": entry}
+    if not isinstance(entry, dict) or not str(entry.get("name") or "").strip():
+        raise ValueError(f"{where}: 客户端条目缺少 name: {entry!r}")
+    return DesiredPeer(
+        name=str(entry["name"]).strip(),
+        public_key=str(entry.get("public_key") or "").strip(),
+        allowed_ips=_split(entry.get("allowed_ips")),
+        preshared_key=str(entry.get("preshared_key") or "").strip(),
+        dns=str(entry.get("dns") or "").strip(),
+    )
+
+
+def _parse_interface(name: str, entry, where: str) -> DesiredInterface:
+    if entry is None:
+        entry = {}
+    if not isinstance(entry, dict):
+        raise ValueError(f"{where}: 接口 {name} 格式无效")
+    peers = [_parse_peer(p, f"{where} {name}") for p in entry.get("peers") or []]
+    names = [p.name for p in peers]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        raise ValueError(f"{where} {name}: 客户端名称重复: {', '.join(duplicates)}")
+    keys = [p.public_key for p in peers if p.public_key]
+    duplicates = sorted({k for k in keys if keys.count(k) > 1})
+    if duplicates:
+        raise ValueError(f"{where} {name}: 客户端公钥重复: {', '.join(duplicates)}")
+    try:
+        port = int(entry["port"]) if entry.get("port") else None
+    except ValueError:
+        raise ValueError(f"{where} {name}: 端口无效: {entry.get('port')}")
+    return DesiredInterface(
+        name=str(name),
+        address=str(entry.get("address") or "").strip(),
+        port=port,
+        dns=str(entry.get("dns") or "").strip(),
+        peers=peers,
+    )
+
+
+def load_state(path: str, inventory: Optional[Inventory] = None) -> list[HostState]:
+    """加载状态文件
+
+    Args:
+        path: 状态文件路径（.json / .yaml / .yml）
+        inventory: 主机清单，状态中未写 host 的主机按名称在清单中查找
+
+    Raises:
+        ValueError: 文件格式或内容无效
+    """
+    data = load_data(path)
+    if not isinstance(data, dict) or not isinstance(data.get("hosts"), (dict, list)):
+        raise ValueError("状态文件应包含 hosts")
+    defaults = data.get("defaults") or {}
+    raw_hosts = data["hosts"]
+    if isinstance(raw_hosts, dict):
+        entries = list(raw_hosts.items())
+    else:
+        entries = [(None, e) for e in raw_hosts]
+
+    states = []
+    for name, entry in entries:
+        if not isinstance(entry, dict):
+            raise ValueError(f"主机条目格式无效: {entry!r}")
+        name = entry.get("name") or name
+        known = inventory.get(str(name)) if inventory is not None and name else None
+        if known is not None and not entry.get("host"):
+            host = known
+        else:
+            host = parse_host_entry(name, entry, defaults)
+
+        interfaces = entry.get("interfaces") or {}
+        if not isinstance(interfaces, dict):
+            raise ValueError(f"{host.name}: interfaces 应为 {{接口名称: 配置}} 映射")
+        digest = hashlib.sha256(
+            json.dumps([host.host, host.port, entry], sort_keys=True, default=str).encode()
+        ).hexdigest()
+        states.append(HostState(
+            host=host,
+            interfaces=[_parse_interface(n, e, host.name) for n, e in interfaces.items()],
+            endpoint=str(entry.get("endpoint") or "").strip(),
+            digest=digest,
+        ))
+
+    names = [s.host.name for s in states]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        raise ValueError(f"主机名重复: {', '.join(duplicates)}")
+    return states
+
+
+# ----- 应用记录 -----
+def _record_path(host_key: str) -> str:
+    digest = hashlib.sha256(host_key.encode()).hexdigest()
+    return os.path.join(default_cache_dir(), "applied", f"{digest}.json")
+
+
+def _load_record(host_key: str) -> Optional[dict]:
+    try:
+        with open(_record_path(host_key), encoding="utf-8") as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return record if isinstance(record, dict) and record.get("host") == host_key else None
+
+
+def _save_record(host_key: str, digest: str, fingerprints: dict[str, str], prune: bool) -> None:
+    """记录成功应用的状态摘要、配置文件指纹和是否删除了多余客户端（与本地缓存一起可被禁用）"""
+    path = _record_path(host_key)
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"host": host_key, "digest": digest, "fingerprints": fingerprints,
+                       "prune": prune}, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+# ----- 计划 -----
+def _peer_section(name: str, public_key: str, psk: str, allowed_ips: list[str]) -> Peer:
+    return Peer.build([
+        ("PublicKey", public_key),
+        ("PresharedKey", psk),
+        ("AllowedIPs", ", ".join(allowed_ips)),
+    ], comment=name)
+
+
+def _create_interface(host: HostSnapshot, desired: DesiredInterface, generate: bool) -> str:
+    """校验并生成新接口的配置内容，规则同 deploy
+
+    Raises:
+        ValueError: 接口名称、地址或端口无效，或与现有接口（含计划中的新接口）冲突
+    """
+    name = desired.name
+    if not desired.address:
+        raise ValueError(f"接口 {name} 不存在，创建时需要 address")
+    port = desired.port or host.suggest_port()
+    for error in (host.validate_interface(name), host.validate_address(desired.address),
+                  host.validate_port(port)):
+        if error:
+            raise ValueError(f"接口 {name}: {error}")
+
+    # 与现有路由重叠不一定是错误（例如有意覆盖），只提示
+    route = host.route_conflict(desired.address)
+    if route:
+        print(f"警告: 接口 {name} 的网段与现有路由 {route} 重叠", file=sys.stderr)
+
+    private_key = generate_keypair()[0] if generate else ""
+    return build_interface_config(private_key, desired.address, port, host.default_iface or "eth0")
+
+
+def _plan_interface(
+    plan: HostPlan,
+    desired: DesiredInterface,
+    current: Optional[InterfaceConfig],
+    host: HostSnapshot,
+    config_path: str,
+    prune: bool,
+    generate: bool
+) -> tuple[dict[str, PeerState], Optional[list[Peer]], bool]:
+    """比较一个接口，把步骤和新内容加入 plan
+
+    新建的接口记入 host（配置和端口），同一计划中之后的新接口据此校验。
+
+    Returns:
+        (写入前的 peer 状态, 写入后的 peer（无变化时为 None）, 是否新建接口)
+    """
+    name = desired.name
+    if current is None:
+        content = _create_interface(host, desired, generate)
+        created = InterfaceConfig(name, config_path, content)
+        port = created.model.interface.listen_port
+        host.interfaces.append(created)
+        host.ports.add(port)
+        plan.steps.append(PlanStep("create", name, f"创建接口（{desired.address}，端口 {port}）"))
+    else:
+        content = current.content
+        section = current.model.interface
+        if desired.address and section is not None and section.address != desired.address:
+            print(f"警告: 接口 {name} 的地址为 {section.address}，apply 不修改现有接口的地址", file=sys.stderr)
+        if desired.port and section is not None and section.listen_port != desired.port:
+            print(f"警告: 接口 {name} 的端口为 {section.listen_port}，apply 不修改现有接口的端口", file=sys.stderr)
+
+    model = parse_wg_config(content)
+    before = [p for p in model.peers if p.public_key]
+    states = {p.public_key: PeerState.from_peer(p) for p in before}
+    by_key = {p.public_key: p for p in before}
+    by_name: dict[str, Peer] = {}
+    for peer in before:
+        by_name.setdefault(peer.name, peer)
+
+    matched: dict[str, DesiredPeer] = {}
+    adds: list[DesiredPeer] = []
+    for want in desired.peers:
+        peer = by_key.get(want.public_key) if want.public_key else by_name.get(want.name)
+        if peer is None or peer.public_key in matched:
+            adds.append(want)
+            continue
+        matched[peer.public_key] = want
+        if want.allowed_ips and normalize_networks(want.allowed_ips) != normalize_networks(peer.allowed_ips):
+            plan.steps.append(PlanStep(
+                "update", name,
+                f"{want.name}: AllowedIPs {', '.join(peer.allowed_ips) or '(无)'} -> {', '.join(want.allowed_ips)}"
+            ))
+            peer.set("AllowedIPs", ", ".join(want.allowed_ips))
+
+    removed = {p.public_key for p in before if p.public_key not in matched} if prune else set()
+    model.sections = [s for s in model.sections if not (isinstance(s, Peer) and s.public_key in removed)]
+    for peer in before:
+        if peer.public_key in removed:
+            plan.steps.append(PlanStep(
+                "remove", name, f"{peer.name or '(未命名)'}: {', '.join(peer.allowed_ips)}"
+            ))
+
+    # 新客户端：未指定 AllowedIPs 的分配一个地址（避开保留的和新指定的地址）
+    new_peers: list[Peer] = []
+    if adds:
+        section = model.interface
+        address = section.address if section is not None else desired.address
+        used = server_config_from_model(model)[1]
+        used.update(ip for want in adds for ip in want.allowed_ips)
+        need = [want for want in adds if not want.allowed_ips]
+        allocated = iter(
+            host_prefix(str(ip)) for ip in AddressPool(address, used=used).allocate_many(len(need))
+        ) if need else iter(())
+        keyless = [want for want in adds if not want.public_key]
+        keys = iter(generate_keypairs(len(keyless)) if generate and keyless else [])
+
+        clients: list[ClientExport] = []
+        for want in adds:
+            allowed_ips = want.allowed_ips or [next(allocated)]
+            if want.public_key:
+                public_key, psk = want.public_key, want.preshared_key
+            elif generate:
+                private_key, public_key, psk = next(keys)
+                clients.append(ClientExport(
+                    want.name, allowed_ips[0], private_key, psk,
+                    get_network(address), want.dns or desired.dns
+                ))
+            else:
+                public_key, psk = "", ""
+            new_peers.append(_peer_section(want.name, public_key, psk, allowed_ips))
+            note = "，生成密钥" if not want.public_key else ""
+            plan.steps.append(PlanStep("add", name, f"{want.name}: {', '.join(allowed_ips)}{note}"))
+        if clients:
+            server_config = InterfaceConfig(name, config_path, content).server_config
+            plan.clients.append((server_config, clients))
+
+    if current is not None and not any(step.interface == name for step in plan.steps):
+        return states, None, False
+
+    after = [p for p in model.peers if p.public_key] + new_peers
+    new_content = model.serialize().rstrip() + "\n" + "".join("\n" + p.serialize() for p in new_peers)
+    plan.writes.append((config_path, new_content, current.fingerprint or None if current else None))
+    plan.contents[name] = (config_path, new_content)
+    return states, after, current is None
+
+
+def plan_host(
+    state: HostState,
+    host: HostSnapshot,
+    config_path,
+    prune: bool = True,
+    generate: bool = True
+) -> HostPlan:
+    """比较目标状态与现有配置，生成主机的执行计划
+
+    Args:
+        state: 目标状态
+        host: 探测到的服务器状态（deploy.probe_host），不会被修改；
+            带运行中的 peer（dump=True）时按其生成 wg set 命令，否则按原配置文件
+        config_path: 接口名称 -> 配置文件路径（Transport.config_path）
+        prune: 是否删除状态中没有的客户端
+        generate: 是否生成密钥（dry-run 时不生成）
+
+    Raises:
+        ValueError: 状态无效（如新接口缺少地址、名称无效、网段冲突、端口已被占用）
+        RuntimeError: 地址池已满
+    """
+    plan = HostPlan()
+    configured = {iface.name: iface for iface in host.interfaces}
+    # 新建的接口记入副本，之后的新接口与之比较
+    host = replace(host, interfaces=list(host.interfaces), ports=set(host.ports))
+    for desired in state.interfaces:
+        before, after, created = _plan_interface(
+            plan, desired, configured.get(desired.name), host, config_path(desired.name),
+            prune, generate
+        )
+        if created:
+            plan.live.append((f"启用 wg-quick@{desired.name}", f"systemctl enable wg-quick@{desired.name}"))
+            plan.live.append((f"启动 wg-quick@{desired.name}", f"systemctl start wg-quick@{desired.name}"))
+        elif desired.name in host.running and after is not None:
+            # 与运行中接口的实际 peer 比较（同 reconcile），运行状态未知时与原配置文件比较
+            changes = diff_peers(desired.name, after, host.peers.get(desired.name, before))
+            for command in InterfacePlan(desired.name, changes).commands():
+                # 命令可能含预共享密钥，步骤描述中不出现命令本身
+                plan.live.append((f"wg set {desired.name}", command))
+
+    # 按创建、添加、删除、修改的顺序输出
+    order = {"create": 0, "add": 1, "remove": 2, "update": 3}
+    plan.steps.sort(key=lambda step: order[step.action])
+    return plan
+
+
+# ----- 执行 -----
+@trace.traced("apply")
+def _apply_flow(
+    ssh: Transport,
+    state: HostState,
+    server: str,
+    output: Optional[str],
+    prune: bool,
+    dry_run: bool
+) -> Flow[bool]:
+    """应用一台主机的目标状态（远程操作流程），正常情况下检查与执行各一次往返"""
+    host = yield from probe_host(ssh, dump=True)
+    interfaces = host.interfaces
+
+    # 状态和所有配置文件指纹都与上次成功应用时一致：不解析配置，直接跳过。
+    # 上次未删除多余客户端（--no-prune）时，本次要删除则不能跳过
+    fingerprints = {iface.path: iface.fingerprint for iface in interfaces}
+    record = _load_record(ssh.cache_key) if cache_enabled() else None
+    if (record is not None and record.get("digest") == state.digest
+            and (record.get("prune") or not prune)
+            and all(fingerprints.values()) and record.get("fingerprints") == fingerprints):
+        print("状态未变化，配置文件指纹与上次应用一致，跳过")
+        return True
+
+    try:
+        plan = plan_host(state, host, ssh.config_path, prune, generate=not dry_run)
+    except (ValueError, RuntimeError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return False
+
+    if not plan.steps:
+        print("已是目标状态")
+        if not dry_run and cache_enabled() and all(fingerprints.values()):
+            _save_record(ssh.cache_key, state.digest, fingerprints, prune)
+        return True
+
+    print(f"计划（{len(plan.steps)} 项）:")
+    for step in plan.steps:
+        print(step.describe())
+    if dry_run:
+        print("（--dry-run: 未执行）")
+        return True
+    new_clients = sum(len(clients) for _, clients in plan.clients)
+    if new_clients and not output:
+        print(f"错误: {new_clients} 个新客户端需要导出配置，请用 -o 指定输出目录", file=sys.stderr)
+        return False
+
+    # 一次往返：写入全部配置文件，再更新运行中的接口
+    batch = ssh.batch()
+    batch.run(f"mkdir -p {shlex.quote(ssh.wg_dir)}", check=False)
+    for path, content, fingerprint in plan.writes:
+        batch.write_file(path, content, mode="600" if fingerprint is None else None,
+                         fingerprint=fingerprint)
+    for description, command in plan.live:
+        batch.run(command, check=False, description=description)
+    _, results = yield batch
+
+    writes = results[1:1 + len(plan.writes)]
+    if len(writes) < len(plan.writes) or not all(r.success for r in writes):
+        # 写入按顺序执行，遇到失败即停止：失败的是最后一个结果对应的文件
+        path = plan.writes[len(writes) - 1][0] if writes else None
+        failed = writes[-1] if writes else (results[-1] if results else None)
+        if path is not None and failed.returncode == FINGERPRINT_MISMATCH:
+            print(f"错误: {path} 在读取后已被修改，未写入，请重新执行", file=sys.stderr)
+        else:
+            print(f"写入配置失败: {failed.output if failed else ''}", file=sys.stderr)
+        if any(r.success for r in writes):
+            print("部分配置文件已写入，请重新执行 apply", file=sys.stderr)
+        return False
+
+    written = {}
+    for (path, content, _), result in zip(plan.writes, writes):
+        written[path] = result.output.strip().splitlines()[-1] if result.output.strip() else ""
+        if ssh.cache is not None and written[path]:
+            ssh.cache.put(ssh.cache_key, path, written[path], content)
+    print(f"配置文件: 已写入 {len(plan.writes)} 个")
+
+    # 配置文件已写入：更新客户端索引和本地状态库
+    updated = [InterfaceConfig(name, path, content, written.get(path, ""))
+               for name, (path, content) in plan.contents.items()]
+    if ssh.index is not None:
+        unchanged = [iface for iface in interfaces if iface.name not in plan.contents]
+        ssh.index.update_host(ssh.cache_key, unchanged + updated)
+    if ssh.store is not None:
+        ssh.store.record_interfaces(ssh.cache_key, updated)
+
+    success = True
+    if plan.clients:
+        directory = os.path.join(output, state.host.name)
+        print("导出客户端配置...")
+        try:
+            # 每个接口一次导出；共用文件名集合，不同接口的同名客户端不会互相覆盖
+            used: set[str] = set()
+            for server_config, clients in plan.clients:
+                export_clients(clients, server_config, state.endpoint or server, directory, used=used)
+            print(f"客户端配置已写入: {directory}")
+        except OSError as e:
+            print(f"错误: 写入客户端配置失败: {e}", file=sys.stderr)
+            print("服务端已添加这些客户端，但客户端私钥未能保存，请删除后重新添加", file=sys.stderr)
+            success = False
+
+    live = results[1 + len(plan.writes):]
+    failed = [r for r in live if not r.success]
+    for result in failed:
+        print(f"警告: {result.step} 失败: {result.output}", file=sys.stderr)
+    if failed:
+        print("运行中的接口可能与配置文件不一致，可使用 wg-manager reconcile 修正", file=sys.stderr)
+        return False
+    if plan.live:
+        print(f"运行中的接口: 已更新（{len(plan.live)} 条命令，未重载现有接口）")
+
+    fingerprints.update(written)
+    if success and cache_enabled() and all(fingerprints.values()):
+        _save_record(ssh.cache_key, state.digest, fingerprints, prune)
+    return success
+
+
+def apply_host(
+    state: HostState,
+    output: Optional[str] = None,
+    prune: bool = True,
+    dry_run: bool = False
+) -> bool:
+    """应用一台主机的目标状态，参数见 apply_state"""
+    host = state.host
+    ssh, server = connect_ssh(host.host, host.port, host.key_file)
+    if ssh is None:
+        return False
+    with ssh:
+        return run_flow(ssh, _apply_flow(ssh, state, server, output, prune, dry_run))
+
+
+def apply_state(
+    states: list[HostState],
+    output: Optional[str] = None,
+    prune: bool = True,
+    dry_run: bool = False,
+    parallel: int = DEFAULT_PARALLEL,
+    timeout: float = DEFAULT_HOST_TIMEOUT
+) -> bool:
+    """并发应用多台主机的目标状态
+
+    Args:
+        states: load_state 的返回值
+        output: 新客户端配置的输出目录（每台主机一个子目录）
+        prune: 是否删除状态中没有的客户端
+        dry_run: 只输出计划，不执行
+        parallel: 最大并发数
+        timeout: 单台主机超时（秒）
+
+    Returns:
+        是否全部成功
+    """
+    if not states:
+        print("状态文件中没有主机", file=sys.stderr)
+        return False
+    action = "检查" if dry_run else "应用"
+    print(f"{action} {len(states)} 台主机的目标状态（并发 {parallel}）...\n")
+    by_name = {state.host.name: state for state in states}
+    results = run_on_hosts(
+        [state.host for state in states],
+        lambda h: apply_host(by_name[h.name], output, prune, dry_run),
+        parallel, timeout
+    )
+    print(summarize(results))
+    return all(r.success for r in results)
@@ -0,0 +1,184 @@
+"""远程配置文件本地缓存
+
+按 (主机, 远程路径) 保存最近一次取回的配置内容及其远程指纹
+（mtime:size:sha256）。扫描时把已知指纹发给服务器，
+只有指纹变化的文件才会重新传输。
+
+缓存内容包含服务端私钥，缓存目录权限为 0700，文件权限为 0600。
+缓存目录默认为 $WG_MANAGER_CACHE_DIR，其次 $XDG_CACHE_HOME/wg-manager/configs，
+再次 ~/.cache/wg-manager/configs。
+
+设置环境变量 WG_MANAGER_NO_CACHE=1（或调用 set_cache_enabled(False)）可禁用缓存。
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+from typing import Optional
+
+
+# 缓存总大小上限（字节），超出后按最近使用时间淘汰
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+_cache_enabled = not os.environ.get("WG_MANAGER_NO_CACHE")
+
+
+def set_cache_enabled(enabled: bool) -> None:
+    """启用或禁用远程配置文件本地缓存（影响之后建立的连接）"""
+    global _cache_enabled
+    _cache_enabled = enabled
+
+
+def cache_enabled() -> bool:
+    return _cache_enabled
+
+
+def default_cache_dir() -> str:
+    """默认缓存目录"""
+    if os.environ.get("WG_MANAGER_CACHE_DIR"):
+        return os.environ["WG_MANAGER_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "wg-manager", "configs")
+
+
+class ConfigCache:
+    """远程配置文件本地缓存
+
+    Args:
+        directory: 缓存目录，默认 default_cache_dir()
+        max_bytes: 缓存总大小上限（字节）
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # 缓存目录总大小的估计值，首次写入时扫描目录得到，之后按写入累加
+        self._size: Optional[int] = None
+
+    def _entry_path(self, host: str, remote_path: str) -> str:
+        digest = hashlib.sha256(f"{host}\0{remote_path}".encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def _load(self, host: str, remote_path: str) -> Optional[dict]:
+        try:
+            with open(self._entry_path(host, remote_path), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("host") != host or entry.get("path") != remote_path:
+            return None
+        return entry
+
+    def fingerprint(self, host: str, remote_path: str) -> Optional[str]:
+        """已缓存内容的远程指纹，未缓存时返回 None"""
+        entry = self._load(host, remote_path)
+        return entry["fingerprint"] if entry else None
+
+    def get(self, host: str, remote_path: str, fingerprint: str) -> Optional[str]:
+        """指纹一致时返回缓存内容，否则返回 None"""
+        entry = self._load(host, remote_path)
+        if entry is None or entry.get("fingerprint") != fingerprint:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            # 刷新 mtime，作为 LRU 淘汰依据
+            os.utime(self._entry_path(host, remote_path))
+        except OSError:
+            pass
+        return entry["content"]
+
+    def put(self, host: str, remote_path: str, fingerprint: str, content: str) -> None:
+        """写入缓存（原子替换），总大小超过上限时淘汰旧条目"""
+        entry_path = self._entry_path(host, remote_path)
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({
+                    "host": host,
+                    "path": remote_path,
+                    "fingerprint": fingerprint,
+                    "content": content,
+                }, f)
+            size = os.path.getsize(tmp)
+            try:
+                size -= os.path.getsize(entry_path)
+            except OSError:
+                pass
+            os.replace(tmp, entry_path)
+        except OSError:
+            return
+        if self._size is None:
+            self.evict()
+        else:
+            self._size += size
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def put_listing(self, host: str, directory: str, paths: list[str]) -> None:
+        """记录目录扫描到的文件路径，供下次扫描时提供已知指纹"""
+        self.put(host, directory.rstrip("/") + "/", "", "\n".join(paths))
+
+    def known_fingerprints(self, host: str, directory: str) -> list[str]:
+        """上次扫描目录时已缓存文件的指纹列表"""
+        entry = self._load(host, directory.rstrip("/") + "/")
+        if entry is None or not entry["content"]:
+            return []
+        fingerprints = []
+        for path in entry["content"].split("\n"):
+            fingerprint = self.fingerprint(host, path)
+            if fingerprint:
+                fingerprints.append(fingerprint)
+        return fingerprints
+
+    def evict(self) -> int:
+        """总大小超过上限时按最近使用时间淘汰条目，直到不超过上限的 3/4
+
+        留出余量，避免缓存接近上限后每次写入都重新扫描目录。
+
+        Returns:
+            淘汰的条目数
+        """
+        try:
+            entries = []
+            with os.scandir(self.directory) as it:
+                for e in it:
+                    if e.is_file() and e.name.endswith(".json"):
+                        st = e.stat()
+                        entries.append((st.st_mtime, st.st_size, e.path))
+        except OSError:
+            self._size = None
+            return 0
+
+        total = sum(size for _, size, _ in entries)
+        self._size = total
+        if total <= self.max_bytes:
+            return 0
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self._size = total
+        return removed
+
+    def clear(self) -> None:
+        """清空缓存"""
+        try:
+            with os.scandir(self.directory) as it:
+                for e in it:
+                    if e.name.endswith(".json"):
+                        os.remove(e.path)
+        except OSError:
+            pass
+        self._size = None
@@ -1,11 +1,23 @@
 """命令行接口"""
 
 import argparse
+import atexit
 import sys
 
+from . import trace
+from .cache import set_cache_enabled
 from .deploy import deploy_server
-from .add_peer import add_peer
-from .remove_peer import remove_peer, list_peers
+from .add_peer import add_peer, add_peers
+from .export import QR_FORMATS
+from .loader import load_records
+from .inventory import InventoryHost, load_inventory
+from .fleet import DEFAULT_PARALLEL, DEFAULT_HOST_TIMEOUT, run_on_hosts, summarize
+from .remove_peer import remove_peer, remove_peers, list_peers
+from .status import SORT_KEYS, show_status
+from .find import find_peers
+from .reconcile import reconcile
+from .apply import apply_state, load_state
+from .sync import show_store, sync_hosts
 
 
 def main() -> None:
@@ -19,11 +31,31 @@ def main() -> None:
   %(prog)s deploy root@1.2.3.4 -a 10.1.0.1/24 -p 51821 -i wg1  # 指定配置
   %(prog)s add root@1.2.3.4 -n phone              # 添加客户端
   %(prog)s add root@1.2.3.4 -n laptop --allowed-ips "0.0.0.0/0, ::/0"  # 全局代理
+  %(prog)s add-batch root@1.2.3.4 -f users.csv -o clients/  # 批量添加客户端
+  %(prog)s add-batch root@1.2.3.4 -f users.csv -o clients.zip --qr png  # 含二维码，写入 zip
   %(prog)s remove root@1.2.3.4 -n phone           # 删除客户端
+  %(prog)s remove-batch root@1.2.3.4 --match "dev-*"  # 批量删除客户端
   %(prog)s list root@1.2.3.4                      # 列出所有客户端
+  %(prog)s list local                             # 在服务器本机执行（不经过 SSH）
+  %(prog)s status root@1.2.3.4 --sort rate --watch  # 实时查看握手和流量
+  %(prog)s reconcile root@1.2.3.4 --dry-run        # 检查运行中的接口与配置文件是否一致
+  %(prog)s fleet -I hosts.yaml -g edge list       # 并发列出一组主机的客户端
+  %(prog)s find phone -I hosts.yaml               # 在所有主机中查找客户端
+  %(prog)s db sync -I hosts.yaml                  # 增量同步本地状态库
+  %(prog)s db drift root@1.2.3.4                  # 报告本地状态库与服务器的差异
+  %(prog)s apply state.yaml -o clients/ --dry-run  # 按声明的目标状态输出执行计划
 """
     )
 
+    parser.add_argument("--no-cache", action="store_true",
+                        help="不使用远程配置文件本地缓存，每次完整取回")
+    parser.add_argument("--profile", action="store_true",
+                        help="结束时输出各阶段耗时、SSH 往返次数和传输字节数的汇总表")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="把各阶段的跟踪记录写入文件")
+    parser.add_argument("--trace-format", choices=["chrome", "json"], default="chrome",
+                        help="跟踪文件格式: chrome (chrome://tracing / Perfetto) 或 json (默认: chrome)")
+
     subparsers = parser.add_subparsers(dest="command")
 
     # deploy 命令
@@ -45,6 +77,27 @@ def main() -> None:
     add_parser.add_argument("--ssh-port", type=int, default=22, help="SSH 端口 (默认: 22)")
     add_parser.add_argument("--key-file", help="SSH 私钥文件路径")
     add_parser.add_argument("--dns", default="", help="DNS 服务器（留空则不设置）")
+    add_parser.add_argument("--reserve", action="append", default=[],
+                            help="不参与分配的地址或范围，如 10.0.0.2-10.0.0.50 (可多次指定)")
+
+    # add-batch 命令
+    add_batch_parser = subparsers.add_parser("add-batch", help="批量添加客户端节点")
+    add_batch_parser.add_argument("host", help="服务器地址 (user@host)")
+    add_batch_parser.add_argument("-f", "--file", required=True,
+                                  help="客户端列表文件 (CSV/JSON/YAML，字段: name, allowed_ips, dns)")
+    add_batch_parser.add_argument("-o", "--output-dir", required=True,
+                                  help="客户端配置输出目录 (以 .zip 结尾时写入 zip 归档)")
+    add_batch_parser.add_argument("--allowed-ips", default="", help="默认 AllowedIPs (默认使用服务端网段)")
+    add_batch_parser.add_argument("-i", "--interface", help="指定接口名称 (多接口时可用)")
+    add_batch_parser.add_argument("--ssh-port", type=int, default=22, help="SSH 端口 (默认: 22)")
+    add_batch_parser.add_argument("--key-file", help="SSH 私钥文件路径")
+    add_batch_parser.add_argument("--dns", default="", help="默认 DNS 服务器（留空则不设置）")
+    add_batch_parser.add_argument("--reserve", action="append", default=[],
+                                  help="不参与分配的地址或范围，如 10.0.0.2-10.0.0.50 (可多次指定)")
+    add_batch_parser.add_argument("--qr", action="append", default=[], choices=list(QR_FORMATS),
+                                  help="同时生成客户端配置的二维码 (png / svg，可多次指定)")
+    add_batch_parser.add_argument("-j", "--workers", type=int,
+                                  help="渲染配置和二维码的进程数 (默认: CPU 核数)")
 
     # remove 命令
     remove_parser = subparsers.add_parser("remove", help="删除客户端节点")
@@ -54,6 +107,21 @@ def main() -> None:
     remove_parser.add_argument("--ssh-port", type=int, default=22, help="SSH 端口 (默认: 22)")
     remove_parser.add_argument("--key-file", help="SSH 私钥文件路径")
 
+    # remove-batch 命令
+    remove_batch_parser = subparsers.add_parser("remove-batch", help="批量删除客户端节点")
+    remove_batch_parser.add_argument("host", help="服务器地址 (user@host)")
+    remove_batch_parser.add_argument("-n", "--name", action="append", default=[],
+                                     help="客户端名称 (可多次指定)")
+    remove_batch_parser.add_argument("-f", "--file", help="客户端名称列表文件 (CSV/JSON/YAML)")
+    remove_batch_parser.add_argument("--public-key", action="append", default=[],
+                                     help="客户端公钥 (可多次指定)")
+    match_group = remove_batch_parser.add_mutually_exclusive_group()
+    match_group.add_argument("--match", help="按名称 glob 模式匹配，如 'dev-*'")
+    match_group.add_argument("--regex", help="按名称正则表达式匹配")
+    remove_batch_parser.add_argument("-i", "--interface", help="指定接口名称 (多接口时可用)")
+    remove_batch_parser.add_argument("--ssh-port", type=int, default=22, help="SSH 端口 (默认: 22)")
+    remove_batch_parser.add_argument("--key-file", help="SSH 私钥文件路径")
+
     # list 命令
     list_parser = subparsers.add_parser("list", help="列出所有客户端")
     list_parser.add_argument("host", help="服务器地址 (user@host)")
@@ -61,8 +129,128 @@ def main() -> None:
     list_parser.add_argument("--ssh-port", type=int, default=22, help="SSH 端口 (默认: 22)")
     list_parser.add_argument("--key-file", help="SSH 私钥文件路径")
 
+    # status 命令
+    status_parser = subparsers.add_parser("status", help="查看客户端运行状态 (握手、流量)")
+    status_parser.add_argument("host", help="服务器地址 (user@host)")
+    status_parser.add_argument("-i", "--interface", help="指定接口名称 (留空显示所有)")
+    status_parser.add_argument("-s", "--sort", choices=list(SORT_KEYS), default="name",
+                               help="排序字段 (默认: name；handshake/rx/tx/total/rate 从大到小)")
+    status_parser.add_argument("-r", "--reverse", action="store_true", help="反转排序方向")
+    status_parser.add_argument("-n", "--limit", type=int, help="最多显示的客户端数量")
+    status_parser.add_argument("--match", help="按名称或公钥 glob 模式过滤，如 'dev-*'")
+    status_parser.add_argument("--active", type=int, metavar="SECONDS",
+                               help="只显示最近 SECONDS 秒内握手过的客户端")
+    status_parser.add_argument("--stale", type=int, metavar="SECONDS",
+                               help="只显示超过 SECONDS 秒未握手的客户端")
+    status_parser.add_argument("-w", "--watch", type=float, nargs="?", const=2.0, metavar="SECONDS",
+                               help="每隔 SECONDS 秒刷新并显示收发速率 (默认: 2)")
+    status_parser.add_argument("--ssh-port", type=int, default=22, help="SSH 端口 (默认: 22)")
+    status_parser.add_argument("--key-file", help="SSH 私钥文件路径")
+
+    # reconcile 命令
+    reconcile_parser = subparsers.add_parser(
+        "reconcile", help="按配置文件修正运行中的接口 (最少的 wg set，不重启)")
+    reconcile_parser.add_argument("host", help="服务器地址 (user@host)")
+    reconcile_parser.add_argument("-i", "--interface", help="指定接口名称 (留空处理所有接口)")
+    reconcile_parser.add_argument("-n", "--dry-run", action="store_true",
+                                  help="只输出修正计划，不执行 (不一致时退出码为 1)")
+    reconcile_parser.add_argument("--ssh-port", type=int, default=22, help="SSH 端口 (默认: 22)")
+    reconcile_parser.add_argument("--key-file", help="SSH 私钥文件路径")
+
+    # find 命令
+    find_parser = subparsers.add_parser("find", help="按名称、公钥或地址在所有主机中查找客户端")
+    find_parser.add_argument("query", help="客户端名称 (可用 glob 模式)、公钥或地址")
+    find_parser.add_argument("-I", "--inventory", help="主机清单文件，查找前先刷新这些主机的索引")
+    find_parser.add_argument("-g", "--group", action="append", default=[],
+                             help="主机组 (可多次指定，all 表示全部)")
+    find_parser.add_argument("-H", "--hosts", action="append", default=[],
+                             help="主机名 (可多次指定)")
+    find_parser.add_argument("-j", "--parallel", type=int, default=DEFAULT_PARALLEL,
+                             help=f"刷新时的最大并发数 (默认: {DEFAULT_PARALLEL})")
+    find_parser.add_argument("--timeout", type=float, default=DEFAULT_HOST_TIMEOUT,
+                             help=f"刷新时单台主机超时秒数 (默认: {DEFAULT_HOST_TIMEOUT})")
+
+    # db 命令
+    db_parser = subparsers.add_parser("db", help="本地状态库 (SQLite): 同步、差异报告、查看")
+    db_subparsers = db_parser.add_subparsers(dest="db_command", required=True)
+    for db_command, db_help in (("sync", "增量同步 (只导入配置文件有变化的接口)"),
+                                ("drift", "报告本地状态库与服务器的差异 (不修改状态库)")):
+        db_sub = db_subparsers.add_parser(db_command, help=db_help)
+        db_sub.add_argument("targets", nargs="*", metavar="host",
+                            help="服务器地址 (user@host 或 local[:根目录])")
+        db_sub.add_argument("-I", "--inventory", help="主机清单文件 (JSON/YAML)")
+        db_sub.add_argument("-g", "--group", action="append", default=[],
+                            help="主机组 (可多次指定，all 表示全部)")
+        db_sub.add_argument("-H", "--hosts", action="append", default=[],
+                            help="主机名 (可多次指定)")
+        db_sub.add_argument("-j", "--parallel", type=int, default=DEFAULT_PARALLEL,
+                            help=f"最大并发数 (默认: {DEFAULT_PARALLEL})")
+        db_sub.add_argument("--timeout", type=float, default=DEFAULT_HOST_TIMEOUT,
+                            help=f"单台主机超时秒数 (默认: {DEFAULT_HOST_TIMEOUT})")
+        db_sub.add_argument("--ssh-port", type=int, default=22,
+                            help="直接指定的服务器的 SSH 端口 (默认: 22)")
+        db_sub.add_argument("--key-file", help="直接指定的服务器的 SSH 私钥文件路径")
+    db_list = db_subparsers.add_parser("list", help="查看状态库内容 (不连接服务器)")
+    db_list.add_argument("host", nargs="?", help="只显示该主机 (如 root@1.2.3.4:22)")
+    db_list.add_argument("-i", "--interface", help="显示该接口的客户端 (需指定主机)")
+
+    # apply 命令
+    apply_parser = subparsers.add_parser("apply", help="按状态文件声明的接口和客户端应用到各主机")
+    apply_parser.add_argument("state", help="状态文件 (JSON/YAML)")
+    apply_parser.add_argument("-I", "--inventory", help="主机清单文件，状态中未写 host 的主机按名称查找")
+    apply_parser.add_argument("-H", "--hosts", action="append", default=[],
+                              help="只应用这些主机 (可多次指定)")
+    apply_parser.add_argument("-o", "--output", help="新客户端配置的输出目录 (每台主机一个子目录)")
+    apply_parser.add_argument("-n", "--dry-run", action="store_true", help="只输出执行计划，不执行")
+    apply_parser.add_argument("--no-prune", action="store_true",
+                              help="不删除状态文件中没有的客户端")
+    apply_parser.add_argument("-j", "--parallel", type=int, default=DEFAULT_PARALLEL,
+                              help=f"最大并发数 (默认: {DEFAULT_PARALLEL})")
+    apply_parser.add_argument("--timeout", type=float, default=DEFAULT_HOST_TIMEOUT,
+                              help=f"单台主机超时秒数 (默认: {DEFAULT_HOST_TIMEOUT})")
+
+    # fleet 命令
+    fleet_parser = subparsers.add_parser("fleet", help="在清单中的多台主机上并发执行")
+    fleet_parser.add_argument("-I", "--inventory", required=True, help="主机清单文件 (JSON/YAML)")
+    fleet_parser.add_argument("-g", "--group", action="append", default=[],
+                              help="主机组 (可多次指定，all 表示全部)")
+    fleet_parser.add_argument("-H", "--hosts", action="append", default=[],
+                              help="主机名 (可多次指定)")
+    fleet_parser.add_argument("-j", "--parallel", type=int, default=DEFAULT_PARALLEL,
+                              help=f"最大并发数 (默认: {DEFAULT_PARALLEL})")
+    fleet_parser.add_argument("--timeout", type=float, default=DEFAULT_HOST_TIMEOUT,
+                              help=f"单台主机超时秒数 (默认: {DEFAULT_HOST_TIMEOUT})")
+    fleet_subparsers = fleet_parser.add_subparsers(dest="fleet_command", required=True)
+
+    fleet_list = fleet_subparsers.add_parser("list", help="列出所有客户端")
+    fleet_list.add_argument("-i", "--interface", help="指定接口名称 (留空显示所有)")
+
+    fleet_deploy = fleet_subparsers.add_parser("deploy", help="部署新服务 (非交互)")
+    fleet_deploy.add_argument("-a", "--address", help="服务端内网地址")
+    fleet_deploy.add_argument("-p", "--port", type=int, help="监听端口")
+    fleet_deploy.add_argument("-i", "--interface", help="接口名称")
+
+    fleet_add = fleet_subparsers.add_parser("add", help="添加客户端节点")
+    fleet_add.add_argument("-n", "--name", required=True, help="客户端名称")
+    fleet_add.add_argument("--allowed-ips", default="", help="AllowedIPs (默认使用服务端网段)")
+    fleet_add.add_argument("-i", "--interface", help="指定接口名称 (多接口主机必须指定)")
+    fleet_add.add_argument("--dns", default="", help="DNS 服务器（留空则不设置）")
+    fleet_add.add_argument("--reserve", action="append", default=[],
+                           help="不参与分配的地址或范围，如 10.0.0.2-10.0.0.50 (可多次指定)")
+
+    fleet_remove = fleet_subparsers.add_parser("remove", help="删除客户端节点")
+    fleet_remove.add_argument("-n", "--name", required=True, help="客户端名称")
+    fleet_remove.add_argument("-i", "--interface", help="指定接口名称 (多接口主机必须指定)")
+
     args = parser.parse_args()
 
+    if args.no_cache:
+        set_cache_enabled(False)
+
+    if args.profile or args.trace:
+        trace.enable()
+        atexit.register(report_trace, args.profile, args.trace, args.trace_format)
+
     if args.command == "deploy":
         # 判断是否为交互模式：如果没指定任何配置参数，则为交互模式
         interactive = not args.no_interactive
@@ -85,7 +273,29 @@ def main() -> None:
             interface=args.interface,
             ssh_port=args.ssh_port,
             key_file=args.key_file,
-            dns=args.dns
+            dns=args.dns,
+            reserved=args.reserve
+        )
+        sys.exit(0 if success else 1)
+
+    elif args.command == "add-batch":
+        try:
+            peers = load_records(args.file)
+        except (OSError, ValueError) as e:
+            print(f"读取客户端列表失败: {e}", file=sys.stderr)
+            sys.exit(1)
+        success = add_peers(
+            host=args.host,
+            peers=peers,
+            output_dir=args.output_dir,
+            interface=args.interface,
+            ssh_port=args.ssh_port,
+            key_file=args.key_file,
+            allowed_ips=args.allowed_ips,
+            dns=args.dns,
+            reserved=args.reserve,
+            qr_formats=args.qr,
+            workers=args.workers
         )
         sys.exit(0 if success else 1)
 
@@ -99,6 +309,31 @@ def main() -> None:
         )
         sys.exit(0 if success else 1)
 
+    elif args.command == "remove-batch":
+        names = list(args.name)
+        public_keys = list(args.public_key)
+        if args.file:
+            try:
+                for record in load_records(args.file):
+                    if record.get("name"):
+                        names.append(record["name"])
+                    if record.get("public_key"):
+                        public_keys.append(record["public_key"])
+            except (OSError, ValueError) as e:
+                print(f"读取客户端列表失败: {e}", file=sys.stderr)
+                sys.exit(1)
+        success = remove_peers(
+            host=args.host,
+            names=names,
+            public_keys=public_keys,
+            pattern=args.regex if args.regex is not None else args.match,
+            regex=args.regex is not None,
+            interface=args.interface,
+            ssh_port=args.ssh_port,
+            key_file=args.key_file
+        )
+        sys.exit(0 if success else 1)
+
     elif args.command == "list":
         success = list_peers(
             host=args.host,
@@ -108,10 +343,150 @@ def main() -> None:
         )
         sys.exit(0 if success else 1)
 
+    elif args.command == "status":
+        if args.watch is not None and args.watch <= 0:
+            print("错误: --watch 间隔必须大于 0", file=sys.stderr)
+            sys.exit(1)
+        success = show_status(
+            host=args.host,
+            interface=args.interface,
+            sort=args.sort,
+            reverse=args.reverse,
+            limit=args.limit,
+            match=args.match,
+            active=args.active,
+            stale=args.stale,
+            watch=args.watch,
+            ssh_port=args.ssh_port,
+            key_file=args.key_file
+        )
+        sys.exit(0 if success else 1)
+
+    elif args.command == "reconcile":
+        success = reconcile(
+            host=args.host,
+            interface=args.interface,
+            dry_run=args.dry_run,
+            ssh_port=args.ssh_port,
+            key_file=args.key_file
+        )
+        sys.exit(0 if success else 1)
+
+    elif args.command == "find":
+        hosts = None
+        if args.inventory:
+            try:
+                hosts = load_inventory(args.inventory).select(args.group, args.hosts)
+            except (OSError, ValueError) as e:
+                print(f"读取主机清单失败: {e}", file=sys.stderr)
+                sys.exit(1)
+        success = find_peers(args.query, hosts, args.parallel, args.timeout)
+        sys.exit(0 if success else 1)
+
+    elif args.command == "db":
+        sys.exit(0 if run_db(args) else 1)
+
+    elif args.command == "apply":
+        sys.exit(0 if run_apply(args) else 1)
+
+    elif args.command == "fleet":
+        sys.exit(0 if run_fleet(args) else 1)
+
     else:
         parser.print_help()
         sys.exit(0)
 
 
+def report_trace(profile: bool, path: str, fmt: str) -> None:
+    """输出跟踪汇总表和/或写入跟踪文件"""
+    if profile:
+        print(file=sys.stderr)
+        print(trace.format_summary(), file=sys.stderr)
+    if path:
+        try:
+            trace.write_trace(path, fmt)
+            print(f"跟踪记录已写入: {path}", file=sys.stderr)
+        except OSError as e:
+            print(f"写入跟踪记录失败: {e}", file=sys.stderr)
+
+
+def run_db(args: argparse.Namespace) -> bool:
+    """执行 db 子命令"""
+    if args.db_command == "list":
+        return show_store(args.host, args.interface)
+
+    hosts = [InventoryHost(target, target, args.ssh_port, args.key_file) for target in args.targets]
+    if args.inventory:
+        try:
+            hosts += load_inventory(args.inventory).select(args.group, args.hosts)
+        except (OSError, ValueError) as e:
+            print(f"读取主机清单失败: {e}", file=sys.stderr)
+            return False
+    return sync_hosts(hosts, args.db_command == "sync", args.parallel, args.timeout)
+
+
+def run_apply(args: argparse.Namespace) -> bool:
+    """执行 apply 命令"""
+    try:
+        inventory = load_inventory(args.inventory) if args.inventory else None
+    except (OSError, ValueError) as e:
+        print(f"读取主机清单失败: {e}", file=sys.stderr)
+        return False
+    try:
+        states = load_state(args.state, inventory)
+    except (OSError, ValueError) as e:
+        print(f"读取状态文件失败: {e}", file=sys.stderr)
+        return False
+
+    if args.hosts:
+        unknown = sorted(set(args.hosts) - {state.host.name for state in states})
+        if unknown:
+            print(f"状态文件中没有主机: {', '.join(unknown)}", file=sys.stderr)
+            return False
+        states = [state for state in states if state.host.name in args.hosts]
+    return apply_state(states, args.output, not args.no_prune, args.dry_run,
+                       args.parallel, args.timeout)
+
+
+def run_fleet(args: argparse.Namespace) -> bool:
+    """执行 fleet 子命令"""
+    try:
+        inventory = load_inventory(args.inventory)
+        hosts = inventory.select(args.group, args.hosts)
+    except (OSError, ValueError) as e:
+        print(f"读取主机清单失败: {e}", file=sys.stderr)
+        return False
+
+    if not hosts:
+        print("没有匹配的主机", file=sys.stderr)
+        return False
+
+    if args.fleet_command == "list":
+        def operation(h):
+            return list_peers(h.host, args.interface, h.port, h.key_file)
+    elif args.fleet_command == "deploy":
+        def operation(h):
+            return deploy_server(
+                h.host, args.address, args.port, args.interface,
+                h.port, h.key_file, interactive=False
+            )
+    elif args.fleet_command == "add":
+        def operation(h):
+            return add_peer(
+                h.host, args.name, args.allowed_ips, args.interface,
+                h.port, h.key_file, args.dns, args.reserve, interactive=False
+            )
+    else:
+        def operation(h):
+            return remove_peer(
+                h.host, args.name, args.interface, h.port, h.key_file, interactive=False
+            )
+
+    print(f"在 {len(hosts)} 台主机上执行 {args.fleet_command}（并发 {args.parallel}）...\n")
+    results = run_on_hosts(hosts, operation, args.parallel, args.timeout)
+    print(summarize(results))
+    return all(r.success for r in results)
+
+
 if __name__ == "__main__":
     main()
@@ -1,19 +1,86 @@
-"""WireGuard 密钥生成模块"""
+"""WireGuard 密钥生成模块
 
+密钥默认在进程内生成：私钥和预共享密钥取自 os.urandom，公钥通过
+X25519 (RFC 7748) 计算，无需本地安装 wg。安装了 cryptography 时使用其
+X25519 实现，否则使用本模块的纯 Python 实现。
+
+默认（auto）模式下进程内生成失败时（如系统随机源不可用），自动退回到调用
+wg genkey / pubkey / genpsk；设置环境变量 WG_MANAGER_KEY_BACKEND=wg
+（或调用 set_key_backend("wg")）可始终使用 wg 命令，设置为 python 时不退回。
+"""
+
+import os
+import hmac
+import base64
+import hashlib
+import binascii
+import threading
 import subprocess
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from typing import Optional
 
+from . import trace
+
+try:
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+    from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+except ImportError:  # pragma: no cover - 可选依赖
+    X25519PrivateKey = None
+
+
+KEY_BACKENDS = ("auto", "python", "wg")
+
+_key_backend = os.environ.get("WG_MANAGER_KEY_BACKEND", "auto")
+
+# 纯 Python 后端批量生成时，达到该数量才使用多进程
+PARALLEL_THRESHOLD = 512
+
+# 私钥 -> 公钥缓存的最大条目数
+PUBLIC_KEY_CACHE_SIZE = 1024
+
+# 进程内生成失败、auto 模式下退回 wg 命令的异常
+_FALLBACK_ERRORS = (OSError, NotImplementedError)
+
+# Curve25519 参数 (RFC 7748)
+_P = 2 ** 255 - 19
+_A24 = 121665
+_BASE_U = 9
+
 
 class WireGuardKeyError(Exception):
     """密钥操作错误"""
     pass
 
 
-def run_wg_command(args: list[str]) -> tuple[bool, str]:
+def set_key_backend(backend: str) -> None:
+    """设置密钥生成后端
+
+    Args:
+        backend: auto（优先 cryptography，否则纯 Python）、python 或 wg
+    """
+    global _key_backend
+    if backend not in KEY_BACKENDS:
+        raise ValueError(f"未知的密钥后端: {backend}，可选: {', '.join(KEY_BACKENDS)}")
+    _key_backend = backend
+
+
+def get_key_backend() -> str:
+    """当前实际使用的密钥后端: cryptography、python 或 wg"""
+    if _key_backend == "wg":
+        return "wg"
+    if _key_backend == "auto" and X25519PrivateKey is not None:
+        return "cryptography"
+    return "python"
+
+
+def run_wg_command(args: list[str], input: Optional[str] = None) -> tuple[bool, str]:
     """执行 wg 命令"""
     try:
         result = subprocess.run(
             args,
+            input=input,
             capture_output=True,
             text=True,
             check=True
@@ -25,29 +92,232 @@ def run_wg_command(args: list[str]) -> tuple[bool, str]:
         return False, "未找到 wg 命令，请确保已安装 WireGuard"
 
 
-def generate_private_key() -> str:
-    """生成私钥"""
-    success, result = run_wg_command(["wg", "genkey"])
+def _can_fall_back(error: Exception) -> bool:
+    """进程内生成失败时是否退回 wg 命令（只在 auto 模式下）"""
+    return _key_backend == "auto" and isinstance(error, _FALLBACK_ERRORS)
+
+
+def _wg_key(args: list[str], what: str, input: Optional[str] = None) -> str:
+    success, result = run_wg_command(args, input)
     if not success:
-        raise WireGuardKeyError(f"生成私钥失败: {result}")
+        raise WireGuardKeyError(f"生成{what}失败: {result}")
     return result
 
 
+def _clamp(scalar: bytes) -> int:
+    """按 X25519 规则截断标量，返回整数"""
+    k = bytearray(scalar)
+    k[0] &= 248
+    k[31] &= 127
+    k[31] |= 64
+    return int.from_bytes(k, "little")
+
+
+def _ladder(k: int, u: int) -> tuple[int, int]:
+    """Montgomery ladder，返回射影坐标 (x, z)"""
+    x1, x2, z2, x3, z3 = u, 1, 0, u, 1
+    swap = 0
+    for t in range(254, -1, -1):
+        k_t = (k >> t) & 1
+        swap ^= k_t
+        if swap:
+            x2, x3 = x3, x2
+            z2, z3 = z3, z2
+        swap = k_t
+
+        a = x2 + z2
+        aa = a * a % _P
+        b = x2 - z2
+        bb = b * b % _P
+        e = aa - bb
+        c = x3 + z3
+        d = x3 - z3
+        da = d * a % _P
+        cb = c * b % _P
+        x3 = (da + cb) ** 2 % _P
+        z3 = x1 * (da - cb) ** 2 % _P
+        x2 = aa * bb % _P
+        z2 = e * (aa + _A24 * e) % _P
+
+    if swap:
+        x2, z2 = x3, z3
+    return x2, z2
+
+
+def x25519(scalar: bytes, u_point: bytes) -> bytes:
+    """纯 Python X25519 标量乘法 (RFC 7748)
+
+    注意：Python 大整数运算不是常数时间的，仅用于本地密钥生成。
+    """
+    u = int.from_bytes(u_point, "little") & ((1 << 255) - 1)
+    x, z = _ladder(_clamp(scalar), u)
+    return (x * pow(z, _P - 2, _P) % _P).to_bytes(32, "little")
+
+
+def _public_keys_python(private_keys: list[bytes]) -> list[bytes]:
+    """批量计算公钥，用 Montgomery 批量求逆把 n 次模幂合并为一次"""
+    points = [_ladder(_clamp(k), _BASE_U) for k in private_keys]
+    if not points:
+        return []
+
+    # prefix[i] = z_0 * ... * z_{i-1}
+    prefix = [1]
+    for _, z in points:
+        prefix.append(prefix[-1] * z % _P)
+    inv = pow(prefix[-1], _P - 2, _P)
+
+    public_keys = [b""] * len(points)
+    for i in range(len(points) - 1, -1, -1):
+        x, z = points[i]
+        z_inv = inv * prefix[i] % _P
+        inv = inv * z % _P
+        public_keys[i] = (x * z_inv % _P).to_bytes(32, "little")
+    return public_keys
+
+
+def _public_keys(private_keys: list[bytes], workers: Optional[int] = 1) -> list[bytes]:
+    """按当前后端批量计算公钥（不含 wg 后端）
+
+    Args:
+        private_keys: 原始私钥列表
+        workers: 纯 Python 后端的进程数，None 表示 CPU 核数
+    """
+    if get_key_backend() == "cryptography":
+        return [
+            X25519PrivateKey.from_private_bytes(k).public_key().public_bytes(
+                Encoding.Raw, PublicFormat.Raw
+            )
+            for k in private_keys
+        ]
+
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(private_keys) < PARALLEL_THRESHOLD:
+        return _public_keys_python(private_keys)
+
+    chunk = -(-len(private_keys) // workers)
+    chunks = [private_keys[i:i + chunk] for i in range(0, len(private_keys), chunk)]
+    try:
+        with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+            return [pub for part in pool.map(_public_keys_python, chunks) for pub in part]
+    except (OSError, NotImplementedError, BrokenProcessPool):
+        # 无法启动子进程（如受限的沙箱）时在本进程内计算
+        return _public_keys_python(private_keys)
+
+
+def _random_private_key() -> bytes:
+    """生成已截断的 32 字节私钥（与 wg genkey 输出一致）"""
+    k = bytearray(os.urandom(32))
+    k[0] &= 248
+    k[31] &= 127
+    k[31] |= 64
+    return bytes(k)
+
+
+def _encode(key: bytes) -> str:
+    return base64.b64encode(key).decode()
+
+
+def _decode_key(key: str) -> Optional[bytes]:
+    """解码 base64 密钥，格式错误时返回 None"""
+    try:
+        raw = base64.b64decode(key.strip(), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return raw if len(raw) == 32 else None
+
+
+def generate_private_key() -> str:
+    """生成私钥"""
+    if get_key_backend() != "wg":
+        try:
+            return _encode(_random_private_key())
+        except _FALLBACK_ERRORS as e:
+            if not _can_fall_back(e):
+                raise WireGuardKeyError(f"生成私钥失败: {e}")
+    return _wg_key(["wg", "genkey"], "私钥")
+
+
 def generate_public_key(private_key: str) -> str:
     """从私钥生成公钥"""
-    try:
-        result = subprocess.run(
-            ["wg", "pubkey"],
-            input=private_key,
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return result.stdout.strip()
-    except Exception as e:
-        raise WireGuardKeyError(f"生成公钥失败: {e}")
+    if get_key_backend() != "wg":
+        raw = _decode_key(private_key)
+        if raw is None:
+            raise WireGuardKeyError("生成公钥失败: 私钥格式无效")
+        try:
+            return _encode(_public_keys([raw])[0])
+        except _FALLBACK_ERRORS as e:
+            if not _can_fall_back(e):
+                raise WireGuardKeyError(f"生成公钥失败: {e}")
+    return _wg_key(["wg", "pubkey"], "公钥", input=private_key)
+
+
+class _PublicKeyCache:
+    """进程内私钥 -> 公钥 LRU 缓存
+
+    缓存键是以进程随机盐计算的 HMAC-SHA256 摘要，缓存中不保存私钥明文，
+    摘要也无法在进程外复现。
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._salt = os.urandom(32)
+        self._entries: OrderedDict[bytes, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, private_key: str) -> bytes:
+        return hmac.new(self._salt, private_key.strip().encode(), hashlib.sha256).digest()
 
+    def get(self, private_key: str) -> str:
+        key = self._key(private_key)
+        with self._lock:
+            public_key = self._entries.get(key)
+            if public_key is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return public_key
+            self.misses += 1
 
+        public_key = generate_public_key(private_key)
+        with self._lock:
+            self._entries[key] = public_key
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return public_key
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_public_key_cache = _PublicKeyCache(PUBLIC_KEY_CACHE_SIZE)
+
+
+def cached_public_key(private_key: str) -> str:
+    """从私钥推导公钥，结果在进程内按 LRU 缓存
+
+    用于反复解析同一服务端配置的场景，避免重复计算。
+    """
+    return _public_key_cache.get(private_key)
+
+
+def clear_public_key_cache() -> None:
+    """清空公钥缓存"""
+    _public_key_cache.clear()
+
+
+def public_key_cache_info() -> tuple[int, int, int]:
+    """公钥缓存统计 (命中次数, 未命中次数, 当前条目数)"""
+    return _public_key_cache.hits, _public_key_cache.misses, len(_public_key_cache)
+
+
+@trace.traced("crypto.generate_keypair")
 def generate_keypair() -> tuple[str, str]:
     """生成密钥对 (私钥, 公钥)"""
     private_key = generate_private_key()
@@ -57,7 +327,45 @@ def generate_keypair() -> tuple[str, str]:
 
 def generate_preshared_key() -> str:
     """生成预共享密钥"""
-    success, result = run_wg_command(["wg", "genpsk"])
-    if not success:
-        raise WireGuardKeyError(f"生成预共享密钥失败: {result}")
-    return result
+    if get_key_backend() != "wg":
+        try:
+            return _encode(os.urandom(32))
+        except _FALLBACK_ERRORS as e:
+            if not _can_fall_back(e):
+                raise WireGuardKeyError(f"生成预共享密钥失败: {e}")
+    return _wg_key(["wg", "genpsk"], "预共享密钥")
+
+
+def generate_keypairs(
+    n: int,
+    with_psk: bool = True,
+    workers: Optional[int] = None
+) -> list[tuple[str, str, str]]:
+    """批量生成密钥，用于批量开通客户端
+
+    Args:
+        n: 数量
+        with_psk: 是否同时生成预共享密钥
+        workers: 纯 Python 后端的并行进程数，默认 CPU 核数
+
+    Returns:
+        [(私钥, 公钥, 预共享密钥), ...] 列表，with_psk 为 False 时预共享密钥为空字符串
+    """
+    with trace.span("crypto.generate_keypairs", count=n, backend=get_key_backend()) as span:
+        if get_key_backend() != "wg":
+            try:
+                private_keys = [_random_private_key() for _ in range(n)]
+                public_keys = _public_keys(private_keys, workers)
+                return [
+                    (_encode(priv), _encode(pub), _encode(os.urandom(32)) if with_psk else "")
+                    for priv, pub in zip(private_keys, public_keys)
+                ]
+            except _FALLBACK_ERRORS as e:
+                if not _can_fall_back(e):
+                    raise WireGuardKeyError(f"生成密钥失败: {e}")
+                span.set(backend="wg", fallback=str(e))
+
+        return [
+            (*generate_keypair(), generate_preshared_key() if with_psk else "")
+            for _ in range(n)
+        ]
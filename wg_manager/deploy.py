@@ -1,16 +1,27 @@
 """WireGuard 服务部署模块"""
 
+import re
 import sys
-from typing import Optional
+import shlex
+import ipaddress
+from dataclasses import dataclass, field
+from typing import Optional, Union
 
+from . import trace
 from .config import DEFAULT_ADDRESS, DEFAULT_PORT, DEFAULT_INTERFACE, REMOTE_WG_DIR
 from .crypto import generate_keypair
-from .parser import scan_interfaces
-from .ssh import SSHClient, connect_ssh
+from .model import Interface
+from .parser import InterfaceConfig, InterfaceScan
+from .reconcile import PeerState, dump_command, parse_peer_dump
+from .session import connect_ssh
+from .transport import Flow, Transport, run_flow
 
 
-def get_input(prompt: str, default: str = "") -> str:
-    """获取用户输入"""
+def get_input(prompt: str, default: str = "") -> Optional[str]:
+    """获取用户输入，取消（Ctrl-C 或输入结束）时返回 None
+
+    不退出进程：在 fleet 的工作线程中调用时只让该主机的操作失败。
+    """
     try:
         if default:
             value = input(f"{prompt} [{default}]: ").strip()
@@ -18,25 +29,245 @@ def get_input(prompt: str, default: str = "") -> str:
         return input(f"{prompt}: ").strip()
     except (KeyboardInterrupt, EOFError):
         print("\n已取消")
-        sys.exit(0)
+        return None
+
+
+def check_network_conflict(interfaces: list[InterfaceConfig], address: str) -> Optional[str]:
+    """检查网段是否与现有接口冲突，返回冲突的接口名
+
+    Args:
+        interfaces: scan_interfaces 的扫描结果
+        address: 新接口地址，如 10.0.0.1/24（任意前缀长度，IPv4 或 IPv6）
+    """
+    try:
+        new_network = ipaddress.ip_network(address, strict=False)
+    except ValueError:
+        return None
+
+    for iface in interfaces:
+        section = iface.model.interface
+        for existing in section.addresses if section is not None else []:
+            try:
+                existing_network = ipaddress.ip_network(existing, strict=False)
+            except ValueError:
+                continue
+            if existing_network.version == new_network.version and existing_network.overlaps(new_network):
+                return iface.name
+    return None
 
 
-def check_port_in_use(ssh: SSHClient, port: int) -> bool:
-    """检查端口是否被占用"""
-    success, output = ssh.run_command(f"ss -tuln | grep -q ':{port} ' && echo used")
-    return success and "used" in output
+# wg-quick 接受的接口名称
+_INTERFACE_NAME = re.compile(r"^[a-zA-Z0-9_=+.-]{1,15}$")
 
+# ip route 输出中位于目的网段之前的路由类型
+_ROUTE_TYPES = {"unicast", "local", "broadcast", "multicast", "throw",
+                "unreachable", "prohibit", "blackhole", "nat", "anycast"}
 
-def check_network_conflict(ssh: SSHClient, address: str) -> Optional[str]:
-    """检查网段是否与现有接口冲突，返回冲突的接口名"""
-    interfaces = scan_interfaces(ssh)
-    new_network = address.split('/')[0].rsplit('.', 1)[0]  # 10.0.0.1 -> 10.0.0
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
 
-    for iface, net in interfaces:
-        existing_network = net.split('/')[0].rsplit('.', 1)[0]
-        if new_network == existing_network:
-            return iface
-    return None
+
+def parse_listening_ports(output: str) -> set[int]:
+    """解析 ss -tuln 输出中的本地监听端口"""
+    ports = set()
+    for line in output.splitlines():
+        parts = line.split()
+        # Netid State Recv-Q Send-Q Local:Port Peer:Port
+        if len(parts) < 5:
+            continue
+        port = parts[4].rsplit(":", 1)[-1]
+        if port.isdigit():
+            ports.add(int(port))
+    return ports
+
+
+def parse_wg_listen_ports(output: str) -> dict[str, int]:
+    """解析 wg show all listen-port 的输出，返回 {接口: 端口}"""
+    ports = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1].isdigit():
+            ports[parts[0]] = int(parts[1])
+    return ports
+
+
+def parse_routes(output: str) -> tuple[list[tuple[Network, str]], str]:
+    """解析 ip route show / ip -6 route show 的输出
+
+    Returns:
+        ([(目的网段, 出口网卡), ...], 默认路由的出口网卡)，默认路由不在列表中，
+        没有默认路由时网卡为空字符串
+    """
+    routes = []
+    default_iface = ""
+    for line in output.splitlines():
+        parts = line.split()
+        if parts and parts[0] in _ROUTE_TYPES:
+            parts = parts[1:]
+        if not parts:
+            continue
+        dev = parts[parts.index("dev") + 1] if "dev" in parts[:-1] else ""
+        if parts[0] == "default":
+            default_iface = default_iface or dev
+            continue
+        try:
+            routes.append((ipaddress.ip_network(parts[0], strict=False), dev))
+        except ValueError:
+            continue
+    return routes, default_iface
+
+
+@dataclass
+class HostSnapshot:
+    """部署前探测到的服务器状态
+
+    由 probe_host 在一次往返中取回，之后的建议值和校验都在本地计算。
+    """
+    interfaces: list[InterfaceConfig] = field(default_factory=list)
+    # 已监听的端口：ss 报告的端口、运行中 WireGuard 接口的端口和现有配置的 ListenPort
+    ports: set[int] = field(default_factory=set)
+    # 系统中已存在的网络接口（/sys/class/net）
+    links: set[str] = field(default_factory=set)
+    # 运行中的 WireGuard 接口
+    running: set[str] = field(default_factory=set)
+    # 运行中接口的 peer {接口: {公钥: PeerState}}，probe_host(dump=True) 时取回
+    peers: dict[str, dict[str, PeerState]] = field(default_factory=dict)
+    # 非默认路由 [(目的网段, 出口网卡), ...]
+    routes: list[tuple[Network, str]] = field(default_factory=list)
+    default_iface: str = ""
+    # WireGuard 配置目录
+    wg_dir: str = REMOTE_WG_DIR
+
+    def port_in_use(self, port: int) -> bool:
+        return port in self.ports
+
+    def route_conflict(self, address: str) -> Optional[str]:
+        """返回与地址网段重叠的现有路由（不含 WireGuard 接口自身的路由）"""
+        try:
+            network = ipaddress.ip_network(address, strict=False)
+        except ValueError:
+            return None
+        wg_names = {i.name for i in self.interfaces}
+        for route, dev in self.routes:
+            if dev in wg_names or route.version != network.version:
+                continue
+            if route.overlaps(network):
+                return f"{route} dev {dev}" if dev else str(route)
+        return None
+
+    def suggest_interface(self) -> str:
+        """下一个未被占用的 wgN 接口名"""
+        for i in range(256):
+            name = f"wg{i}"
+            if self.validate_interface(name) is None:
+                return name
+        return DEFAULT_INTERFACE
+
+    def suggest_address(self) -> str:
+        """下一个与现有接口和路由都不重叠的 10.0.N.1/24 网段"""
+        for i in range(256):
+            address = f"10.0.{i}.1/24"
+            if (check_network_conflict(self.interfaces, address) is None
+                    and self.route_conflict(address) is None):
+                return address
+        return DEFAULT_ADDRESS
+
+    def suggest_port(self) -> int:
+        """从默认端口起第一个未被占用的端口"""
+        for port in range(DEFAULT_PORT, 65536):
+            if not self.port_in_use(port):
+                return port
+        return DEFAULT_PORT
+
+    def validate_interface(self, interface: str) -> Optional[str]:
+        """校验接口名称，返回错误信息，可用时返回 None"""
+        if not _INTERFACE_NAME.match(interface):
+            return f"接口名称无效: {interface}"
+        if interface in {i.name for i in self.interfaces}:
+            return f"配置文件 {self.wg_dir}/{interface}.conf 已存在"
+        if interface in self.links:
+            return f"网络接口 {interface} 已存在"
+        return None
+
+    def validate_address(self, address: str) -> Optional[str]:
+        """校验地址格式和与现有接口的网段冲突，返回错误信息"""
+        try:
+            ipaddress.ip_interface(address)
+        except ValueError:
+            return f"地址格式无效: {address}"
+        conflict = check_network_conflict(self.interfaces, address)
+        if conflict:
+            return f"网段与接口 {conflict} 冲突"
+        return None
+
+    def validate_port(self, port: int) -> Optional[str]:
+        """校验端口范围和占用，返回错误信息"""
+        if not 1 <= port <= 65535:
+            return f"端口无效: {port}"
+        if self.port_in_use(port):
+            return f"端口 {port} 已被占用"
+        return None
+
+
+def build_interface_config(private_key: str, address: str, port: int, default_iface: str) -> str:
+    """新接口的配置文件内容：转发经接口进入的流量，并在出口网卡上做 NAT
+
+    Args:
+        private_key: 服务端私钥
+        address: 服务端内网地址
+        port: 监听端口
+        default_iface: 出口网卡（默认路由所在网卡）
+    """
+    return Interface.build([
+        ("PrivateKey", private_key),
+        ("Address", address),
+        ("ListenPort", port),
+        ("PostUp", f"iptables -A FORWARD -i %i -j ACCEPT; iptables -t nat -A POSTROUTING -o {default_iface} -j MASQUERADE"),
+        ("PostDown", f"iptables -D FORWARD -i %i -j ACCEPT; iptables -t nat -D POSTROUTING -o {default_iface} -j MASQUERADE"),
+    ]).serialize()
+
+
+@trace.traced("deploy.probe")
+def probe_host(ssh: Transport, dump: bool = False) -> Flow[HostSnapshot]:
+    """在一次往返中取回现有配置、监听端口、网络接口和路由（远程操作流程）
+
+    Args:
+        dump: 是否同时取回运行中接口的 peer（wg show all dump）
+    """
+    scan = InterfaceScan(ssh)
+    batch = ssh.batch()
+    batch.run(scan.command, check=False, description="扫描配置文件")
+    batch.run("ss -tuln", check=False)
+    batch.run("wg show all listen-port", check=False)
+    batch.run("ls /sys/class/net", check=False)
+    # 分两步执行：不支持 IPv6 时 ip -6 失败不影响 IPv4 路由
+    batch.run("ip route show", check=False)
+    batch.run("ip -6 route show", check=False)
+    if dump:
+        batch.run(dump_command(), check=False, description="读取运行状态")
+    _, results = yield batch
+    outputs = [r.output if r.success else "" for r in results]
+    outputs += [""] * (len(batch) - len(outputs))
+    _, listening, wg_ports, links, routes4, routes6 = outputs[:6]
+
+    snapshot = HostSnapshot(wg_dir=ssh.wg_dir)
+    snapshot.interfaces = yield from scan.finish(
+        results[0].output if results and results[0].success else None
+    )
+    running = parse_wg_listen_ports(wg_ports)
+    snapshot.running = set(running)
+    snapshot.ports = parse_listening_ports(listening) | set(running.values())
+    for iface in snapshot.interfaces:
+        section = iface.model.interface
+        if section is not None and section.listen_port is not None:
+            snapshot.ports.add(section.listen_port)
+    snapshot.links = set(links.split())
+    routes, default_iface = parse_routes(routes4)
+    routes6, default_iface6 = parse_routes(routes6)
+    snapshot.routes = routes + routes6
+    snapshot.default_iface = default_iface or default_iface6
+    if dump and len(results) == len(batch) and results[-1].success:
+        snapshot.peers = parse_peer_dump(results[-1].output)
+    return snapshot
 
 
 def deploy_server(
@@ -66,134 +297,108 @@ def deploy_server(
     if ssh is None:
         return False
 
-    # 扫描现有配置
-    existing = scan_interfaces(ssh)
-    if existing:
+    with ssh:
+        return run_flow(ssh, _deploy_server_flow(
+            ssh, server, address, port, interface, interactive
+        ))
+
+
+@trace.traced("deploy")
+def _deploy_server_flow(
+    ssh: Transport,
+    server: str,
+    address: Optional[str],
+    port: Optional[int],
+    interface: Optional[str],
+    interactive: bool
+) -> Flow[bool]:
+    """在已建立的连接上部署 WireGuard 接口（远程操作流程）
+
+    探测和写入各一次往返，接口名、网段和端口的建议值与校验都在本地完成。
+    """
+    # 探测现有配置、端口、网络接口和路由
+    host = yield from probe_host(ssh)
+    if host.interfaces:
         print(f"\n已存在的 WireGuard 接口:")
-        for iface, net in existing:
-            print(f"  - {iface}: {net}")
+        for iface in host.interfaces:
+            print(f"  - {iface.name}: {iface.network}")
         print()
 
-    # 交互式获取配置
     if interactive:
-        # 接口名称
+        # 交互式获取配置，未指定的项以探测结果计算的可用值作为默认值
         if interface is None:
-            suggested_interface = DEFAULT_INTERFACE
-            # 自动建议下一个可用接口
-            existing_names = [i[0] for i in existing]
-            for i in range(10):
-                name = f"wg{i}"
-                if name not in existing_names:
-                    suggested_interface = name
-                    break
-            interface = get_input("接口名称", suggested_interface)
-
-        # 检查配置文件是否已存在
-        config_path = f"{REMOTE_WG_DIR}/{interface}.conf"
-        success, _ = ssh.run_command(f"test -f {config_path} && echo exists")
-        if success:
-            print(f"错误: 配置文件 {config_path} 已存在", file=sys.stderr)
+            interface = get_input("接口名称", host.suggest_interface())
+            if interface is None:
+                return False
+        error = host.validate_interface(interface)
+        if error:
+            print(f"错误: {error}", file=sys.stderr)
             return False
 
-        # 网段
         if address is None:
-            suggested_address = DEFAULT_ADDRESS
-            # 自动建议下一个可用网段
-            existing_networks = set()
-            for _, net in existing:
-                parts = net.split('/')[0].split('.')
-                if len(parts) >= 3:
-                    existing_networks.add(int(parts[2]))
-            for i in range(256):
-                if i not in existing_networks:
-                    suggested_address = f"10.0.{i}.1/24"
-                    break
-            address = get_input("服务端内网地址", suggested_address)
-
-        # 检查网段冲突
-        conflict = check_network_conflict(ssh, address)
-        if conflict:
-            print(f"错误: 网段与接口 {conflict} 冲突", file=sys.stderr)
+            address = get_input("服务端内网地址", host.suggest_address())
+            if address is None:
+                return False
+        error = host.validate_address(address)
+        if error:
+            print(f"错误: {error}", file=sys.stderr)
             return False
 
-        # 端口
         if port is None:
-            suggested_port = DEFAULT_PORT
-            # 检查端口占用，自动建议下一个可用端口
-            while check_port_in_use(ssh, suggested_port):
-                suggested_port += 1
-                if suggested_port > 65535:
-                    suggested_port = 51820
-                    break
-            port = int(get_input("监听端口", str(suggested_port)))
-
-        # 检查端口是否被占用
-        if check_port_in_use(ssh, port):
-            print(f"错误: 端口 {port} 已被占用", file=sys.stderr)
-            return False
+            value = get_input("监听端口", str(host.suggest_port()))
+            if value is None:
+                return False
+            try:
+                port = int(value)
+            except ValueError:
+                print(f"错误: 端口无效: {value}", file=sys.stderr)
+                return False
     else:
         # 非交互模式，使用默认值
         interface = interface or DEFAULT_INTERFACE
         address = address or DEFAULT_ADDRESS
         port = port or DEFAULT_PORT
 
-        # 检查配置文件是否已存在
-        config_path = f"{REMOTE_WG_DIR}/{interface}.conf"
-        success, _ = ssh.run_command(f"test -f {config_path} && echo exists")
-        if success:
-            print(f"错误: 配置文件 {config_path} 已存在", file=sys.stderr)
-            return False
+        for error in (host.validate_interface(interface), host.validate_address(address)):
+            if error:
+                print(f"错误: {error}", file=sys.stderr)
+                return False
 
-        # 检查网段冲突
-        conflict = check_network_conflict(ssh, address)
-        if conflict:
-            print(f"错误: 网段与接口 {conflict} 冲突", file=sys.stderr)
-            return False
+    error = host.validate_port(port)
+    if error:
+        print(f"错误: {error}", file=sys.stderr)
+        return False
 
-        # 检查端口是否被占用
-        if check_port_in_use(ssh, port):
-            print(f"错误: 端口 {port} 已被占用", file=sys.stderr)
-            return False
+    # 与现有路由重叠不一定是错误（例如有意覆盖），只提示
+    route = host.route_conflict(address)
+    if route:
+        print(f"警告: 网段与现有路由 {route} 重叠", file=sys.stderr)
 
     # 生成密钥对
     print("生成密钥对...")
     private_key, public_key = generate_keypair()
 
-    # 检测默认网卡
-    print("检测默认网卡...")
-    success, output = ssh.run_command("ip route show default | awk '{print $5}' | head -1")
-    default_iface = output.strip() if success and output.strip() else "eth0"
+    default_iface = host.default_iface or "eth0"
     print(f"默认网卡: {default_iface}")
 
     # 构建配置
-    config = f"""[Interface]
-PrivateKey = {private_key}
-Address = {address}
-ListenPort = {port}
-PostUp = iptables -A FORWARD -i %i -j ACCEPT; iptables -t nat -A POSTROUTING -o {default_iface} -j MASQUERADE
-PostDown = iptables -D FORWARD -i %i -j ACCEPT; iptables -t nat -D POSTROUTING -o {default_iface} -j MASQUERADE
-"""
-
-    # 确保目录存在
-    ssh.run_command(f"mkdir -p {REMOTE_WG_DIR}")
-
-    # 写入配置文件
-    config_path = f"{REMOTE_WG_DIR}/{interface}.conf"
-    print(f"写入配置文件 {config_path}...")
-    success, msg = ssh.write_remote_file(config_path, config)
-    if not success:
-        print(f"写入配置失败: {msg}", file=sys.stderr)
-        return False
-
-    # 设置权限
-    ssh.run_command(f"chmod 600 {config_path}")
-
-    # 启动服务
-    print("启动 WireGuard 服务...")
-    ssh.run_command(f"systemctl enable wg-quick@{interface}")
-    success, msg = ssh.run_command(f"systemctl start wg-quick@{interface}")
+    config = build_interface_config(private_key, address, port, default_iface)
+
+    # 创建目录、写入配置、设置权限、启动服务在一次往返中完成
+    config_path = ssh.config_path(interface)
+    print(f"写入配置文件 {config_path} 并启动 WireGuard 服务...")
+    batch = ssh.batch()
+    batch.run(f"mkdir -p {shlex.quote(ssh.wg_dir)}", check=False)
+    batch.write_file(config_path, config, mode="600")
+    batch.run(f"systemctl enable wg-quick@{interface}", check=False)
+    batch.run(f"systemctl start wg-quick@{interface}")
+    success, results = yield batch
     if not success:
-        print(f"启动服务失败: {msg}", file=sys.stderr)
+        failed = results[-1]
+        if failed.step.startswith("systemctl start"):
+            print(f"启动服务失败: {failed.output}", file=sys.stderr)
+        else:
+            print(f"写入配置失败: {failed.output}", file=sys.stderr)
         return False
 
     # 输出结果
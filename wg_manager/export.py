@@ -0,0 +1,332 @@
+"""客户端配置导出
+
+按客户端配置模板生成 .conf 文件，并可同时生成内容相同的二维码（PNG / SVG），
+供手机端 WireGuard 扫码导入。
+
+大批量导出时渲染（主要是二维码）在进程池中进行：客户端按块提交，
+同时进行中的块数有上限，每块完成后立即写入输出目录或 zip 归档并释放，
+内存占用与批量大小无关。
+"""
+
+import os
+import re
+import zlib
+import struct
+import zipfile
+import ipaddress
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from dataclasses import dataclass
+from itertools import chain, groupby, islice
+from typing import Callable, Iterable, Iterator, Optional
+
+import qrcode
+
+from . import trace
+from .model import Interface, Peer
+
+# 支持的二维码格式
+QR_FORMATS = ("png", "svg")
+
+# 每个进程池任务渲染的客户端数量；只有一块时在本进程内渲染
+CHUNK_SIZE = 32
+
+
+@dataclass
+class ClientExport:
+    """一个待导出的客户端"""
+    name: str
+    ip: str
+    private_key: str
+    psk: str
+    allowed_ips: str
+    dns: str = ""
+
+
+def build_client_config(
+    ip: str,
+    private_key: str,
+    psk: str,
+    server_config: dict,
+    server: str,
+    allowed_ips: str,
+    dns: str = ""
+) -> str:
+    """构建客户端配置文件内容
+
+    Args:
+        ip: 分配的客户端 IP，如 10.0.0.2/32
+        private_key: 客户端私钥
+        psk: 预共享密钥
+        server_config: parse_config 返回的服务端配置
+        server: 服务器地址（Endpoint 主机部分）
+        allowed_ips: 客户端 AllowedIPs
+        dns: DNS 服务器（留空则不设置）
+    """
+    # 客户端地址使用服务端网段的前缀长度
+    try:
+        prefixlen = ipaddress.ip_network(server_config["address"], strict=False).prefixlen
+        client_address = f"{ip.split('/')[0]}/{prefixlen}"
+    except (KeyError, ValueError):
+        client_address = ip
+
+    interface = Interface.build([
+        ("Address", client_address),
+        ("PrivateKey", private_key),
+        ("DNS", dns),
+    ])
+    peer = Peer.build([
+        ("PublicKey", server_config['public_key']),
+        ("PresharedKey", psk),
+        ("AllowedIPs", allowed_ips),
+        ("Endpoint", f"{server}:{server_config['port']}"),
+        ("PersistentKeepalive", 25),
+    ])
+    return interface.serialize() + "\n" + peer.serialize()
+
+
+def safe_filename(name: str) -> str:
+    """将客户端名称转换为安全的文件名"""
+    cleaned = re.sub(r'[^\w.@-]+', '_', name).strip('._')
+    return cleaned or "peer"
+
+
+def check_qr_formats(formats: Iterable[str]) -> None:
+    """检查二维码格式
+
+    Raises:
+        ValueError: 格式不支持
+    """
+    for fmt in formats:
+        if fmt not in QR_FORMATS:
+            raise ValueError(f"不支持的二维码格式: {fmt}（可选: {', '.join(QR_FORMATS)}）")
+
+
+def _svg(matrix: list[list[bool]], scale: int) -> bytes:
+    """模块矩阵的 SVG 图像：每行连续的深色模块合并为一个矩形路径"""
+    size = len(matrix)
+    path = []
+    for y, row in enumerate(matrix):
+        x = 0
+        for dark, run in groupby(row):
+            width = len(list(run))
+            if dark:
+                path.append(f"M{x} {y}h{width}v1h-{width}z")
+            x += width
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size * scale}" height="{size * scale}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{"".join(path)}" fill="#000"/></svg>\n'
+    ).encode()
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+
+def _png(matrix: list[list[bool]], scale: int) -> bytes:
+    """模块矩阵的 PNG 图像（1 位灰度，直接编码，不依赖图像库）"""
+    size = len(matrix) * scale
+    lines = []
+    for row in matrix:
+        # 灰度 1 为白色；每行补齐到整字节，前面加过滤类型 0
+        bits = "".join("0" * scale if dark else "1" * scale for dark in row)
+        bits += "0" * (-len(bits) % 8)
+        line = b"\x00" + int(bits, 2).to_bytes(len(bits) // 8, "big")
+        lines.extend([line] * scale)
+    header = struct.pack(">IIBBBBB", size, size, 1, 0, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(b"".join(lines), 9))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def qr_matrix(text: str) -> list[list[bool]]:
+    """二维码的模块矩阵（含 2 个模块宽的空白边框）"""
+    code = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L, border=2)
+    code.add_data(text)
+    code.make(fit=True)
+    return code.get_matrix()
+
+
+def render_qr(text: str, fmt: str, scale: int = 8, matrix: Optional[list[list[bool]]] = None) -> bytes:
+    """把文本渲染为二维码图像
+
+    Args:
+        text: 内容（客户端配置）
+        fmt: png 或 svg
+        scale: 每个模块的像素数
+        matrix: 已计算的 qr_matrix(text)，同一内容生成多种格式时复用
+    """
+    matrix = matrix or qr_matrix(text)
+    return _svg(matrix, scale) if fmt == "svg" else _png(matrix, scale)
+
+
+def _render_chunk(
+    clients: list[ClientExport],
+    server_config: dict,
+    server: str,
+    qr_formats: tuple[str, ...]
+) -> list[tuple[str, list[tuple[str, bytes]]]]:
+    """渲染一块客户端，返回 [(名称, [(扩展名, 内容), ...]), ...]（在子进程中执行）"""
+    rendered = []
+    for client in clients:
+        config = build_client_config(
+            client.ip, client.private_key, client.psk,
+            server_config, server, client.allowed_ips, client.dns
+        )
+        files = [("conf", config.encode())]
+        if qr_formats:
+            matrix = qr_matrix(config)
+            files += [(fmt, render_qr(config, fmt, matrix=matrix)) for fmt in qr_formats]
+        rendered.append((client.name, files))
+    return rendered
+
+
+class _DirectoryOutput:
+    """写入输出目录（文件权限 0600，内容含客户端私钥）"""
+
+    def __init__(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+
+    def write(self, filename: str, data: bytes) -> None:
+        path = os.path.join(self.path, filename)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+
+    def close(self) -> None:
+        pass
+
+
+class _ZipOutput:
+    """逐个写入 zip 归档（归档文件权限 0600）"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        self.file = os.fdopen(fd, "wb")
+        self.archive = zipfile.ZipFile(self.file, "w")
+
+    def write(self, filename: str, data: bytes) -> None:
+        info = zipfile.ZipInfo(filename)
+        info.external_attr = 0o600 << 16
+        # 图像已压缩，只压缩配置文件
+        info.compress_type = zipfile.ZIP_DEFLATED if filename.endswith(".conf") else zipfile.ZIP_STORED
+        self.archive.writestr(info, data)
+
+    def close(self) -> None:
+        self.archive.close()
+        self.file.close()
+
+
+def _chunks(clients: Iterable[ClientExport]) -> Iterator[list[ClientExport]]:
+    it = iter(clients)
+    while chunk := list(islice(it, CHUNK_SIZE)):
+        yield chunk
+
+
+def export_clients(
+    clients: Iterable[ClientExport],
+    server_config: dict,
+    server: str,
+    output: str,
+    qr_formats: Iterable[str] = (),
+    workers: Optional[int] = None,
+    on_exported: Optional[Callable[[str], None]] = None,
+    used: Optional[set[str]] = None
+) -> int:
+    """导出客户端配置和二维码
+
+    每个客户端输出 <名称>.conf 及 <名称>.png / <名称>.svg，
+    文件名冲突时追加序号。clients 可以是生成器，按需读取。
+
+    Args:
+        clients: 待导出的客户端
+        server_config: 服务端配置（见 build_client_config）
+        server: 服务器地址（Endpoint 主机部分）
+        output: 输出目录；以 .zip 结尾时写入 zip 归档
+        qr_formats: 同时生成的二维码格式（png / svg）
+        workers: 渲染进程数，默认 CPU 核数；为 1 时在本进程内渲染
+        on_exported: 每个客户端写出后的回调，参数为客户端名称
+        used: 已使用的文件名（不含扩展名），导出时加入新的文件名；
+            多次导出到同一目录时传入同一个集合，避免不同批次的同名客户端互相覆盖
+
+    Returns:
+        导出的客户端数量
+
+    Raises:
+        ValueError: 二维码格式不支持
+        OSError: 写入输出失败
+    """
+    qr_formats = tuple(dict.fromkeys(qr_formats))
+    check_qr_formats(qr_formats)
+    # 子进程中不能按需推导公钥，先取出需要的字段
+    render_args = ({
+        "address": server_config.get("address", ""),
+        "port": server_config["port"],
+        "public_key": server_config["public_key"],
+    }, server, qr_formats)
+    workers = workers or os.cpu_count() or 1
+
+    chunks = _chunks(clients)
+    head = list(islice(chunks, 2))
+    chunks = chain(head, chunks)
+    # 只有一块或不生成二维码时在本进程内渲染（配置文本的渲染开销小于进程间传输）
+    parallel = len(head) > 1 and workers > 1 and bool(qr_formats)
+
+    sink = _ZipOutput(output) if output.endswith(".zip") else _DirectoryOutput(output)
+    used = set() if used is None else used
+    count = 0
+
+    def write(rendered: list[tuple[str, list[tuple[str, bytes]]]]) -> None:
+        nonlocal count
+        for name, files in rendered:
+            stem = unique = safe_filename(name)
+            n = 1
+            while unique in used:
+                n += 1
+                unique = f"{stem}-{n}"
+            used.add(unique)
+            for ext, data in files:
+                sink.write(f"{unique}.{ext}", data)
+            count += 1
+            if on_exported is not None:
+                on_exported(name)
+
+    with trace.span("export.clients", qr=",".join(qr_formats), parallel=parallel) as span:
+        try:
+            if parallel:
+                _export_parallel(chunks, write, workers, render_args)
+            else:
+                for chunk in chunks:
+                    write(_render_chunk(chunk, *render_args))
+        finally:
+            sink.close()
+        span.set(count=count)
+    return count
+
+
+def _export_parallel(
+    chunks: Iterable[list[ClientExport]],
+    write: Callable[[list], None],
+    workers: int,
+    render_args: tuple
+) -> None:
+    """在进程池中渲染，进行中的块数不超过进程数的两倍，按完成顺序写出"""
+    pending = set()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk in chunks:
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(future.result())
+            pending.add(pool.submit(_render_chunk, chunk, *render_args))
+        for future in as_completed(pending):
+            write(future.result())
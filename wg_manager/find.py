@@ -0,0 +1,81 @@
+"""在客户端索引中查找客户端
+
+按名称（可用 glob 模式）、公钥或地址在所有已扫描主机的客户端索引中查找，
+指定主机清单时先并发扫描这些主机刷新索引（只有配置文件变化的主机会重建）。
+"""
+
+import sys
+from typing import Optional
+
+from .cache import cache_enabled
+from .fleet import DEFAULT_PARALLEL, DEFAULT_HOST_TIMEOUT, run_on_hosts
+from .index import PeerIndex
+from .inventory import InventoryHost
+from .parser import InterfaceScan
+from .session import connect_ssh
+from .transport import Flow, RemoteCommand, Transport, run_flow
+
+
+def _refresh_flow(ssh: Transport) -> Flow[bool]:
+    """扫描配置目录（远程操作流程），返回扫描是否成功"""
+    scan = InterfaceScan(ssh)
+    success, output = yield RemoteCommand(scan.command)
+    if not success:
+        print(f"扫描配置目录失败: {output}", file=sys.stderr)
+        return False
+    yield from scan.finish(output)
+    if not scan.success:
+        print("重新取回配置文件失败", file=sys.stderr)
+    return scan.success
+
+
+def refresh_host(host: InventoryHost) -> bool:
+    """扫描一台主机的配置目录，增量更新客户端索引"""
+    ssh, _ = connect_ssh(host.host, host.port, host.key_file)
+    if ssh is None:
+        return False
+    with ssh:
+        return run_flow(ssh, _refresh_flow(ssh))
+
+
+def find_peers(
+    query: str,
+    hosts: Optional[list[InventoryHost]] = None,
+    parallel: int = DEFAULT_PARALLEL,
+    timeout: float = DEFAULT_HOST_TIMEOUT
+) -> bool:
+    """查找客户端
+
+    Args:
+        query: 客户端名称（可用 * ? [ 通配）、公钥或地址（如 10.0.0.2 或 10.0.1.0/24）
+        hosts: 查找前先刷新索引的主机（留空则只查找已有索引）
+        parallel: 刷新时的最大并发数
+        timeout: 刷新时单台主机的超时（秒）
+
+    Returns:
+        是否找到
+    """
+    if not cache_enabled():
+        print("错误: 客户端索引与本地缓存一起被禁用（--no-cache / WG_MANAGER_NO_CACHE）",
+              file=sys.stderr)
+        return False
+
+    if hosts:
+        print(f"刷新 {len(hosts)} 台主机的客户端索引（并发 {parallel}）...")
+        results = run_on_hosts(hosts, refresh_host, parallel, timeout, on_result=None)
+        for result in results:
+            if not result.success:
+                lines = result.output.strip().splitlines()
+                reason = "超时" if result.timed_out else (result.error or (lines[-1] if lines else ""))
+                print(f"警告: {result.host.name} 刷新失败: {reason}", file=sys.stderr)
+
+    index = PeerIndex()
+    found = index.find(query)
+    if not found:
+        print(f"未找到客户端: {query}（索引中共 {len(index.hosts())} 台主机）", file=sys.stderr)
+        return False
+
+    for loc in sorted(found, key=lambda loc: (loc.host, loc.interface, loc.name)):
+        name = loc.name or "(未命名)"
+        print(f"  - {loc.host} {loc.interface}: {name} {loc.allowed_ips}  {loc.public_key}")
+    return True
@@ -0,0 +1,210 @@
+"""多主机并发执行
+
+在清单中的一组主机上并发执行 list / deploy / add / remove 等操作：
+并发数有上限，每台主机有独立超时，各主机的输出分别捕获，
+按主机成组输出，不会交错。
+
+主机超时时中止其工作线程中建立的连接（终止执行中的 ssh 进程、关闭复用会话），
+该主机的后续远程调用直接失败；中止前已发出的命令可能已在服务器上执行。
+"""
+
+import io
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from .inventory import InventoryHost
+from .transport import Transport, track_transports
+
+
+# 默认并发数与单台主机超时（秒）
+DEFAULT_PARALLEL = 8
+DEFAULT_HOST_TIMEOUT = 300
+
+# 中止超时主机的连接后等待其工作线程结束的时间（秒）
+ABORT_GRACE = 5
+
+
+@dataclass
+class HostResult:
+    """单台主机的执行结果"""
+    host: InventoryHost
+    success: bool
+    output: str
+    elapsed: float
+    error: str = ""
+    timed_out: bool = False
+
+
+class _ThreadLocalStream(io.TextIOBase):
+    """按线程分流的输出流
+
+    注册了捕获缓冲区的线程写入各自的缓冲区，其他线程写入原始流。
+    """
+
+    def __init__(self, original):
+        self.original = original
+        self._local = threading.local()
+
+    def capture(self, buffer: Optional[io.StringIO]) -> None:
+        self._local.buffer = buffer
+
+    def write(self, text: str) -> int:
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is not None:
+            return buffer.write(text)
+        return self.original.write(text)
+
+    def flush(self) -> None:
+        if getattr(self._local, "buffer", None) is None:
+            self.original.flush()
+
+
+_install_lock = threading.Lock()
+
+
+def _install_streams() -> tuple[_ThreadLocalStream, _ThreadLocalStream]:
+    """安装（或复用已安装的）按线程分流的 stdout / stderr"""
+    with _install_lock:
+        if not isinstance(sys.stdout, _ThreadLocalStream):
+            sys.stdout = _ThreadLocalStream(sys.stdout)
+        if not isinstance(sys.stderr, _ThreadLocalStream):
+            sys.stderr = _ThreadLocalStream(sys.stderr)
+        return sys.stdout, sys.stderr
+
+
+def _uninstall_streams() -> None:
+    with _install_lock:
+        if isinstance(sys.stdout, _ThreadLocalStream):
+            sys.stdout = sys.stdout.original
+        if isinstance(sys.stderr, _ThreadLocalStream):
+            sys.stderr = sys.stderr.original
+
+
+def print_host_result(result: HostResult) -> None:
+    """按主机成组输出执行结果"""
+    if result.timed_out:
+        status = "超时"
+    else:
+        status = "成功" if result.success else "失败"
+    print(f"===== {result.host.name} ({result.host.host}) [{status}, {result.elapsed:.1f}s] =====")
+    output = result.output.rstrip()
+    if output:
+        print(output)
+    if result.error:
+        print(f"错误: {result.error}")
+    print()
+
+
+def run_on_hosts(
+    hosts: list[InventoryHost],
+    func: Callable[[InventoryHost], bool],
+    parallel: int = DEFAULT_PARALLEL,
+    timeout: float = DEFAULT_HOST_TIMEOUT,
+    on_result: Optional[Callable[[HostResult], None]] = print_host_result
+) -> list[HostResult]:
+    """在多台主机上并发执行操作
+
+    执行期间 stdin 被替换为空输入，需要交互的操作会直接取消而不会阻塞。
+
+    Args:
+        hosts: 主机列表
+        func: 对单台主机执行的操作，返回是否成功
+        parallel: 最大并发数
+        timeout: 单台主机超时（秒），从该主机开始执行时计时
+        on_result: 每台主机完成时的回调（按完成顺序），默认按主机成组打印输出
+
+    Returns:
+        与 hosts 顺序一致的结果列表
+    """
+    stdout, stderr = _install_streams()
+    original_stdin = sys.stdin
+    sys.stdin = io.StringIO("")
+
+    abandoned = False
+    started: dict[int, float] = {}
+    aborted: dict[int, float] = {}
+    buffers: dict[int, io.StringIO] = {}
+    transports: dict[int, list[Transport]] = {}
+    results: dict[int, HostResult] = {}
+
+    def task(index: int) -> bool:
+        buffer = io.StringIO()
+        buffers[index] = buffer
+        transports[index] = []
+        started[index] = time.monotonic()
+        stdout.capture(buffer)
+        stderr.capture(buffer)
+        try:
+            with track_transports(transports[index]):
+                return bool(func(hosts[index]))
+        finally:
+            stdout.capture(None)
+            stderr.capture(None)
+
+    def timed_out(index: int, now: float) -> HostResult:
+        return HostResult(
+            hosts[index], False, buffers[index].getvalue(), now - started[index],
+            error=f"超过 {timeout:g}s 未完成，已中止连接（中止前发出的命令可能已执行，请检查该主机）",
+            timed_out=True
+        )
+
+    def finish(index: int, result: HostResult) -> None:
+        results[index] = result
+        if on_result is not None:
+            # 回调在主线程执行，输出直接写入原始流
+            on_result(result)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, parallel))
+    try:
+        pending = {executor.submit(task, i): i for i in range(len(hosts))}
+        while pending:
+            done, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future in done:
+                index = pending.pop(future)
+                if index in aborted:
+                    finish(index, timed_out(index, aborted[index]))
+                    continue
+                elapsed = now - started.get(index, now)
+                output = buffers[index].getvalue() if index in buffers else ""
+                try:
+                    success, error = future.result(), ""
+                except BaseException as e:
+                    success, error = False, str(e) or type(e).__name__
+                finish(index, HostResult(hosts[index], success, output, elapsed, error))
+
+            for future, index in list(pending.items()):
+                if index in aborted:
+                    if now - aborted[index] > ABORT_GRACE:
+                        # 线程无法强制终止，中止连接后仍未结束时放弃等待
+                        pending.pop(future)
+                        abandoned = True
+                        finish(index, timed_out(index, aborted[index]))
+                elif index in started and now - started[index] > timeout:
+                    aborted[index] = now
+                    for transport in transports[index]:
+                        transport.abort()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        sys.stdin = original_stdin
+        # 仍有超时线程在运行时保留分流流，避免其输出混入终端
+        if not abandoned:
+            _uninstall_streams()
+
+    return [results[i] for i in range(len(hosts))]
+
+
+def summarize(results: list[HostResult]) -> str:
+    """执行结果汇总"""
+    ok = sum(1 for r in results if r.success)
+    timed_out = sum(1 for r in results if r.timed_out)
+    failed = len(results) - ok - timed_out
+    line = f"共 {len(results)} 台主机: 成功 {ok}，失败 {failed}，超时 {timed_out}"
+    bad = [r.host.name for r in results if not r.success]
+    if bad:
+        line += f"\n未成功: {', '.join(bad)}"
+    return line
@@ -0,0 +1,276 @@
+"""跨主机的客户端索引
+
+按主机保存扫描到的客户端（接口、名称、公钥、AllowedIPs）及各配置文件的远程指纹，
+加载后按名称、公钥和地址建立字典，查找为 O(1)。
+
+索引随扫描增量更新：每次扫描某台主机的配置目录（list、add、remove、status 等）
+都会把结果交给 update_host，只有配置文件指纹发生变化的主机才会重建并写回；
+add / remove 成功后也会立即更新对应主机的条目。
+
+索引文件保存在缓存目录的 index 子目录中（每台主机一个文件），
+不包含密钥；与配置缓存一样可用 --no-cache / WG_MANAGER_NO_CACHE=1 禁用。
+"""
+
+import os
+import json
+import fnmatch
+import hashlib
+import tempfile
+import threading
+import ipaddress
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from .cache import default_cache_dir
+from .model import Peer
+
+
+@dataclass(frozen=True)
+class PeerLocation:
+    """索引中的一个客户端"""
+    host: str
+    interface: str
+    name: str
+    public_key: str
+    # 多个值以 ", " 连接
+    allowed_ips: str
+
+
+def default_index_dir() -> str:
+    """默认索引目录"""
+    return os.path.join(default_cache_dir(), "index")
+
+
+def ip_key(value: str) -> Optional[str]:
+    """地址的索引键：单个地址（/32、/128 或不带前缀）为地址本身，网段为 CIDR"""
+    try:
+        iface = ipaddress.ip_interface(value.strip())
+    except ValueError:
+        return None
+    if iface.network.prefixlen == iface.max_prefixlen:
+        return str(iface.ip)
+    return str(iface.network)
+
+
+def _peer_row(interface: str, peer: Peer) -> list[str]:
+    return [interface, peer.name, peer.public_key, ", ".join(peer.allowed_ips)]
+
+
+class PeerIndex:
+    """跨主机的客户端索引
+
+    Args:
+        directory: 索引目录，默认 default_index_dir()
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or default_index_dir()
+        self._lock = threading.Lock()
+        # 主机 -> {"host", "fingerprints": {路径: 指纹}, "peers": [[接口, 名称, 公钥, 地址], ...]}
+        self._hosts: dict[str, dict] = {}
+        self._loaded = False
+        self._by_name: dict[str, list[PeerLocation]] = defaultdict(list)
+        self._by_key: dict[str, list[PeerLocation]] = defaultdict(list)
+        self._by_ip: dict[str, list[PeerLocation]] = defaultdict(list)
+
+    def _entry_path(self, host: str) -> str:
+        digest = hashlib.sha256(host.encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def _read(self, path: str) -> Optional[dict]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or "host" not in entry:
+            return None
+        return entry
+
+    def _write(self, entry: dict) -> None:
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp, self._entry_path(entry["host"]))
+        except OSError:
+            pass
+
+    def _load_all(self) -> None:
+        """首次查找时加载全部主机的条目并建立字典"""
+        if self._loaded:
+            return
+        try:
+            with os.scandir(self.directory) as it:
+                paths = [e.path for e in it if e.name.endswith(".json")]
+        except OSError:
+            paths = []
+        for path in paths:
+            entry = self._read(path)
+            if entry is not None and entry["host"] not in self._hosts:
+                self._hosts[entry["host"]] = entry
+        for entry in self._hosts.values():
+            self._add_to_maps(entry)
+        self._loaded = True
+
+    def _locations(self, entry: dict) -> Iterable[PeerLocation]:
+        for interface, name, public_key, allowed_ips in entry.get("peers", []):
+            yield PeerLocation(entry["host"], interface, name, public_key, allowed_ips)
+
+    def _map_keys(self, loc: PeerLocation) -> Iterable[tuple[dict, str]]:
+        """客户端在各字典中的键"""
+        if loc.name:
+            yield self._by_name, loc.name
+        if loc.public_key:
+            yield self._by_key, loc.public_key
+        for value in loc.allowed_ips.split(","):
+            key = ip_key(value)
+            if key:
+                yield self._by_ip, key
+
+    def _add_to_maps(self, entry: dict) -> None:
+        for loc in self._locations(entry):
+            for mapping, key in self._map_keys(loc):
+                mapping[key].append(loc)
+
+    def _remove_from_maps(self, entry: dict) -> None:
+        host = entry["host"]
+        for loc in self._locations(entry):
+            for mapping, key in self._map_keys(loc):
+                remaining = [other for other in mapping.get(key, []) if other.host != host]
+                if remaining:
+                    mapping[key] = remaining
+                else:
+                    mapping.pop(key, None)
+
+    def _entry(self, host: str) -> Optional[dict]:
+        if host not in self._hosts:
+            entry = self._read(self._entry_path(host))
+            if entry is None or entry["host"] != host:
+                return None
+            self._hosts[host] = entry
+        return self._hosts[host]
+
+    def _replace(self, entry: dict) -> None:
+        """替换主机条目并写回"""
+        old = self._hosts.get(entry["host"])
+        if self._loaded:
+            if old is not None:
+                self._remove_from_maps(old)
+            self._add_to_maps(entry)
+        self._hosts[entry["host"]] = entry
+        self._write(entry)
+
+    def update_host(self, host: str, interfaces: list) -> bool:
+        """用一次完整扫描的结果更新主机条目
+
+        Args:
+            host: 主机标识（Transport.cache_key）
+            interfaces: 该主机配置目录的扫描结果（parser.InterfaceConfig 列表）
+
+        Returns:
+            是否有变化（所有配置文件指纹都与索引一致时不重建，返回 False）
+        """
+        fingerprints = {i.path: i.fingerprint for i in interfaces}
+        with self._lock:
+            old = self._entry(host)
+            if (old is not None and all(fingerprints.values())
+                    and old.get("fingerprints") == fingerprints):
+                return False
+            peers = [
+                _peer_row(iface.name, peer)
+                for iface in interfaces for peer in iface.model.peers if peer.public_key
+            ]
+            self._replace({"host": host, "fingerprints": fingerprints, "peers": peers})
+            return True
+
+    def add_peers(
+        self,
+        host: str,
+        interface: str,
+        peers: list[Peer],
+        path: str = "",
+        fingerprint: str = ""
+    ) -> None:
+        """记录刚添加的客户端
+
+        给出配置文件 path 修改后的指纹时沿用条目中的其他指纹（下次扫描无需重建），
+        否则该主机下次扫描时按指纹重建。
+        """
+        with self._lock:
+            old = self._entry(host) or {"host": host, "peers": []}
+            rows = old.get("peers", []) + [_peer_row(interface, peer) for peer in peers]
+            fingerprints = dict(old.get("fingerprints", {}))
+            if fingerprint and path in fingerprints:
+                fingerprints[path] = fingerprint
+            else:
+                fingerprints = {}
+            self._replace({"host": host, "fingerprints": fingerprints, "peers": rows})
+
+    def remove_peers(self, host: str, interface: str, public_keys: Iterable[str]) -> None:
+        """移除已删除的客户端（该主机下次扫描时按指纹重建）"""
+        keys = set(public_keys)
+        with self._lock:
+            old = self._entry(host)
+            if old is None:
+                return
+            rows = [row for row in old.get("peers", [])
+                    if not (row[0] == interface and row[2] in keys)]
+            self._replace({"host": host, "fingerprints": {}, "peers": rows})
+
+    def forget_host(self, host: str) -> None:
+        """删除主机的条目"""
+        with self._lock:
+            old = self._entry(host)
+            if old is None:
+                return
+            if self._loaded:
+                self._remove_from_maps(old)
+            del self._hosts[host]
+            try:
+                os.remove(self._entry_path(host))
+            except OSError:
+                pass
+
+    def hosts(self) -> list[str]:
+        """索引中的主机"""
+        with self._lock:
+            self._load_all()
+            return sorted(self._hosts)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load_all()
+            return sum(len(entry.get("peers", [])) for entry in self._hosts.values())
+
+    def find_name(self, name: str) -> list[PeerLocation]:
+        with self._lock:
+            self._load_all()
+            return list(self._by_name.get(name, []))
+
+    def find_key(self, public_key: str) -> list[PeerLocation]:
+        with self._lock:
+            self._load_all()
+            return list(self._by_key.get(public_key, []))
+
+    def find_ip(self, address: str) -> list[PeerLocation]:
+        """按地址查找：单个地址（如 10.0.0.2 或 10.0.0.2/32）或网段（如 10.0.1.0/24）"""
+        key = ip_key(address)
+        if key is None:
+            return []
+        with self._lock:
+            self._load_all()
+            return list(self._by_ip.get(key, []))
+
+    def find(self, query: str) -> list[PeerLocation]:
+        """按名称、公钥或地址查找；名称包含 * ? [ 时按 glob 模式匹配（遍历全部名称）"""
+        if any(c in query for c in "*?["):
+            with self._lock:
+                self._load_all()
+                return [loc for name, locs in self._by_name.items()
+                        if fnmatch.fnmatchcase(name, query) for loc in locs]
+
+        found = self.find_name(query) + self.find_key(query) + self.find_ip(query)
+        return list(dict.fromkeys(found))
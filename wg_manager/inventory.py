@@ -0,0 +1,178 @@
+"""主机清单（inventory）
+
+清单文件为 JSON 或 YAML，格式如下::
+
+    defaults:            # 可选，所有主机的默认值
+      user: root
+      port: 22
+      key_file: ~/.ssh/id_ed25519
+    hosts:
+      - name: gw-tokyo-1
+        host: 1.2.3.4    # 可写成 user@host
+        groups: [edge, asia]
+      - name: gw-sfo-1
+        host: admin@5.6.7.8
+        port: 2222
+    groups:              # 可选，另一种分组写法
+      core: [gw-sfo-1]
+
+hosts 也可以写成 {name: {host: ..., ...}} 的映射。
+每台主机自动属于 all 组。
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+from .loader import load_data
+from .ssh import parse_host
+from .transport import parse_local_target
+
+
+@dataclass
+class InventoryHost:
+    """清单中的一台主机"""
+    name: str
+    host: str
+    port: int = 22
+    key_file: Optional[str] = None
+    groups: list[str] = field(default_factory=list)
+
+
+class Inventory:
+    """主机清单"""
+
+    def __init__(self, hosts: list[InventoryHost]):
+        self.hosts = hosts
+        self._by_name = {h.name: h for h in hosts}
+
+    def __len__(self) -> int:
+        return len(self.hosts)
+
+    def get(self, name: str) -> Optional[InventoryHost]:
+        return self._by_name.get(name)
+
+    @property
+    def groups(self) -> list[str]:
+        """所有组名（不含 all）"""
+        return sorted({g for h in self.hosts for g in h.groups})
+
+    def select(
+        self,
+        groups: Optional[list[str]] = None,
+        names: Optional[list[str]] = None
+    ) -> list[InventoryHost]:
+        """按组或主机名筛选主机，保持清单顺序
+
+        Args:
+            groups: 组名列表，all 表示所有主机
+            names: 主机名列表
+
+        Returns:
+            主机列表；groups 和 names 都为空时返回所有主机
+
+        Raises:
+            ValueError: 组或主机不存在
+        """
+        if not groups and not names:
+            return list(self.hosts)
+
+        unknown = [n for n in names or [] if n not in self._by_name]
+        if unknown:
+            raise ValueError(f"主机不存在: {', '.join(unknown)}")
+        known_groups = set(self.groups) | {"all"}
+        unknown = [g for g in groups or [] if g not in known_groups]
+        if unknown:
+            raise ValueError(f"组不存在: {', '.join(unknown)}")
+
+        wanted_groups = set(groups or [])
+        wanted_names = set(names or [])
+        return [
+            h for h in self.hosts
+            if h.name in wanted_names
+            or "all" in wanted_groups
+            or wanted_groups.intersection(h.groups)
+        ]
+
+
+def parse_host_entry(name: Optional[str], entry, defaults: dict) -> InventoryHost:
+    """解析一个主机条目（清单或状态文件中的 hosts 项）
+
+    Args:
+        name: 映射写法中的主机名，列表写法时为 None
+        entry: 条目内容，字符串视为地址
+        defaults: 清单的 defaults（user、port、key_file）
+
+    Raises:
+        ValueError: 条目格式无效或缺少地址
+    """
+    if isinstance(entry, str):
+        entry = {"host": entry}
+    if not isinstance(entry, dict):
+        raise ValueError(f"主机条目格式无效: {entry!r}")
+
+    address = entry.get("host") or entry.get("address") or name
+    name = entry.get("name") or name or address
+    if not address:
+        raise ValueError(f"主机条目缺少 host: {entry!r}")
+
+    if parse_local_target(str(address)) is not None:
+        # 本地执行目标原样保留，见 session.connect_ssh
+        target = str(address)
+    else:
+        user, server = parse_host(str(address))
+        if "@" not in str(address):
+            user = entry.get("user") or defaults.get("user") or user
+        target = f"{user}@{server}"
+
+    key_file = entry.get("key_file", defaults.get("key_file"))
+    groups = entry.get("groups", [])
+    if isinstance(groups, str):
+        groups = [groups]
+
+    return InventoryHost(
+        name=str(name),
+        host=target,
+        port=int(entry.get("port", defaults.get("port", 22))),
+        key_file=os.path.expanduser(key_file) if key_file else None,
+        groups=[str(g) for g in groups],
+    )
+
+
+def load_inventory(path: str) -> Inventory:
+    """加载清单文件
+
+    Args:
+        path: 清单文件路径（.json / .yaml / .yml）
+
+    Raises:
+        ValueError: 文件格式或内容无效
+    """
+    data = load_data(path)
+    if isinstance(data, list):
+        data = {"hosts": data}
+    if not isinstance(data, dict):
+        raise ValueError("清单内容应为对象或主机列表")
+
+    defaults = data.get("defaults") or {}
+    raw_hosts = data.get("hosts") or []
+    if isinstance(raw_hosts, dict):
+        entries = list(raw_hosts.items())
+    else:
+        entries = [(None, e) for e in raw_hosts]
+
+    hosts = [parse_host_entry(name, entry, defaults) for name, entry in entries]
+    names = [h.name for h in hosts]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        raise ValueError(f"主机名重复: {', '.join(duplicates)}")
+
+    by_name = {h.name: h for h in hosts}
+    for group, members in (data.get("groups") or {}).items():
+        for member in members or []:
+            if member not in by_name:
+                raise ValueError(f"组 {group} 中的主机不存在: {member}")
+            if group not in by_name[member].groups:
+                by_name[member].groups.append(str(group))
+
+    return Inventory(hosts)
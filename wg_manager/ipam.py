@@ -0,0 +1,239 @@
+"""客户端 IP 地址分配
+
+每个接口网段对应一个 AddressPool，用位图记录已用地址（每个地址 1 bit），
+支持任意 IPv4 前缀长度和 IPv6（如 fd00::/64 这样的 ULA 网段）。
+
+分配从游标处查找第一个空闲位，游标只在释放地址时回退，
+顺序分配的均摊开销为常数。IPv6 网段地址数量极大，只在前
+MAX_POOL_ADDRESSES 个地址中分配，位图按需增长。
+"""
+
+import re
+import ipaddress
+from typing import Iterable, Optional, Union
+
+IPAddress = Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+# 单个地址池可分配的最大地址数（位图最大 2MB）
+MAX_POOL_ADDRESSES = 1 << 24
+
+# 位图初始大小（字节），按需倍增
+_INITIAL_BITMAP_BYTES = 1024
+
+# 匹配未占满的字节
+_NOT_FULL = re.compile(rb"[^\xff]")
+
+
+def host_prefix(address: str) -> str:
+    """地址对应的单主机前缀，如 10.0.0.2 -> 10.0.0.2/32，fd00::2 -> fd00::2/128"""
+    ip = ipaddress.ip_address(address.split('/')[0].strip())
+    return f"{ip}/{ip.max_prefixlen}"
+
+
+def address_span(network: IPNetwork, item: str) -> tuple[int, int]:
+    """地址 / CIDR / "起始-结束" 相对网段起始地址的偏移区间 [start, end)（不截断到网段）
+
+    Raises:
+        ValueError: 格式无效
+    """
+    item = item.strip()
+    base = int(network.network_address)
+    if '-' in item:
+        first, last = (ipaddress.ip_address(p.strip()) for p in item.split('-', 1))
+        if first.version != network.version or last < first:
+            raise ValueError(f"地址范围无效: {item}")
+        return int(first) - base, int(last) - base + 1
+    net = ipaddress.ip_network(item, strict=False)
+    if net.version != network.version:
+        return 0, 0
+    start = int(net.network_address) - base
+    return start, start + net.num_addresses
+
+
+def used_span(network: IPNetwork, item: str) -> Optional[tuple[int, int]]:
+    """已用地址或 CIDR（如 AllowedIPs 的一项）的偏移区间
+
+    只有完全包含在网段内的 CIDR 才算占用，如 0.0.0.0/0 不会占满地址池；
+    不在网段内或格式无效时为 None。
+    """
+    try:
+        net = ipaddress.ip_network(item.strip(), strict=False)
+    except ValueError:
+        return None
+    if net.version != network.version or not net.subnet_of(network):
+        return None
+    start = int(net.network_address) - int(network.network_address)
+    return start, start + net.num_addresses
+
+
+class AddressPool:
+    """网段内的地址池
+
+    网络地址、IPv4 广播地址（/31、/32 除外）以及 reserved 中的地址不会被分配。
+
+    Args:
+        network: 网段，可带主机位，如 10.0.0.1/24、fd00::1/64
+        reserved: 保留地址或范围，每项为地址、CIDR 或 "起始-结束"
+        used: 已使用的地址或 CIDR
+
+    Raises:
+        ValueError: 网段、保留范围格式无效
+    """
+
+    def __init__(
+        self,
+        network: Union[str, IPNetwork],
+        reserved: Iterable[str] = (),
+        used: Iterable[str] = ()
+    ):
+        self.network: IPNetwork = ipaddress.ip_network(network, strict=False)
+        self.size = min(self.network.num_addresses, MAX_POOL_ADDRESSES)
+        self._base = int(self.network.network_address)
+        self._address_type = type(self.network.network_address)
+        self._bitmap = bytearray(min(_INITIAL_BITMAP_BYTES, (self.size + 7) // 8))
+        self._cursor = 0
+        self._used = 0
+
+        self._mark_range(0, 1)
+        if self.network.version == 4 and self.network.prefixlen < 31:
+            self._mark_range(self.network.num_addresses - 1, self.network.num_addresses)
+        for item in reserved:
+            self.reserve(item)
+        for item in used:
+            self.mark_used(item)
+
+    def _ensure(self, offset: int) -> None:
+        """保证位图覆盖 offset"""
+        needed = offset // 8 + 1
+        if needed > len(self._bitmap):
+            size = len(self._bitmap)
+            while size < needed:
+                size *= 2
+            size = min(size, (self.size + 7) // 8)
+            self._bitmap.extend(bytes(size - len(self._bitmap)))
+
+    def _test(self, offset: int) -> bool:
+        byte = offset >> 3
+        return byte < len(self._bitmap) and bool(self._bitmap[byte] & (1 << (offset & 7)))
+
+    def _mark_range(self, start: int, end: int) -> int:
+        """标记 [start, end) 为已用（截断到池范围），返回新标记的数量"""
+        start, end = max(start, 0), min(end, self.size)
+        if start >= end:
+            return 0
+        self._ensure(end - 1)
+        marked = 0
+        # 首尾不完整的字节逐位处理，中间整字节一次填满
+        full_start, full_end = -(-start // 8), end // 8
+        if full_start >= full_end:
+            bits = range(start, end)
+        else:
+            bits = [*range(start, full_start * 8), *range(full_end * 8, end)]
+            chunk = self._bitmap[full_start:full_end]
+            marked += len(chunk) * 8 - int.from_bytes(chunk, "little").bit_count()
+            self._bitmap[full_start:full_end] = b"\xff" * len(chunk)
+        for offset in bits:
+            mask = 1 << (offset & 7)
+            if not self._bitmap[offset >> 3] & mask:
+                self._bitmap[offset >> 3] |= mask
+                marked += 1
+        self._used += marked
+        return marked
+
+    def reserve(self, item: str) -> int:
+        """保留地址或范围（不在网段内的部分忽略），返回新保留的数量"""
+        return self._mark_range(*address_span(self.network, item))
+
+    def mark_used(self, item: str) -> int:
+        """标记已使用的地址或 CIDR，不在网段内或格式无效时忽略
+
+        只有完全包含在网段内的 CIDR 才会标记，
+        如 AllowedIPs 中的 0.0.0.0/0 不会占满地址池。
+
+        Returns:
+            新标记的数量
+        """
+        span = used_span(self.network, item)
+        return self._mark_range(*span) if span is not None else 0
+
+    def release(self, address: str) -> bool:
+        """释放地址，返回该地址之前是否已被使用"""
+        try:
+            ip = ipaddress.ip_address(address.split('/')[0].strip())
+        except ValueError:
+            return False
+        offset = int(ip) - self._base
+        if not 0 <= offset < self.size or not self._test(offset):
+            return False
+        self._bitmap[offset >> 3] &= ~(1 << (offset & 7)) & 0xff
+        self._used -= 1
+        self._cursor = min(self._cursor, offset)
+        return True
+
+    def __contains__(self, address: str) -> bool:
+        """地址是否已被使用或保留"""
+        try:
+            ip = ipaddress.ip_address(address.split('/')[0].strip())
+        except ValueError:
+            return False
+        offset = int(ip) - self._base
+        return 0 <= offset < self.size and self._test(offset)
+
+    @property
+    def free_count(self) -> int:
+        """剩余可分配地址数"""
+        return self.size - self._used
+
+    def _next_free(self, start: int) -> Optional[int]:
+        """从 start 开始的第一个空闲偏移"""
+        byte = start >> 3
+        while True:
+            match = _NOT_FULL.search(self._bitmap, byte)
+            if match is None:
+                # 已有位图全满，扩展后从新区域继续
+                if len(self._bitmap) * 8 >= self.size:
+                    return None
+                byte = len(self._bitmap)
+                self._ensure(len(self._bitmap) * 8)
+                continue
+            byte = match.start()
+            value = self._bitmap[byte]
+            for bit in range(8):
+                offset = byte * 8 + bit
+                if offset >= self.size:
+                    return None
+                if offset >= start and not value & (1 << bit):
+                    return offset
+            byte += 1
+
+    def allocate(self) -> IPAddress:
+        """分配下一个空闲地址
+
+        Raises:
+            RuntimeError: 地址池已满
+        """
+        return self.allocate_many(1)[0]
+
+    def allocate_many(self, n: int) -> list[IPAddress]:
+        """一次分配 n 个地址，地址不足时不分配任何地址
+
+        Raises:
+            RuntimeError: 地址池剩余地址不足
+        """
+        if n > self.free_count:
+            raise RuntimeError(f"IP 地址池已满（{self.network} 剩余 {self.free_count} 个地址）")
+
+        addresses = []
+        offset = self._cursor
+        for _ in range(n):
+            offset = self._next_free(offset)
+            if offset is None:
+                # free_count 已保证不会发生，防御性检查
+                raise RuntimeError("IP 地址池已满")
+            self._bitmap[offset >> 3] |= 1 << (offset & 7)
+            addresses.append(self._address_type(self._base + offset))
+            offset += 1
+        self._used += n
+        self._cursor = offset
+        return addresses
@@ -0,0 +1,83 @@
+"""CSV / JSON / YAML 数据文件加载"""
+
+import csv
+import json
+import os
+
+
+def load_data(path: str):
+    """按扩展名加载 JSON 或 YAML 文件
+
+    Args:
+        path: 文件路径（.json / .yaml / .yml）
+
+    Returns:
+        解析后的对象
+
+    Raises:
+        ValueError: 格式不支持、解析失败或缺少 PyYAML
+    """
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+
+    if ext == ".json":
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSON 解析失败: {e}")
+
+    if ext in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("读取 YAML 文件需要安装 PyYAML: pip install pyyaml")
+        try:
+            return yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ValueError(f"YAML 解析失败: {e}")
+
+    raise ValueError(f"不支持的文件格式: {ext or path}")
+
+
+def load_records(path: str, key: str = "name") -> list[dict]:
+    """加载记录列表
+
+    支持的格式:
+        - CSV: 首行为表头
+        - JSON / YAML: 对象列表，或字符串列表（视为 {key: 值}），
+          也可以是包含 peers 列表的对象
+
+    Args:
+        path: 文件路径
+        key: 元素为纯字符串时使用的字段名
+
+    Returns:
+        字典列表，空值字段会被移除
+
+    Raises:
+        ValueError: 文件格式或内容无效
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        data = load_data(path)
+        if isinstance(data, dict) and isinstance(data.get("peers"), list):
+            data = data["peers"]
+        if not isinstance(data, list):
+            raise ValueError("文件内容应为列表")
+        rows = data
+
+    records = []
+    for i, row in enumerate(rows, 1):
+        if isinstance(row, str):
+            row = {key: row}
+        if not isinstance(row, dict):
+            raise ValueError(f"第 {i} 条记录格式无效: {row!r}")
+        records.append({
+            str(k).strip(): str(v).strip() for k, v in row.items()
+            if k is not None and v is not None and str(v).strip()
+        })
+    return records
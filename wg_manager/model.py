@@ -0,0 +1,338 @@
+"""WireGuard 配置文件对象模型
+
+一次线性遍历把配置文本切分为段（[Interface] / [Peer]）和行，
+每一行（键值、注释、空行）连同原始文本一起保存，序列化时原样拼回，
+未修改的配置可无损往返：``parse_wg_config(text).serialize() == text``。
+
+键名按 wg-quick 的规则不区分大小写，``#`` 之后为注释；
+AllowedIPs、Address、DNS 等多值字段既可逗号分隔，也可重复出现。
+"""
+
+from typing import Iterable, Optional
+
+
+class Entry:
+    """配置中的一行
+
+    键值行的 key 为原始键名；注释行和空行的 key 为 None。
+    raw 为原始行文本（含换行符），修改 value 后重新生成。
+    """
+
+    __slots__ = ("key", "value", "raw")
+
+    def __init__(self, key: Optional[str], value: str, raw: str):
+        self.key = key
+        self.value = value
+        self.raw = raw
+
+    @classmethod
+    def parse(cls, raw: str) -> "Entry":
+        # wg-quick 把 # 之后的内容都视为注释
+        text = raw.split("#", 1)[0]
+        key, sep, value = text.partition("=")
+        if not sep or not key.strip():
+            return cls(None, "", raw)
+        return cls(key.strip(), value.strip(), raw)
+
+    @classmethod
+    def build(cls, key: str, value: str) -> "Entry":
+        return cls(key, value, f"{key} = {value}\n")
+
+    @property
+    def comment(self) -> str:
+        """注释文本（去掉 # 和首尾空白），不是注释行时为空字符串"""
+        text = self.raw.strip()
+        return text[1:].strip() if text.startswith("#") else ""
+
+    def __repr__(self) -> str:
+        return f"Entry({self.raw!r})"
+
+
+class Section:
+    """配置中的一个段：段头行及其后直到下一个段头的所有行
+
+    紧贴在段头之前的注释行（中间没有空行）属于该段，保存在 leading 中，
+    如 "# alice\n[Peer]" 中的注释；但这些注释与上一段之间必须隔有空行，
+    否则它们仍属于上一段（如 [Interface] 末尾的 "# Clients below"）。
+
+    start / end 为该段（含 leading）在解析源文本中的字符偏移 [start, end)，
+    新建的段为 -1。
+    """
+
+    __slots__ = ("leading", "header", "entries", "start", "end")
+
+    # 多值字段：逗号分隔，且可重复出现
+    MULTI_VALUE_KEYS = frozenset({"allowedips", "address", "dns"})
+
+    def __init__(self, header: str, entries: Optional[list[Entry]] = None,
+                 start: int = -1, end: int = -1, leading: Optional[list[Entry]] = None):
+        self.leading = leading if leading is not None else []
+        self.header = header
+        self.entries = entries if entries is not None else []
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def build(
+        cls,
+        fields: Iterable[tuple[str, object]],
+        comment: str = ""
+    ) -> "Section":
+        """按字段列表新建段，值为空字符串或 None 的字段不写入"""
+        section = cls(f"[{cls.__name__}]\n")
+        if comment:
+            section.entries.append(Entry(None, "", f"# {comment}\n"))
+        for key, value in fields:
+            if value is not None and value != "":
+                section.entries.append(Entry.build(key, str(value)))
+        return section
+
+    @property
+    def kind(self) -> str:
+        """段类型（小写），如 interface、peer"""
+        return self.header.split("#", 1)[0].strip()[1:-1].strip().lower()
+
+    def get(self, key: str, default: str = "") -> str:
+        """第一个同名键的值（键名不区分大小写）"""
+        key = key.lower()
+        for entry in self.entries:
+            if entry.key is not None and entry.key.lower() == key:
+                return entry.value
+        return default
+
+    def get_all(self, key: str) -> list[str]:
+        """所有同名键的值，多值字段按逗号拆分"""
+        key = key.lower()
+        values = []
+        for entry in self.entries:
+            if entry.key is not None and entry.key.lower() == key:
+                if key in self.MULTI_VALUE_KEYS:
+                    values.extend(v.strip() for v in entry.value.split(",") if v.strip())
+                else:
+                    values.append(entry.value)
+        return values
+
+    def set(self, key: str, value: str) -> None:
+        """设置第一个同名键的值，不存在时追加在最后一个键值行之后"""
+        lower = key.lower()
+        last = -1
+        for i, entry in enumerate(self.entries):
+            if entry.key is None:
+                continue
+            if entry.key.lower() == lower:
+                ending = entry.raw[len(entry.raw.rstrip("\r\n")):]
+                entry.value = value
+                entry.raw = f"{entry.key} = {value}{ending}"
+                return
+            last = i
+        self.entries.insert(last + 1, Entry.build(key, value))
+
+    @property
+    def comments(self) -> list[str]:
+        """段内（含段头前）非空注释文本"""
+        lines = self.leading + self.entries
+        return [c for c in (e.comment for e in lines if e.key is None) if c]
+
+    def serialize(self) -> str:
+        return (
+            "".join(entry.raw for entry in self.leading)
+            + self.header
+            + "".join(entry.raw for entry in self.entries)
+        )
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({len(self.entries)} 行)"
+
+
+class Interface(Section):
+    """[Interface] 段"""
+
+    __slots__ = ()
+
+    @property
+    def private_key(self) -> str:
+        return self.get("PrivateKey")
+
+    @property
+    def addresses(self) -> list[str]:
+        return self.get_all("Address")
+
+    @property
+    def address(self) -> str:
+        """第一个 Address，未配置时为空字符串"""
+        addresses = self.addresses
+        return addresses[0] if addresses else ""
+
+    @property
+    def listen_port(self) -> Optional[int]:
+        try:
+            return int(self.get("ListenPort"))
+        except ValueError:
+            return None
+
+    @property
+    def dns(self) -> list[str]:
+        return self.get_all("DNS")
+
+    @property
+    def post_up(self) -> str:
+        return self.get("PostUp")
+
+    @property
+    def post_down(self) -> str:
+        return self.get("PostDown")
+
+
+class Peer(Section):
+    """[Peer] 段
+
+    段内第一条非空注释作为名称；段内没有注释时，使用段头前紧贴的最后一条注释。
+    """
+
+    __slots__ = ()
+
+    @property
+    def name(self) -> str:
+        for entry in self.entries:
+            if entry.key is None:
+                comment = entry.comment
+                if comment:
+                    return comment
+        for entry in reversed(self.leading):
+            comment = entry.comment
+            if comment:
+                return comment
+        return ""
+
+    @property
+    def public_key(self) -> str:
+        return self.get("PublicKey")
+
+    @property
+    def preshared_key(self) -> str:
+        return self.get("PresharedKey")
+
+    @property
+    def allowed_ips(self) -> list[str]:
+        return self.get_all("AllowedIPs")
+
+    @property
+    def endpoint(self) -> str:
+        return self.get("Endpoint")
+
+    @property
+    def persistent_keepalive(self) -> Optional[int]:
+        try:
+            return int(self.get("PersistentKeepalive"))
+        except ValueError:
+            return None
+
+
+_SECTION_TYPES = {"interface": Interface, "peer": Peer}
+
+
+class WireGuardConfig:
+    """完整的配置文件
+
+    preamble 为第一个段之前的行（紧贴段头的注释除外）。
+    """
+
+    __slots__ = ("preamble", "sections")
+
+    def __init__(self, preamble: Optional[list[Entry]] = None,
+                 sections: Optional[list[Section]] = None):
+        self.preamble = preamble if preamble is not None else []
+        self.sections = sections if sections is not None else []
+
+    @property
+    def interface(self) -> Optional[Interface]:
+        """第一个 [Interface] 段"""
+        for section in self.sections:
+            if isinstance(section, Interface):
+                return section
+        return None
+
+    @property
+    def peers(self) -> list[Peer]:
+        return [s for s in self.sections if isinstance(s, Peer)]
+
+    def find_peer(self, public_key: str) -> Optional[Peer]:
+        for section in self.sections:
+            if isinstance(section, Peer) and section.public_key == public_key:
+                return section
+        return None
+
+    def serialize(self) -> str:
+        parts = [entry.raw for entry in self.preamble]
+        parts.extend(section.serialize() for section in self.sections)
+        return "".join(parts)
+
+    __str__ = serialize
+
+
+def parse_wg_config(content: str) -> WireGuardConfig:
+    """一次遍历解析配置文本
+
+    Args:
+        content: 配置文件内容
+
+    Returns:
+        WireGuardConfig，serialize() 返回与 content 完全相同的文本
+    """
+    config = WireGuardConfig()
+    entries = config.preamble
+    section: Optional[Section] = None
+    offset = 0
+    length = len(content)
+
+    while offset < length:
+        newline = content.find("\n", offset)
+        end = length if newline < 0 else newline + 1
+        raw = content[offset:end]
+
+        stripped = raw.lstrip()
+        if stripped.startswith("["):
+            # 紧贴段头的注释行归入新段，与上一段之间没有空行时仍留在上一段
+            count = 0
+            while (count < len(entries) and entries[-1 - count].key is None
+                   and entries[-1 - count].raw.lstrip().startswith("#")):
+                count += 1
+            leading: list[Entry] = []
+            if count and (section is None or (
+                    count < len(entries) and not entries[-1 - count].raw.strip())):
+                leading = entries[-count:]
+                del entries[-count:]
+            start = offset - sum(len(e.raw) for e in leading)
+            if section is not None:
+                section.end = start
+            kind = raw.split("#", 1)[0].strip()[1:-1].strip().lower()
+            section = _SECTION_TYPES.get(kind, Section)(raw, start=start, leading=leading)
+            config.sections.append(section)
+            entries = section.entries
+        else:
+            entries.append(Entry.parse(raw))
+        offset = end
+
+    if section is not None:
+        section.end = length
+    return config
+
+
+def remove_spans(content: str, spans: Iterable[tuple[int, int]]) -> str:
+    """一次拼接删除 content 中的多个区间
+
+    Args:
+        content: 原文本
+        spans: 字符区间 [start, end) 列表，可无序、可重叠
+
+    Returns:
+        删除所有区间后的文本
+    """
+    kept = []
+    position = 0
+    for start, end in sorted(spans):
+        if start > position:
+            kept.append(content[position:start])
+        position = max(position, end)
+    kept.append(content[position:])
+    return "".join(kept)
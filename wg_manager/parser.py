@@ -1,11 +1,88 @@
 """WireGuard 配置文件解析器"""
 
 import re
+import sys
+import shlex
+import ipaddress
+import base64
+import hashlib
+import secrets
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Iterable, Optional
+
+from . import trace
+from .cache import ConfigCache
+from .crypto import cached_public_key
+from .ipam import AddressPool, host_prefix
+from .model import WireGuardConfig, parse_wg_config, remove_spans
+from .transport import Flow, RemoteCommand, Transport, remote_fingerprint, run_flow
+
+
+class ServerConfig(dict):
+    """服务端配置字典
+
+    public_key 在首次通过 config["public_key"] 访问时才由私钥推导，
+    只列出或检查网段的调用不会产生推导开销。
+    """
+
+    def __missing__(self, key: str) -> str:
+        if key != "public_key":
+            raise KeyError(key)
+        private_key = self.get("private_key", "")
+        public_key = cached_public_key(private_key) if private_key else ""
+        self["public_key"] = public_key
+        return public_key
 
-from .ssh import SSHClient
 
+def server_config_from_model(config: WireGuardConfig) -> tuple[dict, set[str]]:
+    """从配置对象提取服务端配置和已用 IP，见 parse_config"""
+    server_config = ServerConfig({
+        "private_key": "",
+        "address": "",
+        "port": 51820,
+        "post_up": "",
+        "post_down": "",
+    })
+    used_ips: set[str] = set()
+
+    interface = config.interface
+    if interface is not None:
+        server_config["private_key"] = interface.private_key
+        server_config["address"] = interface.address
+        if interface.listen_port is not None:
+            server_config["port"] = interface.listen_port
+        server_config["post_up"] = interface.post_up
+        server_config["post_down"] = interface.post_down
+        # 服务端 IP 也算已用（Address 带的是网段前缀，只占用其主机地址）
+        for address in interface.addresses:
+            try:
+                used_ips.add(host_prefix(address))
+            except ValueError:
+                pass
+
+    for peer in config.peers:
+        used_ips.update(peer.allowed_ips)
+
+    return server_config, used_ips
 
-def parse_config(content: str) -> tuple[dict, set[int]]:
+
+def peers_from_model(config: WireGuardConfig) -> list[dict]:
+    """从配置对象提取 Peer 信息，见 parse_peers"""
+    peers = []
+    for i, peer in enumerate(config.peers):
+        if not peer.public_key:
+            continue
+        peers.append({
+            "name": peer.name or f"peer_{i+1}",
+            "public_key": peer.public_key,
+            "preshared_key": peer.preshared_key,
+            "allowed_ips": ", ".join(peer.allowed_ips),
+        })
+    return peers
+
+
+def parse_config(content: str) -> tuple[dict, set[str]]:
     """解析 WireGuard 配置文件，返回服务端配置和已用 IP 列表
 
     Args:
@@ -13,71 +90,10 @@ def parse_config(content: str) -> tuple[dict, set[int]]:
 
     Returns:
         (server_config, used_ips) 元组
-        server_config: 包含 private_key, public_key, address, port, post_up, post_down
-        used_ips: 已使用的 IP 最后一位集合
+        server_config: 包含 private_key, public_key（按需推导）, address, port, post_up, post_down
+        used_ips: 已使用的地址集合（服务端 Address 与所有 Peer 的 AllowedIPs，CIDR 格式）
     """
-    from .crypto import generate_public_key
-
-    server_config = {
-        "private_key": "",
-        "public_key": "",
-        "address": "",
-        "port": 51820,
-        "post_up": "",
-        "post_down": "",
-    }
-    used_ips = set()
-
-    # 解析 Interface 部分
-    interface_match = re.search(r'\[Interface\](.*?)(?=\[Peer\]|$)', content, re.DOTALL | re.IGNORECASE)
-    if interface_match:
-        section = interface_match.group(1)
-
-        # PrivateKey
-        pk_match = re.search(r'PrivateKey\s*=\s*(\S+)', section)
-        if pk_match:
-            server_config["private_key"] = pk_match.group(1)
-            server_config["public_key"] = generate_public_key(pk_match.group(1))
-
-        # Address
-        addr_match = re.search(r'Address\s*=\s*(\S+)', section)
-        if addr_match:
-            server_config["address"] = addr_match.group(1)
-            # 服务端 IP 也算已用
-            ip_part = addr_match.group(1).split('/')[0]
-            last_octet = int(ip_part.split('.')[-1])
-            used_ips.add(last_octet)
-
-        # ListenPort
-        port_match = re.search(r'ListenPort\s*=\s*(\d+)', section)
-        if port_match:
-            server_config["port"] = int(port_match.group(1))
-
-        # PostUp
-        postup_match = re.search(r'PostUp\s*=\s*(.+)$', section, re.MULTILINE)
-        if postup_match:
-            server_config["post_up"] = postup_match.group(1).strip()
-
-        # PostDown
-        postdown_match = re.search(r'PostDown\s*=\s*(.+)$', section, re.MULTILINE)
-        if postdown_match:
-            server_config["post_down"] = postdown_match.group(1).strip()
-
-    # 解析 Peer 部分，提取已用 IP
-    for peer_match in re.finditer(r'\[Peer\](.*?)(?=\[Peer\]|$)', content, re.DOTALL | re.IGNORECASE):
-        section = peer_match.group(1)
-        allowed_match = re.search(r'AllowedIPs\s*=\s*(\S+)', section)
-        if allowed_match:
-            ip = allowed_match.group(1).split('/')[0]
-            # 只处理 IPv4 地址
-            if '.' in ip:
-                try:
-                    last_octet = int(ip.split('.')[-1])
-                    used_ips.add(last_octet)
-                except ValueError:
-                    pass
-
-    return server_config, used_ips
+    return server_config_from_model(parse_wg_config(content))
 
 
 def parse_peers(content: str) -> list[dict]:
@@ -87,91 +103,368 @@ def parse_peers(content: str) -> list[dict]:
         content: 配置文件内容
 
     Returns:
-        Peer 信息列表，每个包含 name, public_key, preshared_key, allowed_ips
+        Peer 信息列表，每个包含 name, public_key, preshared_key,
+        allowed_ips（多个值以 ", " 连接）
     """
-    peers = []
+    return peers_from_model(parse_wg_config(content))
 
-    for i, peer_match in enumerate(re.finditer(r'\[Peer\](.*?)(?=\[Peer\]|$)', content, re.DOTALL | re.IGNORECASE)):
-        section = peer_match.group(1)
 
-        pub_match = re.search(r'PublicKey\s*=\s*(\S+)', section)
-        allowed_match = re.search(r'AllowedIPs\s*=\s*(\S+)', section)
-        psk_match = re.search(r'PresharedKey\s*=\s*(\S+)', section)
-        # 注释行作为名称
-        comment_match = re.search(r'#\s*(.+)$', section, re.MULTILINE)
+# [Peer] 段头（段名不区分大小写）
+_PEER_HEADER = re.compile(r"^[ \t]*\[[ \t]*peer[ \t]*\]", re.I | re.M)
 
-        if pub_match:
-            name = comment_match.group(1).strip() if comment_match else f"peer_{i+1}"
-            peers.append({
-                "name": name,
-                "public_key": pub_match.group(1),
-                "preshared_key": psk_match.group(1) if psk_match else "",
-                "allowed_ips": allowed_match.group(1) if allowed_match else ""
-            })
 
-    return peers
+@dataclass
+class InterfaceConfig:
+    """服务器上的一个 WireGuard 接口配置
+
+    内容在扫描时一次性取回，解析结果按需计算并缓存，
+    调用方无需再次读取远程文件。
+    """
+    name: str
+    path: str
+    content: str
+    # 远程指纹 mtime:size:sha256，未知时为空字符串
+    fingerprint: str = ""
+
+    @cached_property
+    def model(self) -> WireGuardConfig:
+        """配置对象模型（只解析一次）"""
+        with trace.span("parser.parse", interface=self.name, bytes=len(self.content)) as span:
+            model = parse_wg_config(self.content)
+            span.set(sections=len(model.sections))
+            return model
+
+    @cached_property
+    def interface_model(self) -> WireGuardConfig:
+        """[Interface] 段所在的配置对象
+
+        已完整解析时直接使用 model；否则只解析第一个 [Peer] 段之前的内容，
+        只需要服务端配置的操作（如分配地址由本地状态库完成时）不必解析所有 Peer。
+        """
+        if "model" not in self.__dict__:
+            match = _PEER_HEADER.search(self.content)
+            if match is not None:
+                header = parse_wg_config(self.content[:match.start()])
+                if header.interface is not None:
+                    return header
+        return self.model
+
+    @cached_property
+    def server_config(self) -> dict:
+        """服务端配置，同 parse_config 返回的 server_config"""
+        return server_config_from_model(self.interface_model)[0]
+
+    @cached_property
+    def used_ips(self) -> set[str]:
+        """已使用的地址集合（CIDR 格式）"""
+        return server_config_from_model(self.model)[1]
+
+    def address_pool(self, reserved: Iterable[str] = ()) -> AddressPool:
+        """按接口网段和已用地址新建地址池
+
+        Args:
+            reserved: 额外保留的地址或范围，见 AddressPool
+
+        Raises:
+            ValueError: 接口未配置 Address 或格式无效
+        """
+        return AddressPool(self.server_config["address"], reserved=reserved, used=self.used_ips)
+
+    @cached_property
+    def peers(self) -> list[dict]:
+        """Peer 信息列表，同 parse_peers"""
+        return peers_from_model(self.model)
+
+    @property
+    def address(self) -> str:
+        """Interface 段的第一个 Address，未配置时为空字符串"""
+        interface = self.interface_model.interface
+        return interface.address if interface is not None else ""
+
+    @property
+    def network(self) -> str:
+        """接口网段（Address 原值），未配置时为 unknown"""
+        return self.address or "unknown"
+
+
+def build_scan_command(wg_dir: str, token: str, known: Iterable[str] = ()) -> str:
+    """构建一次性取回目录下全部配置文件的远程命令
+
+    每个文件输出 "<token> <路径> <指纹> <标记>" 行和一行内容：
+    指纹为 mtime:size:sha256；指纹属于 known 时标记为 "="、内容行为空，
+    否则标记为 "+"、内容行为 base64 编码的文件内容。
+
+    Args:
+        wg_dir: 配置目录
+        token: 分隔标记
+        known: 本地已缓存内容的指纹
+    """
+    patterns = "|".join(shlex.quote(fp) for fp in known) or "__none__"
+    fingerprint = remote_fingerprint('"$f"')
+    return (
+        f"for f in {shlex.quote(wg_dir)}/*.conf; do "
+        f'[ -f "$f" ] && [ -r "$f" ] || continue; '
+        f'fp="{fingerprint}"; '
+        f'case "$fp" in '
+        f"{patterns}) printf '%s %s %s =\\n' {token} \"$f\" \"$fp\"; echo ;; "
+        f"*) printf '%s %s %s +\\n' {token} \"$f\" \"$fp\"; "
+        f"base64 < \"$f\" | tr -d '\\n'; echo ;; "
+        f"esac; "
+        f"done"
+    )
+
+
+def parse_scan_output(output: str, token: str) -> list[tuple[str, str, Optional[str]]]:
+    """解析 build_scan_command 的输出
 
+    Returns:
+        [(路径, 指纹, 内容), ...]，远程报告未变化的文件内容为 None
+    """
+    entries = []
+    lines = output.split('\n')
+    for i, line in enumerate(lines):
+        parts = line.split(' ')
+        if len(parts) < 4 or parts[0] != token:
+            continue
+        # 路径中可能含空格，指纹和标记不含
+        path, fingerprint, flag = ' '.join(parts[1:-2]), parts[-2], parts[-1]
+        if flag == "=":
+            entries.append((path, fingerprint, None))
+            continue
+        payload = lines[i + 1] if i + 1 < len(lines) else ""
+        raw = base64.b64decode(payload)
+        # 读取指纹与内容之间文件可能被修改，校验不一致时不使用该指纹
+        if hashlib.sha256(raw).hexdigest() != fingerprint.rsplit(':', 1)[-1]:
+            fingerprint = ""
+        entries.append((path, fingerprint, raw.decode(errors="replace")))
+    return entries
+
+
+def _interface_name(path: str) -> str:
+    # /etc/wireguard/wg0.conf -> wg0
+    return path.split('/')[-1][:-len('.conf')]
+
+
+def resolve_scan_entries(
+    entries: list[tuple[str, str, Optional[str]]],
+    cache: Optional[ConfigCache],
+    host_key: str
+) -> Optional[list[InterfaceConfig]]:
+    """合并扫描结果与本地缓存，并把新取回的内容写入缓存
 
-def scan_interfaces(ssh: SSHClient, wg_dir: str = "/etc/wireguard") -> list[tuple[str, str]]:
+    Returns:
+        InterfaceConfig 列表；远程报告未变化但本地缓存已失效时返回 None
+    """
+    interfaces = []
+    for path, fingerprint, content in entries:
+        if content is None:
+            content = cache.get(host_key, path, fingerprint) if cache else None
+            if content is None:
+                return None
+        elif cache is not None and fingerprint:
+            cache.put(host_key, path, fingerprint, content)
+        interfaces.append(InterfaceConfig(
+            name=_interface_name(path), path=path, content=content, fingerprint=fingerprint
+        ))
+    return interfaces
+
+
+@trace.traced("parser.remove_sections")
+def remove_peer_sections(content: str, public_keys: set[str]) -> tuple[str, int]:
+    """删除 PublicKey 属于 public_keys 的所有 [Peer] 段
+
+    一次解析建立各段的字符区间，再一次拼接删除所有匹配段的区间，
+    其余内容保持原样。段包括紧贴段头的注释、段内注释，
+    直到下一个段（或文件末尾）为止。
+
+    Args:
+        content: 配置文件内容
+        public_keys: 要删除的客户端公钥集合
+
+    Returns:
+        (新配置内容, 删除的段数)
+    """
+    spans = [
+        (peer.start, peer.end) for peer in parse_wg_config(content).peers
+        if peer.public_key in public_keys
+    ]
+    return remove_spans(content, spans), len(spans)
+
+
+def scan_interfaces(
+    ssh: Transport,
+    wg_dir: Optional[str] = None,
+    use_cache: bool = True
+) -> list[InterfaceConfig]:
     """扫描服务器上的 WireGuard 配置文件
 
+    所有配置文件在一次远程调用中取回并在本地解析。客户端启用了本地缓存时，
+    已缓存文件的指纹随命令发送，未变化的文件不会重新传输。
+
     Args:
-        ssh: SSH 客户端
-        wg_dir: WireGuard 配置目录
+        ssh: 传输（SSH 客户端或 LocalTransport）
+        wg_dir: WireGuard 配置目录，默认为 ssh.wg_dir
+        use_cache: 是否使用客户端的本地缓存（ssh.cache）
 
     Returns:
-        [(接口名, 网段), ...] 列表
+        InterfaceConfig 列表，按文件名排序
+    """
+    return run_flow(ssh, scan_interfaces_flow(ssh, wg_dir, use_cache))
+
+
+class InterfaceScan:
+    """一次配置文件扫描
+
+    command 可以单独执行，也可以作为批量执行（RemoteBatch）中的一个步骤，
+    与其他探测命令在同一次往返中完成；取回的输出交给 finish 解析。
+
+    Args:
+        ssh: 传输（SSH 客户端或 LocalTransport）
+        wg_dir: WireGuard 配置目录，默认为 ssh.wg_dir
+        use_cache: 是否使用客户端的本地缓存（ssh.cache）
+
+    扫描默认配置目录时，结果同时用于增量更新客户端索引（ssh.index）。
     """
-    success, output = ssh.run_command(f"ls -1 {wg_dir}/*.conf 2>/dev/null")
-    if not success or not output.strip():
+
+    def __init__(self, ssh: Transport, wg_dir: Optional[str] = None, use_cache: bool = True):
+        wg_dir = wg_dir or ssh.wg_dir
+        self.wg_dir = wg_dir
+        self.host_key = ssh.cache_key
+        self.cache = ssh.cache if use_cache else None
+        self.index = ssh.index if wg_dir == ssh.wg_dir else None
+        self.token = f"WGM_FILE_{secrets.token_hex(8)}"
+        known = self.cache.known_fingerprints(self.host_key, wg_dir) if self.cache else []
+        self.command = build_scan_command(wg_dir, self.token, known)
+        # finish 完成了一次成功的扫描（包括目录中没有配置文件）
+        self.success = False
+
+    def finish(self, output: Optional[str]) -> Flow[list[InterfaceConfig]]:
+        """解析 command 的输出（远程操作流程，见 transport.Flow）
+
+        output 为 None 表示 command 执行失败：返回空列表，不更新缓存和索引。
+        本地缓存在扫描期间失效时，不带指纹重新取回一次。
+        """
+        if output is None:
+            return []
+
+        interfaces = resolve_scan_entries(
+            parse_scan_output(output, self.token), self.cache, self.host_key
+        )
+        if interfaces is None:
+            success, output = yield RemoteCommand(build_scan_command(self.wg_dir, self.token))
+            if not success:
+                return []
+            interfaces = resolve_scan_entries(
+                parse_scan_output(output, self.token), self.cache, self.host_key
+            )
+
+        if self.cache is not None:
+            self.cache.put_listing(self.host_key, self.wg_dir, [i.path for i in interfaces])
+        if self.index is not None:
+            self.index.update_host(self.host_key, interfaces)
+        self.success = True
+        return interfaces
+
+
+@trace.traced("parser.scan")
+def scan_interfaces_flow(
+    ssh: Transport,
+    wg_dir: Optional[str] = None,
+    use_cache: bool = True
+) -> Flow[list[InterfaceConfig]]:
+    """scan_interfaces 的远程操作流程，见 transport.Flow"""
+    scan = InterfaceScan(ssh, wg_dir, use_cache)
+    success, output = yield RemoteCommand(scan.command)
+    if not success:
         return []
+    return (yield from scan.finish(output))
 
-    interfaces = []
-    for f in output.strip().split('\n'):
-        if f and f.endswith('.conf'):
-            # /etc/wireguard/wg0.conf -> wg0
-            interface = f.split('/')[-1].replace('.conf', '')
-
-            # 读取配置获取网段
-            success, config = ssh.read_remote_file(f)
-            if success:
-                addr_match = re.search(r'Address\s*=\s*(\S+)', config)
-                network = addr_match.group(1) if addr_match else "unknown"
-                interfaces.append((interface, network))
 
-    return interfaces
+def select_interface(
+    interfaces: list[InterfaceConfig],
+    interface: Optional[str] = None,
+    interactive: bool = True
+) -> Optional[InterfaceConfig]:
+    """从扫描结果中选择接口
+
+    指定接口时验证是否存在；只有一个接口时直接使用；
+    多个接口时询问用户（非交互模式下报错）。
+
+    Args:
+        interfaces: scan_interfaces 的返回值
+        interface: 指定接口名称
+        interactive: 多个接口时是否询问用户
+
+    Returns:
+        选中的接口，失败或取消时返回 None
+    """
+    if interface:
+        # 指定了接口，验证是否存在
+        for iface in interfaces:
+            if iface.name == interface:
+                return iface
+        print(f"错误: 接口 {interface} 不存在", file=sys.stderr)
+        print(f"可用接口: {', '.join(i.name for i in interfaces)}", file=sys.stderr)
+        return None
+
+    if len(interfaces) == 1:
+        print(f"使用接口: {interfaces[0].name} ({interfaces[0].network})")
+        return interfaces[0]
+
+    if not interactive:
+        print("错误: 服务器上有多个 WireGuard 接口，请指定接口名称", file=sys.stderr)
+        print(f"可用接口: {', '.join(i.name for i in interfaces)}", file=sys.stderr)
+        return None
+
+    # 多个接口，询问用户
+    print("\n发现多个 WireGuard 接口:")
+    for i, iface in enumerate(interfaces, 1):
+        print(f"  {i}. {iface.name} ({iface.network})")
+    try:
+        choice = input(f"请选择 [1-{len(interfaces)}]: ").strip()
+        idx = int(choice) - 1
+        if 0 <= idx < len(interfaces):
+            return interfaces[idx]
+        print("无效选择", file=sys.stderr)
+        return None
+    except (ValueError, KeyboardInterrupt, EOFError):
+        print("\n已取消", file=sys.stderr)
+        return None
 
 
 def get_network(address: str) -> str:
     """从地址获取网段
 
     Args:
-        address: 如 10.0.0.1/24
+        address: 如 10.0.0.1/24、10.8.0.1/16、fd00::1/64
 
     Returns:
         网段，如 10.0.0.0/24
+
+    Raises:
+        ValueError: 地址格式无效
     """
-    ip = address.split('/')[0]
-    parts = ip.split('.')
-    return f"{'.'.join(parts[:3])}.0/24"
+    return str(ipaddress.ip_network(address.strip(), strict=False))
 
 
-def allocate_ip(server_address: str, used_ips: set[int]) -> str:
+def allocate_ip(
+    server_address: str,
+    used_ips: Iterable[str],
+    reserved: Iterable[str] = ()
+) -> str:
     """分配新的 IP 地址
 
     Args:
         server_address: 服务端地址，如 10.0.0.1/24
-        used_ips: 已使用的 IP 最后一位集合
+        used_ips: 已使用的地址（CIDR 格式），见 parse_config
+        reserved: 额外保留的地址或范围
 
     Returns:
         新的 IP 地址，如 10.0.0.2/32
-    """
-    base = server_address.split('/')[0]
-    parts = base.split('.')
-    base_prefix = '.'.join(parts[:3])
 
-    for i in range(2, 255):
-        if i not in used_ips:
-            return f"{base_prefix}.{i}/32"
-
-    raise RuntimeError("IP 地址池已满")
+    Raises:
+        RuntimeError: 地址池已满
+        ValueError: 服务端地址格式无效
+    """
+    pool = AddressPool(server_address, reserved=reserved, used=used_ips)
+    return host_prefix(str(pool.allocate()))
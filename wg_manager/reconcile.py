@@ -0,0 +1,298 @@
+"""配置文件与运行中接口的一致性修复
+
+热重载失败后（add 的兜底路径、remove 中 wg set ... remove 失败等），运行中的接口
+可能与配置文件不一致。reconcile 在一次往返中取回配置文件和 wg show <接口> dump，
+按公钥比较 peer 集合、预共享密钥和 AllowedIPs，只用最少的 wg set 命令把运行中的接口
+修正为配置文件的状态，并在同一次往返中重新读取运行状态校验结果。
+
+不会重启服务或重载整个接口；--dry-run 只输出修正计划。
+"""
+
+import sys
+import shlex
+import ipaddress
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from . import trace
+from .model import Peer
+from .parser import InterfaceConfig, InterfaceScan
+from .session import connect_ssh
+from .transport import Flow, Transport, run_flow
+from .wgctl import peer_clause, set_peer_command, set_peers_command
+
+
+@dataclass(frozen=True)
+class PeerState:
+    """比较用的 peer 状态：预共享密钥和规范化的 AllowedIPs"""
+    public_key: str
+    preshared_key: str = ""
+    allowed_ips: frozenset[str] = frozenset()
+
+    @classmethod
+    def from_peer(cls, peer: Peer) -> "PeerState":
+        return cls(peer.public_key, peer.preshared_key, normalize_networks(peer.allowed_ips))
+
+
+@dataclass
+class PeerChange:
+    """把运行中的 peer 修正为目标状态的一项操作
+
+    action 为 add（添加）、remove（移除）或 update（修改预共享密钥和/或 AllowedIPs）。
+    """
+    interface: str
+    action: str
+    public_key: str
+    name: str = ""
+    # 目标状态（add / update）
+    peer: Optional[Peer] = None
+    # update: AllowedIPs 是否不同（旧值用于显示）/ 预共享密钥是否不同
+    allowed_ips_from: Optional[frozenset[str]] = None
+    psk: bool = False
+
+    @property
+    def label(self) -> str:
+        return self.name or f"({self.public_key[:10]}…)"
+
+    def describe(self) -> str:
+        """可读的描述（不含密钥）"""
+        target = ", ".join(self.peer.allowed_ips) if self.peer is not None else ""
+        if self.action == "add":
+            extra = "，含预共享密钥" if self.peer.preshared_key else ""
+            return f"  + {self.interface} {self.label}: 添加 ({target}{extra})"
+        if self.action == "remove":
+            return f"  - {self.interface} {self.label}: 移除（不在配置文件中）"
+        parts = []
+        if self.allowed_ips_from is not None:
+            before = ", ".join(sorted(self.allowed_ips_from)) or "(无)"
+            parts.append(f"AllowedIPs {before} -> {target or '(无)'}")
+        if self.psk:
+            parts.append("预共享密钥" + ("不一致" if self.peer.preshared_key else "应清除"))
+        return f"  ~ {self.interface} {self.label}: {'；'.join(parts)}"
+
+
+@dataclass
+class InterfacePlan:
+    """一个接口的修正计划"""
+    interface: str
+    changes: list[PeerChange] = field(default_factory=list)
+
+    def commands(self) -> list[str]:
+        """修正所需的最少 wg set 命令
+
+        不带预共享密钥的修改合并为一条 wg set；预共享密钥经 stdin 传入，
+        每个需要设置预共享密钥的 peer 各用一条命令。
+        """
+        clauses = []
+        keyed = []
+        for change in self.changes:
+            peer = change.peer
+            if change.action == "remove":
+                clauses.append(peer_clause(change.public_key, remove=True))
+            elif peer.preshared_key and (change.action == "add" or change.psk):
+                keyed.append(set_peer_command(self.interface, peer))
+            elif change.action == "add":
+                clauses.append(peer_clause(
+                    peer.public_key, peer.allowed_ips, peer.endpoint, peer.persistent_keepalive
+                ))
+            else:
+                allowed_ips = peer.allowed_ips if change.allowed_ips_from is not None else None
+                clauses.append(peer_clause(peer.public_key, allowed_ips, clear_psk=change.psk))
+        if clauses:
+            keyed.insert(0, set_peers_command(self.interface, clauses))
+        return keyed
+
+
+def normalize_networks(values: Iterable[str]) -> frozenset[str]:
+    """规范化的 AllowedIPs 集合（10.0.0.1/24 与 10.0.0.0/24 视为相同）"""
+    networks = set()
+    for value in values:
+        value = value.strip()
+        if not value or value == "(none)":
+            continue
+        try:
+            networks.add(str(ipaddress.ip_network(value, strict=False)))
+        except ValueError:
+            networks.add(value)
+    return frozenset(networks)
+
+
+def diff_peers(
+    interface: str,
+    desired: list[Peer],
+    current: dict[str, PeerState]
+) -> list[PeerChange]:
+    """按公钥比较目标 peer 与当前状态
+
+    Args:
+        interface: 接口名称
+        desired: 目标 peer（如配置文件中的 [Peer] 段）
+        current: 当前状态 {公钥: PeerState}（如运行中的接口）
+
+    Returns:
+        移除、添加、修改的操作列表（按此顺序，先释放地址再分配）
+    """
+    wanted = {peer.public_key: peer for peer in desired if peer.public_key}
+    removes = [PeerChange(interface, "remove", key) for key in current if key not in wanted]
+    adds = []
+    updates = []
+    for key, peer in wanted.items():
+        state = current.get(key)
+        if state is None:
+            adds.append(PeerChange(interface, "add", key, peer.name, peer))
+            continue
+        target = PeerState.from_peer(peer)
+        allowed_ips_from = state.allowed_ips if state.allowed_ips != target.allowed_ips else None
+        psk = state.preshared_key != target.preshared_key
+        if allowed_ips_from is not None or psk:
+            updates.append(PeerChange(interface, "update", key, peer.name, peer, allowed_ips_from, psk))
+    return removes + adds + updates
+
+
+def dump_command(interface: Optional[str] = None) -> str:
+    """读取运行状态的命令：指定接口时为 wg show <接口> dump，否则为 wg show all dump"""
+    return f"wg show {shlex.quote(interface)} dump" if interface else "wg show all dump"
+
+
+def parse_peer_dump(output: str, interface: Optional[str] = None) -> dict[str, dict[str, PeerState]]:
+    """解析 dump_command 的输出
+
+    wg show <接口> dump 的接口行为 4 列、peer 行为 8 列；
+    wg show all dump 每行前多一列接口名称。
+
+    Returns:
+        {接口: {公钥: PeerState}}，没有 peer 的运行中接口对应空字典
+    """
+    running: dict[str, dict[str, PeerState]] = {}
+    offset = 0 if interface else 1
+    for line in output.splitlines():
+        fields = line.split("\t")
+        name = interface or fields[0]
+        if len(fields) == 4 + offset:
+            running.setdefault(name, {})
+        elif len(fields) == 8 + offset:
+            public_key, psk, _, allowed_ips = fields[offset:offset + 4]
+            running.setdefault(name, {})[public_key] = PeerState(
+                public_key,
+                "" if psk == "(none)" else psk,
+                normalize_networks(allowed_ips.split(",")),
+            )
+    return running
+
+
+def reconcile(
+    host: str,
+    interface: Optional[str] = None,
+    dry_run: bool = False,
+    ssh_port: int = 22,
+    key_file: Optional[str] = None
+) -> bool:
+    """按配置文件修正运行中的接口
+
+    Args:
+        host: 服务器地址 (user@host 格式)
+        interface: 指定接口名称（留空处理所有运行中且有配置文件的接口）
+        dry_run: 只输出修正计划，不执行
+        ssh_port: SSH 端口，默认 22
+        key_file: SSH 私钥文件路径
+
+    Returns:
+        是否成功（dry_run 时为是否已一致）
+    """
+    ssh, _ = connect_ssh(host, ssh_port, key_file)
+    if ssh is None:
+        return False
+
+    with ssh:
+        return run_flow(ssh, _reconcile_flow(ssh, interface, dry_run))
+
+
+def _plan(
+    interfaces: list[InterfaceConfig],
+    running: dict[str, dict[str, PeerState]],
+    interface: Optional[str]
+) -> Optional[list[InterfacePlan]]:
+    """配置文件与运行状态的修正计划；指定的接口不存在或未运行时返回 None"""
+    configured = {iface.name: iface for iface in interfaces}
+    if interface:
+        if interface not in configured:
+            print(f"错误: 接口 {interface} 的配置文件不存在", file=sys.stderr)
+            return None
+        if interface not in running:
+            print(f"错误: 接口 {interface} 未运行（reconcile 不启动接口，请使用 "
+                  f"systemctl start wg-quick@{interface}）", file=sys.stderr)
+            return None
+
+    for name in sorted(configured.keys() - running.keys()):
+        print(f"警告: 接口 {name} 未运行，跳过", file=sys.stderr)
+    for name in sorted(running.keys() - configured.keys()):
+        print(f"警告: 运行中的接口 {name} 没有配置文件，跳过", file=sys.stderr)
+
+    return [
+        InterfacePlan(name, diff_peers(name, configured[name].model.peers, running[name]))
+        for name in sorted(configured.keys() & running.keys())
+    ]
+
+
+@trace.traced("reconcile")
+def _reconcile_flow(ssh: Transport, interface: Optional[str], dry_run: bool) -> Flow[bool]:
+    """比较并修正（远程操作流程），正常情况下检查一次往返、修正与校验一次往返"""
+    scan = InterfaceScan(ssh)
+    batch = ssh.batch()
+    batch.run(scan.command, check=False, description="扫描配置文件")
+    batch.run(dump_command(interface), check=False, description="读取运行状态")
+    _, results = yield batch
+    if len(results) < 2:
+        print(f"获取配置和运行状态失败: {results[-1].output if results else ''}", file=sys.stderr)
+        return False
+
+    interfaces = yield from scan.finish(results[0].output if results[0].success else None)
+    running = parse_peer_dump(results[1].output, interface) if results[1].success else {}
+    plans = _plan(interfaces, running, interface)
+    if plans is None:
+        return False
+
+    changes = [change for plan in plans for change in plan.changes]
+    if not changes:
+        print(f"运行中的接口与配置文件一致（{', '.join(p.interface for p in plans) or '无接口'}）")
+        return True
+
+    commands = [(plan.interface, cmd) for plan in plans for cmd in plan.commands()]
+    print(f"发现 {len(changes)} 处不一致，修正需要 {len(commands)} 条 wg set 命令:")
+    for change in changes:
+        print(change.describe())
+    if dry_run:
+        print("（--dry-run: 未执行）")
+        return False
+
+    batch = ssh.batch()
+    for name, command in commands:
+        # 命令可能含预共享密钥，步骤描述中不出现命令本身
+        batch.run(command, check=False, description=f"wg set {name}")
+    batch.run(dump_command(interface), check=False, description="校验运行状态")
+    _, results = yield batch
+
+    failed = [r for r in results[:-1] if not r.success]
+    for result in failed:
+        print(f"警告: {result.step} 失败: {result.output}", file=sys.stderr)
+    if len(results) != len(commands) + 1 or not results[-1].success:
+        print("错误: 无法读取修正后的运行状态", file=sys.stderr)
+        return False
+
+    running = parse_peer_dump(results[-1].output, interface)
+    remaining = [
+        change for plan in plans
+        for change in diff_peers(plan.interface, _configured_peers(interfaces, plan.interface),
+                                 running.get(plan.interface, {}))
+    ]
+    if remaining:
+        print(f"错误: 仍有 {len(remaining)} 处不一致:", file=sys.stderr)
+        for change in remaining:
+            print(change.describe(), file=sys.stderr)
+        return False
+    print("已修正，运行中的接口与配置文件一致（未重载接口）")
+    return True
+
+
+def _configured_peers(interfaces: list[InterfaceConfig], name: str) -> list[Peer]:
+    return next(iface.model.peers for iface in interfaces if iface.name == name)
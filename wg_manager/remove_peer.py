@@ -2,11 +2,14 @@
 
 import re
 import sys
+import fnmatch
 from typing import Optional
 
-from .config import REMOTE_WG_DIR
-from .parser import scan_interfaces, parse_peers
-from .ssh import connect_ssh
+from . import trace
+from .parser import InterfaceConfig, scan_interfaces_flow, select_interface, remove_peer_sections
+from .session import connect_ssh
+from .transport import FINGERPRINT_MISMATCH, Flow, RemoteBatch, Transport, run_flow
+from .wgctl import remove_peers_command, syncconf_command, verify_peers_command
 
 
 def remove_peer(
@@ -14,7 +17,8 @@ def remove_peer(
     name: str,
     interface: Optional[str] = None,
     ssh_port: int = 22,
-    key_file: Optional[str] = None
+    key_file: Optional[str] = None,
+    interactive: bool = True
 ) -> bool:
     """删除客户端节点
 
@@ -24,6 +28,7 @@ def remove_peer(
         interface: 指定接口名称（留空则自动检测/询问）
         ssh_port: SSH 端口，默认 22
         key_file: SSH 私钥文件路径
+        interactive: 有多个接口且未指定时是否询问用户（否则报错）
 
     Returns:
         是否成功
@@ -32,51 +37,33 @@ def remove_peer(
     if ssh is None:
         return False
 
+    with ssh:
+        return run_flow(ssh, _remove_peer_flow(ssh, name, interface, interactive))
+
+
+@trace.traced("remove_peer")
+def _remove_peer_flow(
+    ssh: Transport,
+    name: str,
+    interface: Optional[str],
+    interactive: bool = True
+) -> Flow[bool]:
+    """在已建立的连接上删除客户端节点（远程操作流程）"""
     # 扫描配置文件
     print("扫描 WireGuard 配置...")
-    interfaces = scan_interfaces(ssh)
+    interfaces = yield from scan_interfaces_flow(ssh)
 
     if not interfaces:
         print("错误: 服务器上没有 WireGuard 配置文件", file=sys.stderr)
         return False
 
     # 选择接口
-    if interface:
-        # 指定了接口，验证是否存在
-        matching = [(iface, net) for iface, net in interfaces if iface == interface]
-        if not matching:
-            print(f"错误: 接口 {interface} 不存在", file=sys.stderr)
-            return False
-        selected_interface = interface
-    elif len(interfaces) == 1:
-        selected_interface = interfaces[0][0]
-        print(f"使用接口: {selected_interface}")
-    else:
-        # 多个接口，询问用户
-        print("\n发现多个 WireGuard 接口:")
-        for i, (iface, net) in enumerate(interfaces, 1):
-            print(f"  {i}. {iface} ({net})")
-        try:
-            choice = input(f"请选择 [1-{len(interfaces)}]: ").strip()
-            idx = int(choice) - 1
-            if 0 <= idx < len(interfaces):
-                selected_interface = interfaces[idx][0]
-            else:
-                print("无效选择", file=sys.stderr)
-                return False
-        except (ValueError, KeyboardInterrupt):
-            print("\n已取消", file=sys.stderr)
-            return False
-
-    # 读取配置文件
-    config_path = f"{REMOTE_WG_DIR}/{selected_interface}.conf"
-    success, config_content = ssh.read_remote_file(config_path)
-    if not success:
-        print(f"读取配置失败: {config_content}", file=sys.stderr)
+    selected = select_interface(interfaces, interface, interactive)
+    if selected is None:
         return False
 
     # 解析 peers
-    peers = parse_peers(config_content)
+    peers = selected.peers
     if not peers:
         print("错误: 配置文件中没有客户端", file=sys.stderr)
         return False
@@ -95,44 +82,18 @@ def remove_peer(
             print(f"  - {peer['name']}: {peer['allowed_ips']}")
         return False
 
-    # 从配置中删除 peer 段
-    # 匹配 [Peer] 段，包含指定名称的注释
-    pattern = rf'\n?\[Peer\]\s*\n#\s*{re.escape(name)}\s*\n.*?(?=\n\[Peer\]|\Z)'
-    new_config = re.sub(pattern, '', config_content, flags=re.DOTALL)
-
-    # 如果上面的模式没匹配到（可能名称不在注释中），尝试按 PublicKey 删除
-    if new_config == config_content:
-        pubkey = target_peer["public_key"]
-        pattern = rf'\n?\[Peer\].*?PublicKey\s*=\s*{re.escape(pubkey)}.*?(?=\n\[Peer\]|\Z)'
-        new_config = re.sub(pattern, '', config_content, flags=re.DOTALL)
-
-    if new_config == config_content:
+    # 按段的字符区间从配置中删除 peer 段
+    new_config, removed = remove_peer_sections(selected.content, {target_peer["public_key"]})
+    if not removed:
         print(f"错误: 无法从配置中删除客户端 '{name}'", file=sys.stderr)
         return False
 
-    # 写入更新后的配置
-    print(f"更新配置文件...")
-    success, msg = ssh.write_remote_file(config_path, new_config.strip() + '\n')
-    if not success:
-        print(f"写入配置失败: {msg}", file=sys.stderr)
+    applied = yield from _apply_removal(
+        ssh, selected, new_config, [target_peer["public_key"]]
+    )
+    if not applied:
         return False
 
-    # 从运行中的 WireGuard 移除 peer
-    print("从运行中的服务移除客户端...")
-    pubkey = target_peer["public_key"]
-    success, msg = ssh.run_command(f"wg set {selected_interface} peer {pubkey} remove")
-    if not success:
-        # 如果动态移除失败，尝试重载配置
-        print("动态移除失败，尝试重载配置...")
-        reload_cmd = (
-            f"wg-quick strip {selected_interface} > /tmp/{selected_interface}_strip.conf && "
-            f"wg syncconf {selected_interface} /tmp/{selected_interface}_strip.conf && "
-            f"rm -f /tmp/{selected_interface}_strip.conf"
-        )
-        success, msg = ssh.run_command(reload_cmd)
-        if not success:
-            print(f"警告: 重载配置失败，可能需要重启服务: {msg}", file=sys.stderr)
-
     print()
     print(f"客户端 '{name}' 已删除!")
     print(f"  IP: {target_peer['allowed_ips']}")
@@ -140,6 +101,248 @@ def remove_peer(
     return True
 
 
+def _current_removal(
+    ssh: Transport,
+    interface: str,
+    public_keys: list[str]
+) -> Flow[tuple[Optional[str], str]]:
+    """重新读取已被修改的配置，返回 (删除 peer 后的内容, 读取时的指纹)"""
+    interfaces = yield from scan_interfaces_flow(ssh)
+    current = next((i for i in interfaces if i.name == interface), None)
+    if current is None:
+        print(f"错误: 接口 {interface} 的配置文件已不存在", file=sys.stderr)
+        return None, ""
+    new_config, _ = remove_peer_sections(current.content, set(public_keys))
+    return new_config, current.fingerprint
+
+
+@trace.traced("remove_peer.apply")
+def _apply_removal(
+    ssh: Transport,
+    selected: InterfaceConfig,
+    new_config: str,
+    public_keys: list[str]
+) -> Flow[bool]:
+    """写入更新后的配置并从运行中的 WireGuard 移除 peer
+
+    写入、移除与校验在一次往返中完成，多个 peer 用一条带多个
+    peer ... remove 子句的 wg set 命令移除。
+    写入按扫描时的指纹保护：配置文件在扫描后被修改时不覆盖，
+    重新读取并在当前内容上删除后再写入。
+    """
+    interface = selected.name
+    config_path = ssh.config_path(interface)
+
+    def write_and_remove(content: str, fingerprint: str) -> RemoteBatch:
+        batch = ssh.batch()
+        batch.write_file(config_path, content.strip() + '\n', fingerprint=fingerprint or None)
+        batch.run(remove_peers_command(interface, public_keys))
+        batch.run(verify_peers_command(interface, public_keys, present=False),
+                  description="校验 peer 已移除")
+        return batch
+
+    print(f"更新配置文件并从运行中的服务移除客户端...")
+    success, results = yield write_and_remove(new_config, selected.fingerprint)
+
+    if results and results[0].returncode == FINGERPRINT_MISMATCH:
+        print("配置文件在读取后已被修改，重新读取后删除...")
+        new_config, fingerprint = yield from _current_removal(ssh, interface, public_keys)
+        if new_config is None:
+            return False
+        success, results = yield write_and_remove(new_config, fingerprint)
+
+    if results and results[0].returncode == FINGERPRINT_MISMATCH:
+        print("错误: 配置文件仍在被其他操作修改，未写入，请重试", file=sys.stderr)
+        return False
+    if not results or not results[0].success:
+        msg = results[0].output if results else ""
+        print(f"写入配置失败: {msg}", file=sys.stderr)
+        return False
+    if ssh.index is not None:
+        ssh.index.remove_peers(ssh.cache_key, interface, public_keys)
+    if ssh.store is not None:
+        ssh.store.remove_peers(ssh.cache_key, interface, public_keys)
+
+    if success:
+        print("运行中的接口: 已通过 wg set 移除（未重载接口）")
+        return True
+
+    # 如果动态移除失败，尝试重载配置
+    print("动态移除失败，尝试重载配置...")
+    batch = ssh.batch()
+    batch.run(syncconf_command(interface, config_path), description=f"wg syncconf {interface}")
+    batch.run(verify_peers_command(interface, public_keys, present=False),
+              description="校验 peer 已移除")
+    success, results = yield batch
+    if success:
+        print("运行中的接口: 已通过 wg syncconf 同步")
+    else:
+        msg = results[-1].output if results else ""
+        print(f"警告: 重载配置失败，可能需要重启服务: {msg}", file=sys.stderr)
+
+    return True
+
+
+def match_peers(
+    peers: list[dict],
+    names: Optional[list[str]] = None,
+    public_keys: Optional[list[str]] = None,
+    pattern: Optional[str] = None,
+    regex: bool = False
+) -> tuple[list[dict], list[str]]:
+    """按名称、公钥或名称模式筛选 peer
+
+    Args:
+        peers: parse_peers 的返回值
+        names: 名称列表（精确匹配）
+        public_keys: 公钥列表
+        pattern: 名称模式，默认按 glob 匹配
+        regex: pattern 是否为正则表达式（re.search 语义）
+
+    Returns:
+        (匹配的 peer 列表, 未找到的名称/公钥列表)
+
+    Raises:
+        re.error: 正则表达式无效
+    """
+    names = names or []
+    public_keys = public_keys or []
+    name_set, key_set = set(names), set(public_keys)
+    if pattern is None:
+        matcher = None
+    elif regex:
+        matcher = re.compile(pattern).search
+    else:
+        matcher = re.compile(fnmatch.translate(pattern)).match
+
+    matched = []
+    found = set()
+    for peer in peers:
+        hit = False
+        if peer["name"] in name_set:
+            found.add(peer["name"])
+            hit = True
+        if peer["public_key"] in key_set:
+            found.add(peer["public_key"])
+            hit = True
+        if matcher is not None and matcher(peer["name"]):
+            hit = True
+        if hit:
+            matched.append(peer)
+
+    missing = [x for x in names + public_keys if x not in found]
+    return matched, missing
+
+
+def remove_peers(
+    host: str,
+    names: Optional[list[str]] = None,
+    public_keys: Optional[list[str]] = None,
+    pattern: Optional[str] = None,
+    regex: bool = False,
+    interface: Optional[str] = None,
+    ssh_port: int = 22,
+    key_file: Optional[str] = None
+) -> bool:
+    """批量删除客户端节点
+
+    所有匹配的 peer 在一次解析、一次重写中删除，并通过一条 wg set
+    命令从运行中的接口移除。
+
+    Args:
+        host: 服务器地址 (user@host 格式)
+        names: 客户端名称列表
+        public_keys: 客户端公钥列表
+        pattern: 名称模式（glob，regex 为 True 时为正则表达式）
+        regex: pattern 是否为正则表达式
+        interface: 指定接口名称（留空则自动检测/询问）
+        ssh_port: SSH 端口，默认 22
+        key_file: SSH 私钥文件路径
+
+    Returns:
+        是否成功
+    """
+    if not _check_selection(names, public_keys, pattern, regex):
+        return False
+
+    ssh, _ = connect_ssh(host, ssh_port, key_file)
+    if ssh is None:
+        return False
+
+    with ssh:
+        return run_flow(ssh, _remove_peers_flow(
+            ssh, names, public_keys, pattern, regex, interface
+        ))
+
+
+def _check_selection(
+    names: Optional[list[str]],
+    public_keys: Optional[list[str]],
+    pattern: Optional[str],
+    regex: bool
+) -> bool:
+    """检查批量删除的筛选条件：至少指定一项，正则表达式有效"""
+    if not names and not public_keys and pattern is None:
+        print("错误: 请指定要删除的客户端名称、公钥或名称模式", file=sys.stderr)
+        return False
+
+    if regex and pattern is not None:
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            print(f"错误: 正则表达式无效: {e}", file=sys.stderr)
+            return False
+    return True
+
+
+@trace.traced("remove_peers")
+def _remove_peers_flow(
+    ssh: Transport,
+    names: Optional[list[str]],
+    public_keys: Optional[list[str]],
+    pattern: Optional[str],
+    regex: bool,
+    interface: Optional[str],
+    interactive: bool = True
+) -> Flow[bool]:
+    """在已建立的连接上批量删除客户端节点（远程操作流程）"""
+    print("扫描 WireGuard 配置...")
+    interfaces = yield from scan_interfaces_flow(ssh)
+
+    if not interfaces:
+        print("错误: 服务器上没有 WireGuard 配置文件", file=sys.stderr)
+        return False
+
+    selected = select_interface(interfaces, interface, interactive)
+    if selected is None:
+        return False
+
+    targets, missing = match_peers(selected.peers, names, public_keys, pattern, regex)
+    for item in missing:
+        print(f"警告: 客户端 '{item}' 不存在", file=sys.stderr)
+
+    if not targets:
+        print("错误: 没有匹配的客户端", file=sys.stderr)
+        return False
+
+    target_keys = [peer["public_key"] for peer in targets]
+    new_config, removed = remove_peer_sections(selected.content, set(target_keys))
+    if removed == 0:
+        print("错误: 无法从配置中删除匹配的客户端", file=sys.stderr)
+        return False
+
+    applied = yield from _apply_removal(ssh, selected, new_config, target_keys)
+    if not applied:
+        return False
+
+    print()
+    print(f"已从 {selected.name} 删除 {len(targets)} 个客户端!")
+    for peer in targets:
+        print(f"  - {peer['name']}: {peer['allowed_ips']}")
+
+    return True
+
+
 def list_peers(
     host: str,
     interface: Optional[str] = None,
@@ -161,8 +364,15 @@ def list_peers(
     if ssh is None:
         return False
 
+    with ssh:
+        return run_flow(ssh, _list_peers_flow(ssh, interface))
+
+
+@trace.traced("list_peers")
+def _list_peers_flow(ssh: Transport, interface: Optional[str]) -> Flow[bool]:
+    """在已建立的连接上列出客户端节点（远程操作流程）"""
     # 扫描配置文件
-    interfaces = scan_interfaces(ssh)
+    interfaces = yield from scan_interfaces_flow(ssh)
 
     if not interfaces:
         print("服务器上没有 WireGuard 配置文件")
@@ -170,24 +380,18 @@ def list_peers(
 
     # 过滤接口
     if interface:
-        interfaces = [(i, n) for i, n in interfaces if i == interface]
+        interfaces = [i for i in interfaces if i.name == interface]
         if not interfaces:
             print(f"错误: 接口 {interface} 不存在", file=sys.stderr)
             return False
 
     # 列出每个接口的客户端
-    for iface, network in interfaces:
-        config_path = f"{REMOTE_WG_DIR}/{iface}.conf"
-        success, config_content = ssh.read_remote_file(config_path)
-        if not success:
-            continue
-
-        peers = parse_peers(config_content)
-        print(f"\n{iface} ({network}):")
-        if not peers:
+    for iface in interfaces:
+        print(f"\n{iface.name} ({iface.network}):")
+        if not iface.peers:
             print("  (无客户端)")
         else:
-            for peer in peers:
+            for peer in iface.peers:
                 print(f"  - {peer['name']}: {peer['allowed_ips']}")
 
     return True
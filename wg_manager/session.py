@@ -0,0 +1,82 @@
+"""连接目标主机
+
+connect_ssh 按目标创建传输（SSHClient 或 LocalTransport）并测试连接，
+再按设置接入远程配置文件本地缓存、跨主机客户端索引和本地状态库。
+传输层（transport、ssh、aio）本身不依赖这些模块。
+"""
+
+import sys
+import socket
+from typing import Optional
+
+from .cache import ConfigCache, cache_enabled
+from .index import PeerIndex
+from .ssh import SSHClient, SSHConfig, parse_host
+from .store import open_store
+from .transport import LocalTransport, Transport, parse_local_target
+
+
+def attach_state(transport: Transport, use_cache: Optional[bool] = None) -> None:
+    """为传输接入缓存、客户端索引和本地状态库
+
+    本地传输直接读取配置文件，不使用缓存。
+
+    Args:
+        transport: 传输（同步或异步）
+        use_cache: 是否接入，默认取 cache_enabled()
+    """
+    if not (cache_enabled() if use_cache is None else use_cache):
+        return
+    if not isinstance(transport, LocalTransport):
+        transport.cache = ConfigCache()
+    transport.index = PeerIndex()
+    transport.store = open_store()
+
+
+def connect_ssh(
+    host: str,
+    ssh_port: int = 22,
+    key_file: Optional[str] = None,
+    multiplex: bool = True,
+    use_cache: Optional[bool] = None
+) -> tuple[Optional[Transport], str]:
+    """创建并测试 SSH 连接
+
+    host 为 local 或 local:<根目录> 时不经过 SSH，返回 LocalTransport，
+    server 为本机主机名（用作客户端配置的 Endpoint）。
+
+    Args:
+        host: 服务器地址 (user@host 格式)，或本地执行目标
+        ssh_port: SSH 端口
+        key_file: SSH 私钥文件路径
+        multiplex: 是否建立持久的多路复用会话
+        use_cache: 是否启用远程配置文件本地缓存、客户端索引和本地状态库，默认取 cache_enabled()
+
+    Returns:
+        (传输, server) 元组，失败时传输为 None。
+        调用方使用完毕后应调用 close()（或使用 with 语句）关闭会话
+    """
+    root = parse_local_target(host)
+    if root is not None:
+        local = LocalTransport(root)
+        success, msg = local.test_connection()
+        if not success:
+            print(f"本地执行失败: {msg}", file=sys.stderr)
+            return None, host
+        attach_state(local, use_cache)
+        return local, socket.getfqdn()
+
+    user, server = parse_host(host)
+
+    ssh_config = SSHConfig(host=server, port=ssh_port, user=user, key_file=key_file)
+    ssh = SSHClient(ssh_config, multiplex=multiplex)
+    attach_state(ssh, use_cache)
+
+    print(f"连接到 {user}@{server}...")
+    success, msg = ssh.test_connection()
+    if not success:
+        ssh.close()
+        print(f"SSH 连接失败: {msg}", file=sys.stderr)
+        return None, server
+
+    return ssh, server
@@ -1,10 +1,22 @@
 """SSH 远程管理模块"""
 
-import sys
+import os
+import shutil
+import tempfile
+import time
 import subprocess
+import weakref
+from abc import abstractmethod
 from dataclasses import dataclass
 from typing import Optional
 
+from . import trace
+from .transport import Transport
+
+
+# 等待 ControlMaster 建立连接的超时时间（秒），与 ConnectTimeout 保持一致
+CONNECT_TIMEOUT = 10
+
 
 def parse_host(host_string: str) -> tuple[str, str]:
     """解析 user@host 格式的字符串
@@ -30,20 +42,71 @@ class SSHConfig:
     key_file: Optional[str] = None
 
 
-class SSHClient:
-    """SSH 客户端 - 使用系统 ssh 命令"""
+def _shutdown_master(master: subprocess.Popen, control_dir: str) -> None:
+    """终止 ControlMaster 进程并清理控制目录"""
+    if master.poll() is None:
+        master.terminate()
+        try:
+            master.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            master.kill()
+            master.wait()
+    shutil.rmtree(control_dir, ignore_errors=True)
+
+
+class BaseSSHClient(Transport):
+    """SSH 客户端的公共部分：连接参数、ssh 命令构建和往返统计
+
+    SSHClient（同步）与 aio.AsyncSSHClient（asyncio）在此基础上实现远程调用。
+    """
 
-    def __init__(self, config: SSHConfig):
+    def __init__(self, config: SSHConfig, multiplex: bool = True):
+        super().__init__()
         self.config = config
+        self.multiplex = multiplex
         self._connected = False
+        self._control_dir: Optional[str] = None
+        self._finalizer: Optional[weakref.finalize] = None
 
-    def _build_ssh_cmd(self, extra_args: list[str] = None) -> list[str]:
-        """构建 SSH 命令"""
+    @property
+    def control_path(self) -> Optional[str]:
+        """ControlMaster 套接字路径，未建立复用会话时为 None"""
+        if self._control_dir is None:
+            return None
+        return os.path.join(self._control_dir, "control")
+
+    @property
+    @abstractmethod
+    def multiplexed(self) -> bool:
+        """复用会话是否可用"""
+
+    @property
+    def handshakes_saved(self) -> int:
+        """复用会话节省的握手次数"""
+        return max(self.round_trips - self.handshakes, 0)
+
+    def summary(self) -> str:
+        """连接统计信息"""
+        return (
+            f"SSH 远程操作 {self.round_trips} 次，握手 {self.handshakes} 次"
+            f"（节省 {self.handshakes_saved} 次）"
+        )
+
+    def _target(self) -> str:
+        return f"{self.config.user}@{self.config.host}"
+
+    @property
+    def cache_key(self) -> str:
+        """本地缓存中标识该服务器的键"""
+        return f"{self._target()}:{self.config.port}"
+
+    def _base_cmd(self) -> list[str]:
+        """构建不含目标主机的 ssh 基础命令"""
         cmd = [
             "ssh",
             "-o", "StrictHostKeyChecking=no",
             "-o", "BatchMode=yes",
-            "-o", "ConnectTimeout=10"
+            "-o", f"ConnectTimeout={CONNECT_TIMEOUT}"
         ]
 
         if self.config.port != 22:
@@ -52,82 +115,156 @@ class SSHClient:
         if self.config.key_file:
             cmd.extend(["-i", self.config.key_file])
 
-        cmd.append(f"{self.config.user}@{self.config.host}")
+        return cmd
+
+    def _build_ssh_cmd(self, extra_args: list[str] = None) -> list[str]:
+        """构建 SSH 命令，复用会话可用时通过控制套接字执行"""
+        cmd = self._base_cmd()
+
+        if self.multiplexed:
+            cmd.extend([
+                "-o", "ControlMaster=no",
+                "-o", f"ControlPath={self.control_path}"
+            ])
+
+        cmd.append(self._target())
 
         if extra_args:
             cmd.extend(extra_args)
 
         return cmd
 
-    def test_connection(self) -> tuple[bool, str]:
-        """测试 SSH 连接"""
-        try:
-            cmd = self._build_ssh_cmd(["echo", "ok"])
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                self._connected = True
+    def _master_cmd(self) -> list[str]:
+        """构建 ControlMaster 进程的命令（控制目录已创建）"""
+        return self._base_cmd() + [
+            "-M", "-N",
+            "-o", f"ControlPath={self.control_path}",
+            "-o", "ControlPersist=no",
+            self._target()
+        ]
+
+    def _exit_master_cmd(self) -> list[str]:
+        """构建通知 ControlMaster 退出的命令"""
+        return self._base_cmd() + [
+            "-o", f"ControlPath={self.control_path}",
+            "-O", "exit", self._target()
+        ]
+
+    def _count_round_trip(self) -> None:
+        self.round_trips += 1
+        if not self.multiplexed:
+            self.handshakes += 1
+
+    def _trace_exec(self, span, command: str, input: Optional[str]) -> None:
+        """记录远程调用的目标、脱敏后的命令、发送字节数和是否复用会话"""
+        super()._trace_exec(span, command, input)
+        if span.recording:
+            span.set(multiplexed=self.multiplexed)
+
+
+class SSHClient(BaseSSHClient):
+    """SSH 客户端 - 使用系统 ssh 命令
+
+    默认通过 OpenSSH ControlMaster 维持一个持久的多路复用会话：
+    test_connection 建立主连接，之后所有命令复用同一个 TCP 连接，
+    无需重复握手和认证。会话在 close() 时（或对象被回收时）关闭。
+    """
+
+    def __init__(self, config: SSHConfig, multiplex: bool = True):
+        super().__init__(config, multiplex)
+        self._master: Optional[subprocess.Popen] = None
+
+    @property
+    def multiplexed(self) -> bool:
+        """复用会话是否可用"""
+        return self._master is not None and self._master.poll() is None
+
+    def _start_master(self) -> tuple[bool, str]:
+        """启动 ControlMaster 进程，等待控制套接字就绪"""
+        self._control_dir = tempfile.mkdtemp(prefix="wg-manager-ssh-")
+        control_path = self.control_path
+        log_path = os.path.join(self._control_dir, "master.log")
+
+        with open(log_path, "wb") as log:
+            master = subprocess.Popen(
+                self._master_cmd(),
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=log
+            )
+
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        while time.monotonic() < deadline:
+            # 控制套接字在认证完成后才会创建
+            if os.path.exists(control_path):
+                self._master = master
+                self._finalizer = weakref.finalize(
+                    self, _shutdown_master, master, self._control_dir
+                )
                 return True, "连接成功"
-            return False, result.stderr.strip() or "连接失败"
-        except subprocess.TimeoutExpired:
+            if master.poll() is not None:
+                break
+            time.sleep(0.02)
+
+        timed_out = master.poll() is None
+        with open(log_path, "rb") as log:
+            error = log.read().decode(errors="replace").strip()
+        _shutdown_master(master, self._control_dir)
+        self._control_dir = None
+        if timed_out:
             return False, "连接超时"
-        except Exception as e:
-            return False, str(e)
+        return False, error or "连接失败"
 
-    def run_command(self, command: str, timeout: int = 30) -> tuple[bool, str]:
-        """执行远程命令"""
-        try:
-            cmd = self._build_ssh_cmd([command])
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
-            if result.returncode == 0:
-                return True, result.stdout.strip()
-            return False, result.stderr.strip() or result.stdout.strip()
-        except subprocess.TimeoutExpired:
-            return False, "命令执行超时"
-        except Exception as e:
-            return False, str(e)
+    @trace.traced("ssh.connect")
+    def test_connection(self) -> tuple[bool, str]:
+        """测试 SSH 连接（启用复用时同时建立持久会话）"""
+        self.round_trips += 1
+        self.handshakes += 1
 
-    def read_remote_file(self, remote_path: str) -> tuple[bool, str]:
-        """读取远程文件内容"""
-        return self.run_command(f"cat {remote_path}")
+        if self.multiplex and not self.multiplexed:
+            try:
+                success, msg = self._start_master()
+            except Exception as e:
+                success, msg = False, str(e)
+            if success:
+                self._connected = True
+                return True, msg
+            # 复用会话不可用（如 ssh 不支持 ControlMaster），退回逐条连接
+            self.multiplex = False
 
-    def write_remote_file(self, remote_path: str, content: str) -> tuple[bool, str]:
-        """写入远程文件（通过 stdin）"""
         try:
-            cmd = self._build_ssh_cmd([f"cat > {remote_path}"])
+            cmd = self._build_ssh_cmd(["echo", "ok"])
             result = subprocess.run(
-                cmd, input=content, capture_output=True, text=True, timeout=30
+                cmd, stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=10
             )
             if result.returncode == 0:
-                return True, "写入成功"
-            return False, result.stderr.strip()
+                self._connected = True
+                return True, "连接成功"
+            return False, result.stderr.strip() or "连接失败"
+        except subprocess.TimeoutExpired:
+            return False, "连接超时"
         except Exception as e:
             return False, str(e)
 
+    def close(self) -> None:
+        """关闭复用会话"""
+        if self._master is not None:
+            try:
+                subprocess.run(self._exit_master_cmd(), capture_output=True, timeout=5)
+            except Exception:
+                pass
+            self._finalizer()
+            self._master = None
+            self._control_dir = None
+        self._connected = False
 
-def connect_ssh(
-    host: str,
-    ssh_port: int = 22,
-    key_file: Optional[str] = None
-) -> tuple[Optional[SSHClient], str]:
-    """创建并测试 SSH 连接
-
-    Args:
-        host: 服务器地址 (user@host 格式)
-        ssh_port: SSH 端口
-        key_file: SSH 私钥文件路径
-
-    Returns:
-        (SSHClient, server) 元组，失败时 SSHClient 为 None
-    """
-    user, server = parse_host(host)
-
-    ssh_config = SSHConfig(host=server, port=ssh_port, user=user, key_file=key_file)
-    ssh = SSHClient(ssh_config)
-
-    print(f"连接到 {user}@{server}...")
-    success, msg = ssh.test_connection()
-    if not success:
-        print(f"SSH 连接失败: {msg}", file=sys.stderr)
-        return None, server
-
-    return ssh, server
+    def _exec(
+        self, command: str, input: Optional[str] = None, timeout: int = 30
+    ) -> subprocess.CompletedProcess:
+        """执行一次远程调用（一个往返），超时抛出 subprocess.TimeoutExpired"""
+        cmd = self._build_ssh_cmd([command])
+        self._count_round_trip()
+        with trace.span("ssh.exec") as span:
+            self._trace_exec(span, command, input)
+            # 无输入时不继承本地 stdin，避免 ssh 读取终端或管道导致阻塞（等同 ssh -n）
+            result = self._run_process(cmd, input, timeout)
+            self._trace_result(span, result)
+            return result
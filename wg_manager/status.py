@@ -0,0 +1,364 @@
+"""运行状态模块
+
+一次往返取回配置文件和 wg show all dump 的输出，按公钥关联：
+名称和地址来自配置文件（Peer 段的注释），Endpoint、最近握手时间和
+收发字节数来自运行中的接口。--watch 模式在同一个会话上定时轮询，
+并根据两次轮询的差值计算收发速率。
+"""
+
+import sys
+import time
+import heapq
+import fnmatch
+import unicodedata
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+from . import trace
+from .parser import InterfaceConfig, InterfaceScan
+from .session import connect_ssh
+from .transport import Flow, Transport, run_flow
+
+
+@dataclass(slots=True)
+class PeerStatus:
+    """一个 Peer 的运行状态（大量 Peer 时使用 __slots__ 减少内存）"""
+    interface: str
+    public_key: str
+    # 配置文件中的名称，不在配置文件中的 Peer 为空字符串
+    name: str = ""
+    allowed_ips: str = ""
+    endpoint: str = ""
+    # 最近一次握手的 Unix 时间戳，0 表示从未握手
+    latest_handshake: int = 0
+    rx: int = 0
+    tx: int = 0
+    # 是否在配置文件中 / 是否在运行中的接口上
+    configured: bool = True
+    running: bool = True
+    # 每秒收发字节数（--watch 模式下根据两次轮询计算）
+    rx_rate: float = 0.0
+    tx_rate: float = 0.0
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return self.interface, self.public_key
+
+    @property
+    def label(self) -> str:
+        """显示名称：未命名时显示公钥前缀"""
+        return self.name or f"({self.public_key[:10]}…)"
+
+
+@dataclass
+class StatusSnapshot:
+    """一次轮询的结果"""
+    peers: list[PeerStatus]
+    # 运行中的接口及其监听端口
+    running: dict[str, int]
+    # 远程主机的当前时间（Unix 时间戳），用于计算握手距今的时长
+    now: int
+    # 本地单调时钟时间，用于计算速率
+    polled_at: float
+
+
+def _to_int(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+def parse_dump(output: str) -> tuple[dict[str, int], list[PeerStatus]]:
+    """解析 wg show all dump 的输出
+
+    接口行为 5 列（接口、私钥、公钥、监听端口、fwmark），
+    Peer 行为 9 列（接口、公钥、预共享密钥、endpoint、allowed-ips、
+    最近握手、接收字节、发送字节、keepalive）。
+
+    Returns:
+        ({接口: 监听端口}, [PeerStatus, ...])
+    """
+    running: dict[str, int] = {}
+    peers = []
+    append = peers.append
+    for line in output.splitlines():
+        fields = line.split("\t")
+        if len(fields) == 9:
+            iface, public_key, _, endpoint, allowed_ips, handshake, rx, tx, _ = fields
+            append(PeerStatus(
+                iface, public_key, "",
+                "" if allowed_ips == "(none)" else allowed_ips.replace(",", ", "),
+                "" if endpoint == "(none)" else endpoint,
+                _to_int(handshake), _to_int(rx), _to_int(tx), False,
+            ))
+        elif len(fields) == 5:
+            running[fields[0]] = _to_int(fields[3])
+    return running, peers
+
+
+def join_status(
+    interfaces: list[InterfaceConfig],
+    running: dict[str, int],
+    runtime: list[PeerStatus]
+) -> list[PeerStatus]:
+    """按 (接口, 公钥) 关联配置文件与运行状态
+
+    配置文件中有而运行中没有的 Peer 标记为 running=False，
+    运行中有而配置文件中没有的 Peer 标记为 configured=False。
+    """
+    by_key = {peer.key: peer for peer in runtime}
+    joined = []
+    for iface in interfaces:
+        for info in iface.peers:
+            peer = by_key.pop((iface.name, info["public_key"]), None)
+            if peer is None:
+                peer = PeerStatus(iface.name, info["public_key"], running=False)
+            peer.name = info["name"]
+            peer.allowed_ips = info["allowed_ips"]
+            peer.configured = True
+            joined.append(peer)
+    joined.extend(by_key.values())
+    return joined
+
+
+@trace.traced("status.poll")
+def _poll_flow(ssh: Transport, interface: Optional[str] = None) -> Flow[Optional[StatusSnapshot]]:
+    """在一次往返中取回配置文件、运行状态和远程时间（远程操作流程）"""
+    scan = InterfaceScan(ssh)
+    batch = ssh.batch()
+    batch.run(scan.command, check=False, description="扫描配置文件")
+    batch.run("wg show all dump")
+    batch.run("date +%s", check=False)
+    _, results = yield batch
+    polled_at = time.monotonic()
+    if len(results) < 2:
+        print(f"获取运行状态失败: {results[-1].output if results else ''}", file=sys.stderr)
+        return None
+    if not results[1].success:
+        print(f"获取运行状态失败: {results[1].output}", file=sys.stderr)
+        return None
+
+    interfaces = yield from scan.finish(results[0].output if results[0].success else None)
+    running, runtime = parse_dump(results[1].output)
+    if interface:
+        interfaces = [i for i in interfaces if i.name == interface]
+        runtime = [p for p in runtime if p.interface == interface]
+        if not interfaces and interface not in running:
+            print(f"错误: 接口 {interface} 不存在", file=sys.stderr)
+            return None
+
+    now = results[2].output if len(results) > 2 and results[2].success else ""
+    return StatusSnapshot(
+        peers=join_status(interfaces, running, runtime),
+        running=running,
+        now=int(now) if now.isdigit() else int(time.time()),
+        polled_at=polled_at,
+    )
+
+
+def apply_rates(current: StatusSnapshot, previous: Optional[StatusSnapshot]) -> None:
+    """根据上一次轮询计算每个 Peer 的收发速率（接口重启导致计数归零时按 0 计）"""
+    if previous is None:
+        return
+    elapsed = current.polled_at - previous.polled_at
+    if elapsed <= 0:
+        return
+    before = {peer.key: peer for peer in previous.peers}
+    for peer in current.peers:
+        old = before.get(peer.key)
+        if old is None:
+            continue
+        peer.rx_rate = max(peer.rx - old.rx, 0) / elapsed
+        peer.tx_rate = max(peer.tx - old.tx, 0) / elapsed
+
+
+# 排序字段: (排序键, 默认是否降序)
+SORT_KEYS: dict[str, tuple[Callable[[PeerStatus], object], bool]] = {
+    "name": (lambda p: (p.interface, p.label.lower()), False),
+    "handshake": (lambda p: p.latest_handshake, True),
+    "rx": (lambda p: p.rx, True),
+    "tx": (lambda p: p.tx, True),
+    "total": (lambda p: p.rx + p.tx, True),
+    "rate": (lambda p: p.rx_rate + p.tx_rate, True),
+}
+
+
+def filter_peers(
+    peers: Iterable[PeerStatus],
+    match: Optional[str] = None,
+    active: Optional[int] = None,
+    stale: Optional[int] = None,
+    now: Optional[int] = None
+) -> Iterable[PeerStatus]:
+    """按条件过滤（惰性求值）
+
+    Args:
+        peers: Peer 状态
+        match: 名称或公钥的 glob 模式
+        active: 只保留最近 active 秒内握手过的 Peer
+        stale: 只保留超过 stale 秒未握手（或从未握手）的 Peer
+        now: 当前时间戳，默认本地时间
+    """
+    now = int(time.time()) if now is None else now
+    if match:
+        peers = (p for p in peers
+                 if fnmatch.fnmatchcase(p.name, match) or fnmatch.fnmatchcase(p.public_key, match))
+    if active is not None:
+        peers = (p for p in peers if p.latest_handshake and now - p.latest_handshake <= active)
+    if stale is not None:
+        peers = (p for p in peers if not p.latest_handshake or now - p.latest_handshake > stale)
+    return peers
+
+
+def sort_peers(
+    peers: Iterable[PeerStatus],
+    by: str = "name",
+    reverse: bool = False,
+    limit: Optional[int] = None
+) -> list[PeerStatus]:
+    """排序，指定 limit 时只取前 limit 个（堆选择，O(n log limit)）"""
+    key, descending = SORT_KEYS[by]
+    if reverse:
+        descending = not descending
+    if limit is not None:
+        select = heapq.nlargest if descending else heapq.nsmallest
+        return select(limit, peers, key=key)
+    return sorted(peers, key=key, reverse=descending)
+
+
+def format_bytes(size: float) -> str:
+    """字节数的可读形式"""
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TiB"
+
+
+def format_age(timestamp: int, now: int) -> str:
+    """握手时间距今的可读形式"""
+    if not timestamp:
+        return "从未"
+    seconds = max(now - timestamp, 0)
+    if seconds < 60:
+        return f"{seconds} 秒前"
+    if seconds < 3600:
+        return f"{seconds // 60} 分钟前"
+    if seconds < 86400:
+        return f"{seconds // 3600} 小时前"
+    return f"{seconds // 86400} 天前"
+
+
+def _width(text: str) -> int:
+    """显示宽度（中文字符占两列）"""
+    return sum(2 if unicodedata.east_asian_width(c) in "WF" else 1 for c in text)
+
+
+def _pad(text: str, width: int, left: bool = False) -> str:
+    fill = " " * (width - _width(text))
+    return text + fill if left else fill + text
+
+
+def format_status(
+    snapshot: StatusSnapshot,
+    peers: list[PeerStatus],
+    rates: bool = False
+) -> str:
+    """状态表格"""
+    header = ["接口", "名称", "地址", "Endpoint", "最近握手", "接收", "发送"]
+    if rates:
+        header += ["接收速率", "发送速率"]
+    rows = [header]
+    for peer in peers:
+        state = "" if peer.running else " [未运行]"
+        if not peer.configured:
+            state = " [不在配置中]"
+        row = [
+            peer.interface,
+            peer.label + state,
+            peer.allowed_ips or "-",
+            peer.endpoint or "-",
+            format_age(peer.latest_handshake, snapshot.now),
+            format_bytes(peer.rx),
+            format_bytes(peer.tx),
+        ]
+        if rates:
+            row += [f"{format_bytes(peer.rx_rate)}/s", f"{format_bytes(peer.tx_rate)}/s"]
+        rows.append(row)
+
+    widths = [max(_width(row[i]) for row in rows) for i in range(len(header))]
+    lines = [
+        "  ".join(_pad(cell, width, left=i < 4) for i, (cell, width) in enumerate(zip(row, widths)))
+        for row in rows
+    ]
+    total = len(snapshot.peers)
+    online = sum(1 for p in snapshot.peers if p.latest_handshake and snapshot.now - p.latest_handshake <= 180)
+    lines.append("")
+    lines.append(f"显示 {len(peers)}/{total} 个客户端，3 分钟内握手 {online} 个，"
+                 f"运行中的接口: {', '.join(sorted(snapshot.running)) or '无'}")
+    return "\n".join(lines)
+
+
+def show_status(
+    host: str,
+    interface: Optional[str] = None,
+    sort: str = "name",
+    reverse: bool = False,
+    limit: Optional[int] = None,
+    match: Optional[str] = None,
+    active: Optional[int] = None,
+    stale: Optional[int] = None,
+    watch: Optional[float] = None,
+    ssh_port: int = 22,
+    key_file: Optional[str] = None
+) -> bool:
+    """显示客户端的运行状态
+
+    Args:
+        host: 服务器地址 (user@host 格式)
+        interface: 指定接口名称（留空则显示所有）
+        sort: 排序字段，见 SORT_KEYS
+        reverse: 反转排序方向
+        limit: 最多显示的客户端数量
+        match: 名称或公钥的 glob 模式
+        active: 只显示最近 active 秒内握手过的客户端
+        stale: 只显示超过 stale 秒未握手的客户端
+        watch: 指定时每隔 watch 秒刷新一次（Ctrl-C 退出），并显示收发速率
+        ssh_port: SSH 端口，默认 22
+        key_file: SSH 私钥文件路径
+
+    Returns:
+        是否成功
+    """
+    ssh, _ = connect_ssh(host, ssh_port, key_file)
+    if ssh is None:
+        return False
+
+    def render(snapshot: StatusSnapshot) -> str:
+        peers = filter_peers(snapshot.peers, match, active, stale, snapshot.now)
+        return format_status(snapshot, sort_peers(peers, sort, reverse, limit), rates=watch is not None)
+
+    with ssh:
+        snapshot = run_flow(ssh, _poll_flow(ssh, interface))
+        if snapshot is None:
+            return False
+        if watch is None:
+            print(render(snapshot))
+            return True
+
+        # 同一个会话上定时轮询，每次一个往返
+        clear = "\033[H\033[J" if sys.stdout.isatty() else ""
+        try:
+            while True:
+                print(f"{clear}{time.strftime('%H:%M:%S')}  每 {watch:g} 秒刷新，Ctrl-C 退出\n")
+                print(render(snapshot), flush=True)
+                time.sleep(watch)
+                current = run_flow(ssh, _poll_flow(ssh, interface))
+                if current is None:
+                    return False
+                apply_rates(current, snapshot)
+                snapshot = current
+        except KeyboardInterrupt:
+            print()
+            return True
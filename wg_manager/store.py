@@ -0,0 +1,433 @@
+"""本地状态库（SQLite）
+
+记录服务器、接口和客户端，由远程配置导入（wg-manager db sync）：
+
+- servers：主机（Transport.cache_key）与最近同步时间
+- interfaces：接口名称、配置文件路径与远程指纹、地址、端口、服务端公钥
+- peers：客户端名称、公钥和 AllowedIPs
+- addresses：接口网段内已占用的地址区间（相对网段起始地址的偏移，按起点索引），
+  用于分配地址
+
+同步时把已知指纹随扫描命令发给服务器，只有指纹变化的接口才会传输和解析；
+同步结果同时给出双向差异（服务器上新增的 / 本地有但服务器上已不存在的）。
+
+状态库存在时，add 在扫描得到的指纹与库中一致（一次廉价的新鲜度检查）后直接从
+addresses 表分配地址，不再解析整个配置文件；指纹不一致时先重新导入该接口。
+
+数据库路径默认为 $WG_MANAGER_DB，其次 $XDG_DATA_HOME/wg-manager/inventory.db，
+再次 ~/.local/share/wg-manager/inventory.db；不包含任何私钥。
+"""
+
+import os
+import time
+import heapq
+import sqlite3
+import ipaddress
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from .ipam import MAX_POOL_ADDRESSES, address_span, host_prefix, used_span
+from .model import Peer
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS servers (
+    id INTEGER PRIMARY KEY,
+    host TEXT NOT NULL UNIQUE,
+    synced_at REAL
+);
+CREATE TABLE IF NOT EXISTS interfaces (
+    id INTEGER PRIMARY KEY,
+    server_id INTEGER NOT NULL REFERENCES servers(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    fingerprint TEXT NOT NULL DEFAULT '',
+    address TEXT NOT NULL DEFAULT '',
+    listen_port INTEGER,
+    public_key TEXT NOT NULL DEFAULT '',
+    synced_at REAL,
+    UNIQUE (server_id, name)
+);
+CREATE TABLE IF NOT EXISTS peers (
+    id INTEGER PRIMARY KEY,
+    interface_id INTEGER NOT NULL REFERENCES interfaces(id) ON DELETE CASCADE,
+    name TEXT NOT NULL DEFAULT '',
+    public_key TEXT NOT NULL,
+    allowed_ips TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS peers_interface_key ON peers (interface_id, public_key);
+CREATE INDEX IF NOT EXISTS peers_name ON peers (name);
+CREATE INDEX IF NOT EXISTS peers_public_key ON peers (public_key);
+CREATE TABLE IF NOT EXISTS addresses (
+    interface_id INTEGER NOT NULL REFERENCES interfaces(id) ON DELETE CASCADE,
+    start INTEGER NOT NULL,
+    stop INTEGER NOT NULL,
+    -- 占用该区间的客户端公钥，服务端自身地址为空字符串
+    public_key TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS addresses_interface_start ON addresses (interface_id, start);
+CREATE INDEX IF NOT EXISTS addresses_interface_key ON addresses (interface_id, public_key);
+"""
+
+
+def default_store_path() -> str:
+    """默认数据库路径"""
+    if os.environ.get("WG_MANAGER_DB"):
+        return os.environ["WG_MANAGER_DB"]
+    base = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(base, "wg-manager", "inventory.db")
+
+
+def open_store(path: Optional[str] = None) -> Optional["Store"]:
+    """打开已存在的状态库（首次 wg-manager db sync 时创建），不存在时返回 None"""
+    path = path or default_store_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        return Store(path)
+    except sqlite3.Error:
+        return None
+
+
+@dataclass
+class Drift:
+    """一台主机本地状态与服务器配置的差异
+
+    客户端以 (接口, 名称, 公钥, AllowedIPs) 表示。
+    """
+    host: str
+    # 服务器上新增 / 已不存在的接口
+    added_interfaces: list[str] = field(default_factory=list)
+    removed_interfaces: list[str] = field(default_factory=list)
+    # 服务器上有、本地没有的客户端
+    remote_only: list[tuple[str, str, str, str]] = field(default_factory=list)
+    # 本地有、服务器上已不存在的客户端
+    local_only: list[tuple[str, str, str, str]] = field(default_factory=list)
+    # 两边都有但名称或 AllowedIPs 不同的客户端（值为服务器上的）
+    changed: list[tuple[str, str, str, str]] = field(default_factory=list)
+    # 指纹未变化、跳过的接口数 / 指纹变化、重新导入的接口数
+    unchanged: int = 0
+    imported: int = 0
+
+    @property
+    def clean(self) -> bool:
+        return not (self.added_interfaces or self.removed_interfaces
+                    or self.remote_only or self.local_only or self.changed)
+
+    def format(self) -> str:
+        """可读的差异报告"""
+        lines = []
+        for name in self.added_interfaces:
+            lines.append(f"  + 接口 {name}（服务器上新增）")
+        for name in self.removed_interfaces:
+            lines.append(f"  - 接口 {name}（服务器上已不存在）")
+        for mark, peers, note in (("+", self.remote_only, "仅在服务器上"),
+                                  ("-", self.local_only, "仅在本地"),
+                                  ("~", self.changed, "已修改")):
+            for interface, name, public_key, allowed_ips in peers:
+                label = name or f"({public_key[:10]}…)"
+                lines.append(f"  {mark} {interface} {label}: {allowed_ips}（{note}）")
+        if not lines:
+            lines.append("  与服务器一致")
+        return "\n".join(lines)
+
+
+def _peer_rows(peers: Iterable[Peer]) -> list[tuple[str, str, str]]:
+    return [(p.name, p.public_key, ", ".join(p.allowed_ips)) for p in peers if p.public_key]
+
+
+class Store:
+    """本地状态库
+
+    同一个 Store 不能被多个线程同时使用，并发的线程应各自打开 Store；
+    可以在线程间依次传递（aio 在线程池中逐步推进同一流程）。
+
+    Args:
+        path: 数据库路径，默认 default_store_path()
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_store_path()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def __enter__(self) -> "Store":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    # ----- 查询 -----
+
+    def _interface_row(self, host: str, interface: str) -> Optional[tuple]:
+        return self._conn.execute(
+            "SELECT i.id, i.fingerprint, i.address FROM interfaces i "
+            "JOIN servers s ON s.id = i.server_id WHERE s.host = ? AND i.name = ?",
+            (host, interface)
+        ).fetchone()
+
+    def fingerprints(self, host: str) -> dict[str, str]:
+        """主机各配置文件的已知指纹 {路径: 指纹}"""
+        return dict(self._conn.execute(
+            "SELECT i.path, i.fingerprint FROM interfaces i "
+            "JOIN servers s ON s.id = i.server_id WHERE s.host = ?",
+            (host,)
+        ))
+
+    def hosts(self) -> list[tuple[str, Optional[float]]]:
+        """[(主机, 最近同步时间), ...]"""
+        return list(self._conn.execute("SELECT host, synced_at FROM servers ORDER BY host"))
+
+    def interfaces(self, host: str) -> list[tuple[str, str, int]]:
+        """主机的接口 [(名称, 地址, 客户端数), ...]"""
+        return list(self._conn.execute(
+            "SELECT i.name, i.address, (SELECT COUNT(*) FROM peers p WHERE p.interface_id = i.id) "
+            "FROM interfaces i JOIN servers s ON s.id = i.server_id "
+            "WHERE s.host = ? ORDER BY i.name",
+            (host,)
+        ))
+
+    def peers(self, host: str, interface: str) -> list[tuple[str, str, str]]:
+        """接口的客户端 [(名称, 公钥, AllowedIPs), ...]，按添加顺序"""
+        return list(self._conn.execute(
+            "SELECT p.name, p.public_key, p.allowed_ips FROM peers p "
+            "JOIN interfaces i ON i.id = p.interface_id JOIN servers s ON s.id = i.server_id "
+            "WHERE s.host = ? AND i.name = ? ORDER BY p.id",
+            (host, interface)
+        ))
+
+    # ----- 同步 -----
+
+    def _server_id(self, host: str) -> int:
+        self._conn.execute("INSERT OR IGNORE INTO servers (host) VALUES (?)", (host,))
+        return self._conn.execute("SELECT id FROM servers WHERE host = ?", (host,)).fetchone()[0]
+
+    def _insert_peers(
+        self, interface_id: int, network, rows: list[tuple[str, str, str]]
+    ) -> None:
+        self._conn.executemany(
+            "INSERT INTO peers (interface_id, name, public_key, allowed_ips) VALUES (?, ?, ?, ?)",
+            [(interface_id, *row) for row in rows]
+        )
+        if network is None:
+            return
+        spans = []
+        for _, public_key, allowed_ips in rows:
+            for item in allowed_ips.split(","):
+                span = used_span(network, item)
+                if span is not None:
+                    spans.append(span + (public_key,))
+        self._insert_spans(interface_id, spans)
+
+    def _insert_spans(self, interface_id: int, spans: list[tuple[int, int, str]]) -> None:
+        # 只记录地址池范围内的部分（与 AddressPool 一致），偏移不会超出 SQLite 整数范围
+        self._conn.executemany(
+            "INSERT INTO addresses (interface_id, start, stop, public_key) VALUES (?, ?, ?, ?)",
+            [(interface_id, max(start, 0), min(stop, MAX_POOL_ADDRESSES), key)
+             for start, stop, key in spans if start < MAX_POOL_ADDRESSES and stop > 0]
+        )
+
+    def _replace_interface(self, server_id: int, iface) -> None:
+        """用扫描结果（parser.InterfaceConfig）重建接口的全部记录"""
+        config = iface.server_config
+        section = iface.model.interface
+        self._conn.execute(
+            "INSERT INTO interfaces (server_id, name, path, fingerprint, address, listen_port, "
+            "public_key, synced_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (server_id, name) DO UPDATE SET path = excluded.path, "
+            "fingerprint = excluded.fingerprint, address = excluded.address, "
+            "listen_port = excluded.listen_port, public_key = excluded.public_key, "
+            "synced_at = excluded.synced_at",
+            (server_id, iface.name, iface.path, iface.fingerprint, config["address"],
+             config["port"], config["public_key"], time.time())
+        )
+        interface_id = self._conn.execute(
+            "SELECT id FROM interfaces WHERE server_id = ? AND name = ?", (server_id, iface.name)
+        ).fetchone()[0]
+        self._conn.execute("DELETE FROM peers WHERE interface_id = ?", (interface_id,))
+        self._conn.execute("DELETE FROM addresses WHERE interface_id = ?", (interface_id,))
+
+        try:
+            network = ipaddress.ip_network(config["address"], strict=False)
+        except ValueError:
+            network = None
+        if network is not None and section is not None:
+            spans = []
+            for address in section.addresses:
+                span = used_span(network, address.split('/')[0])
+                if span is not None:
+                    spans.append(span + ("",))
+            self._insert_spans(interface_id, spans)
+        self._insert_peers(interface_id, network, _peer_rows(iface.model.peers))
+
+    def sync_host(
+        self,
+        host: str,
+        changed: list,
+        removed_paths: Iterable[str] = (),
+        unchanged: int = 0,
+        apply: bool = True
+    ) -> Drift:
+        """用一次扫描的结果同步主机，返回同步前本地与服务器的差异
+
+        Args:
+            host: 主机标识（Transport.cache_key）
+            changed: 指纹变化（或新增）的接口（parser.InterfaceConfig 列表）
+            removed_paths: 服务器上已不存在的配置文件路径
+            unchanged: 指纹未变化、未传输的接口数
+            apply: 为 False 时只计算差异，不修改状态库
+        """
+        drift = Drift(host, unchanged=unchanged, imported=len(changed))
+        with self._conn:
+            server_id = self._server_id(host)
+            for iface in changed:
+                row = self._interface_row(host, iface.name)
+                if row is None:
+                    drift.added_interfaces.append(iface.name)
+                    local = {}
+                else:
+                    local = {key: (name, ips) for name, key, ips in self._conn.execute(
+                        "SELECT name, public_key, allowed_ips FROM peers WHERE interface_id = ?",
+                        (row[0],)
+                    )}
+                remote = {key: (name, ips) for name, key, ips in _peer_rows(iface.model.peers)}
+                drift.remote_only += [(iface.name, *remote[k][:1], k, remote[k][1])
+                                      for k in remote if k not in local]
+                drift.local_only += [(iface.name, *local[k][:1], k, local[k][1])
+                                     for k in local if k not in remote]
+                drift.changed += [(iface.name, *remote[k][:1], k, remote[k][1])
+                                  for k in remote if k in local and remote[k] != local[k]]
+                if apply:
+                    self._replace_interface(server_id, iface)
+
+            for path in removed_paths:
+                name = self._conn.execute(
+                    "DELETE FROM interfaces WHERE server_id = ? AND path = ? RETURNING name",
+                    (server_id, path)
+                ).fetchone()
+                if name is not None:
+                    drift.removed_interfaces.append(name[0])
+
+            if apply:
+                self._conn.execute("UPDATE servers SET synced_at = ? WHERE id = ?",
+                                   (time.time(), server_id))
+            else:
+                self._conn.rollback()
+        return drift
+
+    # ----- 分配与记录 -----
+
+    def allocate(self, host: str, iface, count: int, reserved: Iterable[str] = ()) -> list[str]:
+        """从 addresses 表分配 count 个地址（不记录，添加成功后由 record_peers 记录）
+
+        扫描得到的指纹与库中一致时直接查表，否则先用 iface 重新导入该接口。
+
+        Args:
+            host: 主机标识（Transport.cache_key）
+            iface: 刚扫描到的接口（parser.InterfaceConfig）
+            count: 数量
+            reserved: 不参与分配的地址或范围，见 AddressPool
+
+        Returns:
+            单主机前缀形式的地址列表，如 ["10.0.0.2/32"]
+
+        Raises:
+            RuntimeError: 地址不足
+            ValueError: 接口未配置 Address 或保留范围格式无效
+        """
+        row = self._interface_row(host, iface.name)
+        if row is None or not iface.fingerprint or row[1] != iface.fingerprint:
+            with self._conn:
+                self._replace_interface(self._server_id(host), iface)
+            row = self._interface_row(host, iface.name)
+        interface_id, _, address = row
+
+        network = ipaddress.ip_network(address, strict=False)
+        size = min(network.num_addresses, MAX_POOL_ADDRESSES)
+        excluded = [(0, 1)]
+        if network.version == 4 and network.prefixlen < 31:
+            excluded.append((network.num_addresses - 1, network.num_addresses))
+        excluded += [address_span(network, item) for item in reserved]
+
+        # 按起点有序遍历已占用区间（索引扫描），从空隙中取地址
+        occupied = self._conn.execute(
+            "SELECT start, stop FROM addresses WHERE interface_id = ? ORDER BY start",
+            (interface_id,)
+        )
+        free: list[int] = []
+        offset = 0
+        for start, stop in heapq.merge(occupied, sorted(excluded)):
+            while offset < min(start, size) and len(free) < count:
+                free.append(offset)
+                offset += 1
+            if len(free) == count:
+                break
+            offset = max(offset, stop)
+        while len(free) < count and offset < size:
+            free.append(offset)
+            offset += 1
+        if len(free) < count:
+            raise RuntimeError(f"IP 地址池已满（{network} 剩余 {len(free)} 个地址）")
+
+        base = int(network.network_address)
+        address_type = type(network.network_address)
+        return [host_prefix(str(address_type(base + o))) for o in free]
+
+    def record_peers(
+        self, host: str, interface: str, peers: list[Peer], fingerprint: str = ""
+    ) -> None:
+        """记录已添加到服务器的客户端
+
+        Args:
+            fingerprint: 添加后配置文件的远程指纹；未知（或文件同时有其他修改）时为空字符串，
+                下次使用前会重新导入该接口
+        """
+        row = self._interface_row(host, interface)
+        if row is None:
+            return
+        interface_id, _, address = row
+        try:
+            network = ipaddress.ip_network(address, strict=False)
+        except ValueError:
+            network = None
+        with self._conn:
+            self._insert_peers(interface_id, network, _peer_rows(peers))
+            self._conn.execute("UPDATE interfaces SET fingerprint = ? WHERE id = ?",
+                               (fingerprint, interface_id))
+
+    def remove_peers(self, host: str, interface: str, public_keys: Iterable[str]) -> None:
+        """删除已从服务器移除的客户端（之后配置文件指纹未知，下次使用前重新导入该接口）"""
+        row = self._interface_row(host, interface)
+        if row is None:
+            return
+        keys = [(row[0], key) for key in public_keys]
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM peers WHERE interface_id = ? AND public_key = ?", keys
+            )
+            self._conn.executemany(
+                "DELETE FROM addresses WHERE interface_id = ? AND public_key = ?", keys
+            )
+            self._conn.execute("UPDATE interfaces SET fingerprint = '' WHERE id = ?", (row[0],))
+
+    def record_interfaces(self, host: str, interfaces: list) -> None:
+        """用写入服务器后的内容重建接口的记录（apply 之后），主机尚未导入时不记录
+
+        Args:
+            host: 主机标识（Transport.cache_key）
+            interfaces: 写入后的接口（parser.InterfaceConfig 列表），指纹为写入后的远程指纹；
+                指纹未知时为空字符串，下次使用前重新导入该接口
+        """
+        row = self._conn.execute("SELECT id FROM servers WHERE host = ?", (host,)).fetchone()
+        if row is None:
+            return
+        with self._conn:
+            for iface in interfaces:
+                self._replace_interface(row[0], iface)
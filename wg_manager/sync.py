@@ -0,0 +1,135 @@
+"""本地状态库的同步与差异报告
+
+db sync 把状态库中各配置文件的已知指纹随扫描命令发给服务器，一次往返中
+只有指纹变化的文件才会传回内容并重新导入，未变化的接口不传输也不解析；
+db drift 执行同样的扫描但不修改状态库，只报告双向差异。
+多台主机按主机清单并发同步。
+"""
+
+import sys
+import time
+import secrets
+from typing import Optional
+
+from . import trace
+from .fleet import DEFAULT_PARALLEL, DEFAULT_HOST_TIMEOUT, run_on_hosts, summarize
+from .inventory import InventoryHost
+from .parser import build_scan_command, parse_scan_output, resolve_scan_entries
+from .session import connect_ssh
+from .store import Drift, Store, default_store_path, open_store
+from .transport import Flow, RemoteCommand, Transport, run_flow
+
+
+@trace.traced("store.sync")
+def _sync_flow(ssh: Transport, store: Store, apply: bool = True) -> Flow[Optional[Drift]]:
+    """扫描一台主机的配置目录并与状态库比较（远程操作流程，见 transport.Flow）"""
+    host = ssh.cache_key
+    known = store.fingerprints(host)
+    token = f"WGM_FILE_{secrets.token_hex(8)}"
+
+    success, output = yield RemoteCommand(
+        build_scan_command(ssh.wg_dir, token, [fp for fp in known.values() if fp])
+    )
+    if not success:
+        print(f"错误: 扫描配置目录失败: {output}", file=sys.stderr)
+        return None
+    entries = parse_scan_output(output, token)
+
+    # 远程按指纹集合判断"未变化"，路径与指纹对不上时（如文件被复制或改名）完整取回一次
+    if any(content is None and known.get(path) != fp for path, fp, content in entries):
+        success, output = yield RemoteCommand(build_scan_command(ssh.wg_dir, token))
+        if not success:
+            print(f"错误: 扫描配置目录失败: {output}", file=sys.stderr)
+            return None
+        entries = parse_scan_output(output, token)
+
+    changed = [entry for entry in entries if entry[2] is not None]
+    seen = {path for path, _, _ in entries}
+    return store.sync_host(
+        host,
+        resolve_scan_entries(changed, ssh.cache, host),
+        [path for path in known if path not in seen],
+        unchanged=len(entries) - len(changed),
+        apply=apply
+    )
+
+
+def sync_host(host: InventoryHost, apply: bool = True) -> bool:
+    """同步一台主机并输出差异
+
+    Args:
+        host: 目标主机
+        apply: 为 False 时只报告差异，不修改状态库
+    """
+    ssh, _ = connect_ssh(host.host, host.port, host.key_file)
+    if ssh is None:
+        return False
+    with ssh, Store() as store:
+        drift = run_flow(ssh, _sync_flow(ssh, store, apply))
+    if drift is None:
+        return False
+
+    print(f"{drift.unchanged} 个接口未变化（跳过），"
+          f"{drift.imported} 个接口{'已重新导入' if apply else '有变化'}")
+    print(drift.format())
+    return True
+
+
+def sync_hosts(
+    hosts: list[InventoryHost],
+    apply: bool = True,
+    parallel: int = DEFAULT_PARALLEL,
+    timeout: float = DEFAULT_HOST_TIMEOUT
+) -> bool:
+    """并发同步多台主机
+
+    Args:
+        hosts: 目标主机
+        apply: 为 False 时只报告差异（db drift），不修改状态库
+        parallel: 最大并发数
+        timeout: 单台主机超时（秒）
+
+    Returns:
+        是否全部成功
+    """
+    if not hosts:
+        print("没有匹配的主机", file=sys.stderr)
+        return False
+    action = "同步" if apply else "比较"
+    print(f"{action} {len(hosts)} 台主机与本地状态库 {default_store_path()}（并发 {parallel}）...\n")
+    results = run_on_hosts(hosts, lambda h: sync_host(h, apply), parallel, timeout)
+    print(summarize(results))
+    return all(r.success for r in results)
+
+
+def show_store(host: Optional[str] = None, interface: Optional[str] = None) -> bool:
+    """显示状态库内容（不连接服务器）
+
+    Args:
+        host: 只显示该主机（Transport.cache_key，如 root@1.2.3.4:22）
+        interface: 显示该接口的客户端（需同时指定 host）
+    """
+    store = open_store()
+    if store is None:
+        print(f"本地状态库不存在: {default_store_path()}", file=sys.stderr)
+        print("请先使用 'wg-manager db sync' 导入", file=sys.stderr)
+        return False
+
+    with store:
+        if host and interface:
+            peers = store.peers(host, interface)
+            print(f"{host} {interface}: {len(peers)} 个客户端")
+            for name, public_key, allowed_ips in peers:
+                print(f"  - {name or '(未命名)'}: {allowed_ips}  {public_key}")
+            return True
+
+        hosts = [(h, t) for h, t in store.hosts() if not host or h == host]
+        if not hosts:
+            print(f"状态库中没有主机{f' {host}' if host else ''}", file=sys.stderr)
+            return False
+        for name, synced_at in hosts:
+            synced = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(synced_at)) if synced_at else "从未"
+            print(f"{name}（同步于 {synced}）")
+            for iface, address, count in store.interfaces(name):
+                print(f"  - {iface}: {address}，{count} 个客户端")
+    return True
@@ -0,0 +1,344 @@
+"""操作跟踪：按阶段记录耗时、远程命令和传输字节数
+
+每个阶段（SSH 调用、密钥生成、配置解析、部署探测等）记录为一个 Span，
+包含名称、开始时间、耗时、父 Span 和属性（脱敏后的命令、发送/接收字节数等）。
+Span 通过 contextvars 嵌套，线程和 asyncio 任务各自独立。
+
+跟踪默认关闭，此时 span() 返回空操作对象，开销可以忽略。
+enable() 后结束的 Span 保存在内存中，可输出汇总表（format_summary）、
+JSON（to_json）或 Chrome trace（to_chrome_trace，可在 chrome://tracing 或 Perfetto 中查看）；
+add_hook() 注册的回调在每个 Span 结束时调用，可用于接入自己的监控系统::
+
+    from wg_manager import trace
+    trace.add_hook(lambda span: statsd.timing(span.name, span.duration * 1000))
+"""
+
+import functools
+import inspect
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Optional
+
+# 属性中表示传输字节数的键
+BYTES_SENT = "bytes_sent"
+BYTES_RECEIVED = "bytes_received"
+
+# 表示一次远程调用的 Span 名称（SSH 与本地传输）
+EXEC_SPANS = ("ssh.exec", "local.exec")
+
+
+@dataclass
+class Span:
+    """一个阶段的跟踪记录
+
+    start 为开始时的 Unix 时间戳（秒），duration 为耗时（秒），
+    parent_id 为外层 Span 的 span_id，最外层为 None。
+    """
+    name: str
+    span_id: int
+    parent_id: Optional[int]
+    start: float
+    duration: float = 0.0
+    thread_id: int = 0
+    attrs: dict = field(default_factory=dict)
+    error: str = ""
+    recording = True
+
+    def set(self, **attrs) -> None:
+        """设置属性"""
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "thread_id": self.thread_id,
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+class _NullSpan:
+    """跟踪关闭时的空操作 Span"""
+
+    recording = False
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+_current: ContextVar[Optional[Span]] = ContextVar("wg_manager_span", default=None)
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_enabled = False
+_spans: list[Span] = []
+_hooks: list[Callable[[Span], None]] = []
+
+
+class _ActiveSpan:
+    """记录中的 Span 的上下文管理器"""
+
+    def __init__(self, name: str, attrs: dict):
+        parent = _current.get()
+        self.span = Span(
+            name=name,
+            span_id=next(_ids),
+            parent_id=parent.span_id if parent is not None else None,
+            start=time.time(),
+            thread_id=threading.get_ident(),
+            attrs=attrs,
+        )
+        self._started = 0.0
+        self._token = None
+
+    def __enter__(self) -> Span:
+        self._token = _current.set(self.span)
+        self._started = time.perf_counter()
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        span = self.span
+        span.duration = time.perf_counter() - self._started
+        if exc_type is not None:
+            span.error = exc_type.__name__
+        _current.reset(self._token)
+        _finish(span)
+
+
+def _finish(span: Span) -> None:
+    with _lock:
+        if _enabled:
+            _spans.append(span)
+        hooks = list(_hooks)
+    for hook in hooks:
+        try:
+            hook(span)
+        except Exception:
+            # 回调出错不影响被跟踪的操作
+            pass
+
+
+def span(name: str, **attrs):
+    """开始一个 Span，用作上下文管理器，返回的对象可用 set() 补充属性
+
+    跟踪关闭且没有回调时返回空操作对象（recording 为 False）。
+    """
+    if not _enabled and not _hooks:
+        return _NULL_SPAN
+    return _ActiveSpan(name, attrs)
+
+
+def traced(name: str):
+    """装饰器：函数每次调用记录为一个 Span
+
+    也可用于远程操作流程（生成器函数），Span 覆盖整个流程，
+    流程中的远程调用成为其子 Span。
+    """
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def flow_wrapper(*args, **kwargs):
+                with span(name):
+                    return (yield from func(*args, **kwargs))
+            return flow_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current() -> Optional[Span]:
+    """当前上下文中记录中的 Span，没有时返回 None"""
+    return _current.get()
+
+
+@contextmanager
+def within(parent: Optional[Span]) -> Iterator[None]:
+    """在其他上下文中以 parent 为父 Span 继续记录
+
+    aio.run_flow 在线程池中推进流程，远程调用在事件循环中执行，
+    借此把远程调用记录为流程 Span 的子 Span。
+    """
+    token = _current.set(parent)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def enable() -> None:
+    """开始在内存中收集 Span"""
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    """停止收集 Span（已收集的保留）"""
+    global _enabled
+    _enabled = False
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def add_hook(hook: Callable[[Span], None]) -> None:
+    """注册 Span 结束回调（不需要 enable() 也会调用）"""
+    with _lock:
+        _hooks.append(hook)
+
+
+def remove_hook(hook: Callable[[Span], None]) -> None:
+    with _lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def spans() -> list[Span]:
+    """已收集的 Span，按结束顺序"""
+    with _lock:
+        return list(_spans)
+
+
+def clear() -> None:
+    """清空已收集的 Span"""
+    with _lock:
+        _spans.clear()
+
+
+# 脱敏：here-document 正文（base64 文件内容、wg addconf 的 Peer 段）
+# 和 printf 传给 wg 的预共享密钥
+_HEREDOC = re.compile(r"<<'(\w+)'\n(.*?)\n?\1", re.S)
+_PRINTF_SECRET = re.compile(r"printf '%s\\n' ('[^']*'|\S+) \|")
+
+
+def redact(command: str) -> str:
+    """去掉命令中的密钥和文件内容"""
+    command = _HEREDOC.sub(lambda m: f"<<'{m.group(1)}' [已省略 {len(m.group(2))} 字节]", command)
+    return _PRINTF_SECRET.sub("printf '%s\\\\n' *** |", command)
+
+
+def format_summary(collected: Optional[list[Span]] = None) -> str:
+    """按名称汇总 Span：次数、总耗时、平均/最大耗时和传输字节数"""
+    collected = spans() if collected is None else collected
+    if not collected:
+        return "没有跟踪记录"
+
+    groups: dict[str, list[Span]] = defaultdict(list)
+    for s in collected:
+        groups[s.name].append(s)
+
+    widths = (30, 6, 11, 10, 10, 11, 11)
+    rows = [("阶段", "次数", "总耗时", "平均", "最大", "发送", "接收")]
+    ordered = sorted(groups.items(), key=lambda item: min(s.start for s in item[1]))
+    for name, group in ordered:
+        total = sum(s.duration for s in group)
+        rows.append((
+            name,
+            str(len(group)),
+            f"{total:.3f}s",
+            f"{total / len(group):.3f}s",
+            f"{max(s.duration for s in group):.3f}s",
+            _format_bytes(sum(s.attrs.get(BYTES_SENT, 0) for s in group)),
+            _format_bytes(sum(s.attrs.get(BYTES_RECEIVED, 0) for s in group)),
+        ))
+    lines = [
+        "".join(_pad(cell, width, left=(i == 0))
+                for i, (cell, width) in enumerate(zip(row, widths)))
+        for row in rows
+    ]
+
+    elapsed = max(s.start + s.duration for s in collected) - min(s.start for s in collected)
+    round_trips = sum(len(groups.get(name, [])) for name in EXEC_SPANS)
+    lines.append("")
+    lines.append(f"总耗时 {elapsed:.3f}s，远程调用 {round_trips} 次")
+    slowest = max((s for s in collected if s.name in EXEC_SPANS),
+                  key=lambda s: s.duration, default=None)
+    if slowest is not None:
+        by_id = {s.span_id: s for s in collected}
+        parent = by_id.get(slowest.parent_id)
+        if parent is not None and parent.name == "ssh.batch":
+            # 批量脚本的命令都是 sh -s，显示各步骤的描述
+            what = "; ".join(parent.attrs.get("steps", []))
+        else:
+            what = slowest.attrs.get("command", "")
+        lines.append(f"最慢的远程调用 {slowest.duration:.3f}s: {what[:100]}")
+    return "\n".join(lines)
+
+
+def _pad(text: str, width: int, left: bool = False) -> str:
+    """按显示宽度（中文字符占两列）补齐"""
+    display = sum(2 if unicodedata.east_asian_width(c) in "WF" else 1 for c in text)
+    fill = " " * max(width - display, 1 if not left else 0)
+    return text + fill if left else fill + text
+
+
+def _format_bytes(size: int) -> str:
+    if not size:
+        return "-"
+    if size < 1024:
+        return f"{size}B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f}KB"
+    return f"{size / 1024 / 1024:.1f}MB"
+
+
+def to_json(collected: Optional[list[Span]] = None) -> str:
+    """Span 列表的 JSON 文本"""
+    collected = spans() if collected is None else collected
+    return json.dumps([s.to_dict() for s in collected], ensure_ascii=False, indent=2)
+
+
+def to_chrome_trace(collected: Optional[list[Span]] = None) -> str:
+    """Chrome trace 事件格式（complete 事件）的 JSON 文本"""
+    collected = spans() if collected is None else collected
+    origin = min((s.start for s in collected), default=0.0)
+    pid = os.getpid()
+    events = [
+        {
+            "name": s.name,
+            "cat": s.name.split(".", 1)[0],
+            "ph": "X",
+            "ts": round((s.start - origin) * 1e6, 1),
+            "dur": round(s.duration * 1e6, 1),
+            "pid": pid,
+            "tid": s.thread_id,
+            "args": dict(s.attrs, **({"error": s.error} if s.error else {})),
+        }
+        for s in collected
+    ]
+    return json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}, ensure_ascii=False)
+
+
+def write_trace(path: str, fmt: str = "chrome") -> None:
+    """把已收集的 Span 写入文件
+
+    Args:
+        path: 输出文件路径
+        fmt: chrome（Chrome trace 格式）或 json（Span 列表）
+    """
+    text = to_chrome_trace() if fmt == "chrome" else to_json()
+    with open(path, "w") as f:
+        f.write(text + "\n")
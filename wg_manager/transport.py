@@ -0,0 +1,622 @@
+"""传输层：在目标主机上执行命令和读写文件
+
+Transport 是 parser、deploy、add_peer、remove_peer 等模块依赖的接口，
+远程操作流程（Flow）中的单条命令和批量脚本都通过它执行。实现有：
+
+- ssh.SSHClient / aio.AsyncSSHClient：经 SSH（ControlMaster 复用会话）在服务器上执行
+- LocalTransport：在本机直接执行，用于在 WireGuard 服务器上运行或操作沙箱目录树
+"""
+
+import os
+import sys
+import base64
+import secrets
+import shlex
+import signal
+import subprocess
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Generator, Iterator, Optional, TypeVar, Union
+
+from . import trace
+from .config import REMOTE_WG_DIR
+
+if TYPE_CHECKING:
+    # 只用于类型注解：缓存、索引和状态库由 session.attach_state 接入
+    from .cache import ConfigCache
+    from .index import PeerIndex
+    from .store import Store
+
+
+class TransportAborted(Exception):
+    """传输已被 abort() 中止"""
+    pass
+
+
+# 按线程记录新建的传输，见 track_transports
+_tracking = threading.local()
+
+
+@contextmanager
+def track_transports(opened: list["Transport"]) -> Iterator[list["Transport"]]:
+    """把当前线程中新建的传输记入 opened
+
+    fleet 在每台主机的工作线程中使用，超时时据此中止该主机的连接。
+    """
+    previous = getattr(_tracking, "opened", None)
+    _tracking.opened = opened
+    try:
+        yield opened
+    finally:
+        _tracking.opened = previous
+
+
+def _kill(process: subprocess.Popen) -> None:
+    """终止子进程；子进程是进程组组长时终止整个进程组"""
+    try:
+        if os.getpgid(process.pid) == process.pid:
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (OSError, ProcessLookupError):
+        pass
+
+
+class Transport(ABC):
+    """传输层接口
+
+    子类实现 cache_key、test_connection、close 和 _exec（执行一次远程调用）；
+    命令执行、文件读写和批量执行都建立在 _exec 之上。
+    """
+
+    # WireGuard 配置目录
+    wg_dir = REMOTE_WG_DIR
+
+    def __init__(self):
+        # 远程操作次数（含连接测试）与实际完成的 SSH 握手次数
+        self.round_trips = 0
+        self.handshakes = 0
+        # 远程配置文件本地缓存，为 None 时每次都完整取回
+        self.cache: Optional["ConfigCache"] = None
+        # 跨主机的客户端索引，扫描配置目录时增量更新，为 None 时不维护
+        self.index: Optional["PeerIndex"] = None
+        # 本地状态库，存在时分配地址查表完成，为 None 时按扫描结果分配
+        self.store: Optional["Store"] = None
+        # 执行中的子进程，abort() 时终止
+        self._processes: set[subprocess.Popen] = set()
+        self._process_lock = threading.Lock()
+        self.aborted = False
+        opened = getattr(_tracking, "opened", None)
+        if opened is not None:
+            opened.append(self)
+
+    def __enter__(self) -> "Transport":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+        self._report()
+
+    def _report(self) -> None:
+        """启用跟踪（--profile / --trace）时在关闭后输出执行统计"""
+        if trace.enabled():
+            print(self.summary(), file=sys.stderr)
+
+    @property
+    @abstractmethod
+    def cache_key(self) -> str:
+        """本地缓存中标识目标主机的键"""
+
+    def config_path(self, interface: str) -> str:
+        """接口配置文件的路径"""
+        return f"{self.wg_dir}/{interface}.conf"
+
+    def summary(self) -> str:
+        """执行统计信息"""
+        return f"远程操作 {self.round_trips} 次"
+
+    @abstractmethod
+    def test_connection(self) -> tuple[bool, str]:
+        """测试目标主机是否可用"""
+
+    def close(self) -> None:
+        """释放连接等资源"""
+
+    def abort(self) -> None:
+        """中止传输（可在其他线程调用）
+
+        终止执行中的远程调用并关闭连接，之后的远程调用直接失败。
+        已发出的远程命令可能已经（部分）执行。
+        """
+        self.aborted = True
+        with self._process_lock:
+            processes = list(self._processes)
+        for process in processes:
+            _kill(process)
+        self._close_now()
+
+    def _close_now(self) -> None:
+        """abort() 中同步关闭连接，默认同 close()"""
+        self.close()
+
+    def _run_process(
+        self,
+        args: list[str],
+        input: Optional[str] = None,
+        timeout: int = 30,
+        env: Optional[dict[str, str]] = None,
+        new_session: bool = False
+    ) -> subprocess.CompletedProcess:
+        """执行一次子进程调用（同 subprocess.run），abort() 时被终止
+
+        new_session 为 True 时子进程在独立的进程组中运行，终止时连同其子进程
+        （如 sh -c 启动的命令）一起终止。
+        """
+        if self.aborted:
+            raise TransportAborted("连接已中止")
+        process = subprocess.Popen(
+            args,
+            stdin=subprocess.DEVNULL if input is None else subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env,
+            start_new_session=new_session
+        )
+        with self._process_lock:
+            self._processes.add(process)
+        try:
+            if self.aborted:
+                _kill(process)
+            stdout, stderr = process.communicate(input, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill(process)
+            process.communicate()
+            raise
+        except BaseException:
+            _kill(process)
+            raise
+        finally:
+            with self._process_lock:
+                self._processes.discard(process)
+        if self.aborted:
+            raise TransportAborted("连接已中止")
+        return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+    @abstractmethod
+    def _exec(
+        self, command: str, input: Optional[str] = None, timeout: int = 30
+    ) -> subprocess.CompletedProcess:
+        """执行一次远程调用（一个往返），超时抛出 subprocess.TimeoutExpired"""
+
+    def run_command(self, command: str, timeout: int = 30) -> tuple[bool, str]:
+        """执行远程命令"""
+        try:
+            result = self._exec(command, timeout=timeout)
+            if result.returncode == 0:
+                return True, result.stdout.strip()
+            return False, result.stderr.strip() or result.stdout.strip()
+        except subprocess.TimeoutExpired:
+            return False, "命令执行超时"
+        except Exception as e:
+            return False, str(e)
+
+    def read_remote_file(self, remote_path: str) -> tuple[bool, str]:
+        """读取远程文件内容"""
+        return self.run_command(f"cat {shlex.quote(remote_path)}")
+
+    def write_remote_file(self, remote_path: str, content: str) -> tuple[bool, str]:
+        """原子写入远程文件，见 RemoteBatch.write_file"""
+        success, results = self.batch().write_file(remote_path, content).execute()
+        if success:
+            return True, "写入成功"
+        return False, results[-1].output if results else ""
+
+    def batch(self) -> "RemoteBatch":
+        """创建批量执行队列，多个命令和文件写入在一次往返中完成"""
+        return RemoteBatch(self)
+
+    def _trace_exec(self, span, command: str, input: Optional[str]) -> None:
+        """记录远程调用的目标、脱敏后的命令和发送字节数"""
+        if span.recording:
+            span.set(
+                host=self.cache_key,
+                command=trace.redact(command),
+                **{trace.BYTES_SENT: len(command.encode()) + len((input or "").encode())}
+            )
+
+    @staticmethod
+    def _trace_result(span, result: subprocess.CompletedProcess) -> None:
+        """记录远程调用的退出码和接收字节数"""
+        if span.recording:
+            span.set(
+                returncode=result.returncode,
+                **{trace.BYTES_RECEIVED: len(result.stdout.encode()) + len(result.stderr.encode())}
+            )
+
+
+@dataclass
+class BatchResult:
+    """批量执行中单个步骤的结果"""
+    step: str
+    returncode: int
+    output: str
+
+    @property
+    def success(self) -> bool:
+        return self.returncode == 0
+
+
+# append_file 发现远程文件已被修改时的退出码
+FINGERPRINT_MISMATCH = 97
+
+
+def remote_fingerprint(path: str) -> str:
+    """计算远程文件指纹 mtime:size:sha256 的 shell 表达式
+
+    Args:
+        path: 已转义的路径表达式，如 '"$f"'
+    """
+    return f"$(stat -c '%Y:%s' {path}):$(sha256sum < {path} | cut -d' ' -f1)"
+
+
+def _decode_to_temp(remote_path: str, content: str) -> str:
+    """在目标文件同目录创建临时文件并写入内容的脚本片段（临时文件路径在 $tmp）"""
+    directory, _, name = remote_path.rpartition("/")
+    template = shlex.quote(f"{directory or '.'}/.{name}.wgm.XXXXXX")
+    delimiter = f"WGM_EOF_{secrets.token_hex(8)}"
+    encoded = base64.encodebytes(content.encode()).decode()
+    return (
+        f"tmp=$(mktemp {template})\n"
+        "trap 'rm -f \"$tmp\"' EXIT\n"
+        f"base64 -d > \"$tmp\" <<'{delimiter}'\n{encoded}{delimiter}\n"
+    )
+
+
+@dataclass
+class BatchStep:
+    """批量执行的单个步骤"""
+    description: str
+    script: str
+    check: bool = True
+
+
+def build_batch_script(steps: list[BatchStep], stop_on_error: bool, token: str) -> str:
+    """将步骤拼接为一个远程 shell 脚本
+
+    每个步骤在子 shell 中执行，输出（stdout+stderr）写入临时文件，执行后以
+    "<token> <序号> <退出码>" 行加 base64 编码的输出行回传，
+    因此输出内容不会与分隔标记混淆。
+    """
+    lines = [
+        '_wgm_log=$(mktemp) || exit 1',
+        'trap \'rm -f "$_wgm_log"\' EXIT',
+    ]
+    for i, step in enumerate(steps):
+        lines.append("(")
+        lines.append(step.script)
+        lines.append(') >"$_wgm_log" 2>&1 </dev/null')
+        lines.append("_wgm_rc=$?")
+        lines.append(f"printf '%s %d %d\\n' {token} {i} \"$_wgm_rc\"")
+        lines.append('base64 <"$_wgm_log" | tr -d \'\\n\'; echo')
+        if stop_on_error and step.check:
+            lines.append('[ "$_wgm_rc" -eq 0 ] || exit 0')
+    return "\n".join(lines) + "\n"
+
+
+def parse_batch_output(
+    output: str, steps: list[BatchStep], token: str
+) -> list[BatchResult]:
+    """解析批量脚本的输出，返回已执行步骤的结果"""
+    results = []
+    lines = output.split("\n")
+    for i, line in enumerate(lines):
+        parts = line.split(" ")
+        if len(parts) != 3 or parts[0] != token:
+            continue
+        idx, rc = int(parts[1]), int(parts[2])
+        payload = lines[i + 1] if i + 1 < len(lines) else ""
+        text = base64.b64decode(payload).decode(errors="replace").strip()
+        results.append(BatchResult(steps[idx].description, rc, text))
+    return results
+
+
+class RemoteBatch:
+    """远程批量执行队列
+
+    排队的命令和文件写入会被拼成一个脚本，通过 stdin 交给远程 sh
+    在一次往返中执行，并分别返回每一步的退出码与输出。
+    """
+
+    def __init__(self, client: "Transport"):
+        self._client = client
+        self.steps: list[BatchStep] = []
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def run(
+        self, command: str, check: bool = True, description: Optional[str] = None
+    ) -> "RemoteBatch":
+        """添加命令
+
+        Args:
+            command: 远程 shell 命令
+            check: 失败时是否视为出错（stop_on_error 时中止后续步骤）
+            description: 步骤描述，默认为命令本身（命令含密钥时应指定）
+        """
+        self.steps.append(BatchStep(description or command, command, check))
+        return self
+
+    def write_file(
+        self,
+        remote_path: str,
+        content: str,
+        mode: Optional[str] = None,
+        fingerprint: Optional[str] = None
+    ) -> "RemoteBatch":
+        """添加文件写入（原子替换）
+
+        内容先写入同目录的临时文件（权限 0600）并 fsync，再 rename 到目标路径，
+        连接中断不会留下截断的文件。目标文件已存在时沿用其权限和属主。
+        写入成功时输出写入后的指纹。
+
+        Args:
+            remote_path: 远程文件路径
+            content: 文件内容
+            mode: 文件权限（如 "600"），指定时覆盖原有权限
+            fingerprint: 读取时的远程指纹，指定时只在文件仍为该指纹时写入，
+                否则不做任何修改、以 FINGERPRINT_MISMATCH 退出（同 append_file）
+        """
+        path = shlex.quote(remote_path)
+        directory = shlex.quote(remote_path.rpartition("/")[0] or ".")
+        script = "set -e\n"
+        if fingerprint is not None:
+            script += (
+                f'[ "{remote_fingerprint(path)}" = {shlex.quote(fingerprint)} ] '
+                f"|| {{ echo 'fingerprint mismatch'; exit {FINGERPRINT_MISMATCH}; }}\n"
+            )
+        script += (
+            _decode_to_temp(remote_path, content)
+            + f"if [ -e {path} ]; then\n"
+            f"  chmod \"$(stat -c %a {path})\" \"$tmp\"\n"
+            f"  chown \"$(stat -c %u:%g {path})\" \"$tmp\" 2>/dev/null || true\n"
+            "fi\n"
+        )
+        if mode:
+            script += f"chmod {mode} \"$tmp\"\n"
+        script += (
+            'sync "$tmp" 2>/dev/null || sync\n'
+            f'mv -f "$tmp" {path}\n'
+            f"sync {directory} 2>/dev/null || true\n"
+            f'echo "{remote_fingerprint(path)}"'
+        )
+        self.steps.append(BatchStep(f"写入 {remote_path}", script))
+        return self
+
+    def append_file(
+        self, remote_path: str, content: str, fingerprint: str
+    ) -> "RemoteBatch":
+        """添加文件追加：仅当远程文件指纹仍为 fingerprint 时追加 content
+
+        指纹不一致（文件在读取后被修改）时不做任何修改，
+        该步骤以 FINGERPRINT_MISMATCH 退出；追加成功时输出追加后的指纹。
+
+        Args:
+            remote_path: 远程文件路径
+            content: 追加的内容
+            fingerprint: 读取时的远程指纹 mtime:size:sha256
+        """
+        path = shlex.quote(remote_path)
+        script = (
+            "set -e\n"
+            f'[ "{remote_fingerprint(path)}" = {shlex.quote(fingerprint)} ] '
+            f"|| {{ echo 'fingerprint mismatch'; exit {FINGERPRINT_MISMATCH}; }}\n"
+            + _decode_to_temp(remote_path, content)
+            + f'cat "$tmp" >> {path}\n'
+            f"sync {path} 2>/dev/null || sync\n"
+            f'echo "{remote_fingerprint(path)}"'
+        )
+        self.steps.append(BatchStep(f"追加 {remote_path}", script))
+        return self
+
+    def execute(
+        self, stop_on_error: bool = True, timeout: int = 60
+    ) -> tuple[bool, list[BatchResult]]:
+        """在一次往返中执行所有步骤
+
+        Args:
+            stop_on_error: 遇到失败（check=True 的步骤）时是否中止后续步骤
+            timeout: 整体超时（秒）
+
+        Returns:
+            (是否全部成功, 已执行步骤的结果列表)
+        """
+        if not self.steps:
+            return True, []
+
+        with trace.span("ssh.batch") as span:
+            self._trace_steps(span)
+            token, script = self._prepare(stop_on_error)
+            try:
+                result = self._client._exec("sh -s", input=script, timeout=timeout)
+            except Exception as e:
+                return self._failed(e)
+            return self._trace_outcome(span, self._collect(result, token))
+
+    def _trace_steps(self, span) -> None:
+        """记录各步骤的描述"""
+        if span.recording:
+            span.set(steps=[trace.redact(step.description) for step in self.steps])
+
+    @staticmethod
+    def _trace_outcome(
+        span, outcome: tuple[bool, list[BatchResult]]
+    ) -> tuple[bool, list[BatchResult]]:
+        """记录执行结果和失败的步骤"""
+        if span.recording:
+            success, results = outcome
+            span.set(success=success, failed=[r.step for r in results if not r.success])
+        return outcome
+
+    def _prepare(self, stop_on_error: bool) -> tuple[str, str]:
+        """生成分隔标记和远程脚本"""
+        token = f"WGM_STEP_{secrets.token_hex(8)}"
+        return token, build_batch_script(self.steps, stop_on_error, token)
+
+    def _failed(self, error: Exception) -> tuple[bool, list[BatchResult]]:
+        """远程调用本身失败（超时、ssh 无法执行等）时的结果"""
+        if isinstance(error, subprocess.TimeoutExpired):
+            return False, [BatchResult(self.steps[0].description, -1, "命令执行超时")]
+        return False, [BatchResult(self.steps[0].description, -1, str(error))]
+
+    def _collect(
+        self, result: subprocess.CompletedProcess, token: str
+    ) -> tuple[bool, list[BatchResult]]:
+        """解析远程脚本的执行结果"""
+        results = parse_batch_output(result.stdout, self.steps, token)
+        if not results and result.returncode != 0:
+            error = result.stderr.strip() or "批量执行失败"
+            return False, [BatchResult(self.steps[0].description, result.returncode, error)]
+
+        success = len(results) == len(self.steps) and all(
+            r.success for r, step in zip(results, self.steps) if step.check
+        )
+        return success, results
+
+
+@dataclass
+class RemoteCommand:
+    """远程操作流程中的单条命令，执行结果同 Transport.run_command"""
+    command: str
+    timeout: int = 30
+
+
+T = TypeVar("T")
+
+# 远程操作流程：生成器 yield RemoteCommand 或 RemoteBatch 请求一次远程调用，
+# 由执行器（run_flow 或 aio.run_flow）完成调用后把结果 send 回生成器，
+# 生成器的返回值即操作结果。同一流程因此可由同步或异步客户端驱动。
+Flow = Generator[Union[RemoteCommand, RemoteBatch], object, T]
+
+
+def run_flow(ssh: "Transport", flow: Flow[T]) -> T:
+    """用同步传输执行远程操作流程
+
+    Args:
+        ssh: 传输（SSHClient、LocalTransport 等），流程中的 RemoteBatch 应由 ssh.batch() 创建
+        flow: 远程操作流程
+
+    Returns:
+        流程的返回值
+    """
+    try:
+        request = next(flow)
+        while True:
+            if isinstance(request, RemoteBatch):
+                response = request.execute()
+            else:
+                response = ssh.run_command(request.command, timeout=request.timeout)
+            request = flow.send(response)
+    except StopIteration as stop:
+        return stop.value
+
+
+# connect_ssh 中表示本地执行的目标：local 或 local:<根目录>
+LOCAL_TARGET = "local"
+
+
+def parse_local_target(host: str) -> Optional[str]:
+    """解析本地执行目标，返回根目录；不是本地目标时返回 None
+
+    Args:
+        host: "local"（根目录 /）或 "local:<根目录>"
+    """
+    if host == LOCAL_TARGET:
+        return "/"
+    if host.startswith(f"{LOCAL_TARGET}:"):
+        return host[len(LOCAL_TARGET) + 1:] or "/"
+    return None
+
+
+class LocalTransport(Transport):
+    """本地传输：在本机直接执行命令和读写文件，不经过 SSH
+
+    在 WireGuard 服务器上运行时使用，省去 ssh root@localhost 的握手和进程开销。
+    配置文件都在 <root>/etc/wireguard 下读写，root 指向沙箱目录树时
+    不会触及系统配置；wg、wg-quick、systemctl 等命令仍在本机执行，
+    可通过 env（如替换 PATH）改用沙箱中的模拟命令。
+
+    Args:
+        root: 根目录，默认 /
+        env: 执行命令的环境变量，默认继承当前进程
+    """
+
+    def __init__(self, root: str = "/", env: Optional[dict[str, str]] = None):
+        super().__init__()
+        self.root = os.path.abspath(root)
+        self.wg_dir = os.path.join(self.root, REMOTE_WG_DIR.lstrip("/"))
+        self.env = env
+
+    @property
+    def cache_key(self) -> str:
+        return f"{LOCAL_TARGET}:{self.root}"
+
+    def summary(self) -> str:
+        return f"本地执行 {self.round_trips} 次"
+
+    def test_connection(self) -> tuple[bool, str]:
+        """检查根目录是否存在"""
+        if not os.path.isdir(self.root):
+            return False, f"根目录不存在: {self.root}"
+        return True, "本地执行"
+
+    def _exec(
+        self, command: str, input: Optional[str] = None, timeout: int = 30
+    ) -> subprocess.CompletedProcess:
+        """用本机 sh 执行命令，超时抛出 subprocess.TimeoutExpired"""
+        self.round_trips += 1
+        with trace.span("local.exec") as span:
+            self._trace_exec(span, command, input)
+            result = self._run_process(
+                ["sh", "-c", command], input, timeout, self.env, new_session=True
+            )
+            self._trace_result(span, result)
+            return result
+
+    def read_remote_file(self, remote_path: str) -> tuple[bool, str]:
+        """直接读取文件内容"""
+        try:
+            with open(remote_path) as f:
+                return True, f.read().strip()
+        except OSError as e:
+            return False, str(e)
+
+    def write_remote_file(self, remote_path: str, content: str) -> tuple[bool, str]:
+        """原子写入文件：同目录临时文件 fsync 后 rename，沿用原文件的权限和属主"""
+        directory, _, name = remote_path.rpartition("/")
+        directory = directory or "."
+        try:
+            fd, tmp = tempfile.mkstemp(prefix=f".{name}.wgm.", dir=directory)
+        except OSError as e:
+            return False, str(e)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(remote_path):
+                st = os.stat(remote_path)
+                os.chmod(tmp, st.st_mode & 0o7777)
+                try:
+                    os.chown(tmp, st.st_uid, st.st_gid)
+                except OSError:
+                    pass
+            os.replace(tmp, remote_path)
+        except OSError as e:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return False, str(e)
+        return True, "写入成功"
@@ -0,0 +1,113 @@
+"""运行中 WireGuard 接口的控制命令
+
+构建在远程执行的 wg 命令（供 RemoteBatch 使用）：逐个下发/移除 peer、
+在一条 wg set 中修改多个 peer、校验 peer 是否已生效，以及作为兜底的整接口 wg syncconf。
+
+预共享密钥通过 /dev/stdin 传给 wg，不出现在命令行参数中，
+也不会写入其他用户可读的临时文件。
+"""
+
+import shlex
+import secrets
+
+from typing import Optional
+
+from .model import Peer
+
+
+def peer_clause(
+    public_key: str,
+    allowed_ips: Optional[list[str]] = None,
+    endpoint: str = "",
+    keepalive: Optional[int] = None,
+    clear_psk: bool = False,
+    remove: bool = False
+) -> str:
+    """wg set 的一个 "peer <公钥> ..." 子句（不含预共享密钥）
+
+    Args:
+        allowed_ips: 替换后的 AllowedIPs，为 None 时不修改，为空列表时清空
+        clear_psk: 清除预共享密钥
+        remove: 移除该 peer（忽略其他参数）
+    """
+    args = [f"peer {shlex.quote(public_key)}"]
+    if remove:
+        return f"{args[0]} remove"
+    if clear_psk:
+        args.append("preshared-key /dev/null")
+    if endpoint:
+        args.append(f"endpoint {shlex.quote(endpoint)}")
+    if keepalive is not None:
+        args.append(f"persistent-keepalive {keepalive}")
+    if allowed_ips is not None:
+        args.append(f"allowed-ips {shlex.quote(','.join(allowed_ips))}")
+    return " ".join(args)
+
+
+def set_peers_command(interface: str, clauses: list[str]) -> str:
+    """用一条 wg set 修改多个 peer（clauses 见 peer_clause）"""
+    return f"wg set {interface} " + " ".join(clauses)
+
+
+def set_peer_command(interface: str, peer: Peer) -> str:
+    """用 wg set 下发单个 peer（含预共享密钥、Endpoint 和 PersistentKeepalive）"""
+    args = [f"wg set {interface} peer {shlex.quote(peer.public_key)}"]
+    if peer.preshared_key:
+        args.append("preshared-key /dev/stdin")
+    if peer.endpoint:
+        args.append(f"endpoint {shlex.quote(peer.endpoint)}")
+    if peer.persistent_keepalive is not None:
+        args.append(f"persistent-keepalive {peer.persistent_keepalive}")
+    allowed_ips = ",".join(peer.allowed_ips)
+    if allowed_ips:
+        args.append(f"allowed-ips {shlex.quote(allowed_ips)}")
+    command = " ".join(args)
+    if peer.preshared_key:
+        # printf 是 shell 内建命令，密钥不会出现在进程列表中
+        command = f"printf '%s\\n' {shlex.quote(peer.preshared_key)} | {command}"
+    return command
+
+
+def add_peers_command(interface: str, peers: list[Peer]) -> str:
+    """下发多个 peer：单个用 wg set，多个用 wg addconf 一次下发"""
+    if len(peers) == 1:
+        return set_peer_command(interface, peers[0])
+    delimiter = f"WGM_PEERS_{secrets.token_hex(8)}"
+    body = "".join(peer.serialize() for peer in peers)
+    return f"wg addconf {interface} /dev/stdin <<'{delimiter}'\n{body}{delimiter}"
+
+
+def remove_peers_command(interface: str, public_keys: list[str]) -> str:
+    """用一条 wg set 移除多个 peer"""
+    return set_peers_command(interface, [peer_clause(key, remove=True) for key in public_keys])
+
+
+def verify_peers_command(interface: str, public_keys: list[str], present: bool = True) -> str:
+    """校验 peer 已在（present=False 时已不在）运行中的接口上，否则以非零退出"""
+    keys = " ".join(shlex.quote(key) for key in public_keys)
+    # grep -vxF: 不在 wg show 输出中的公钥；grep -xF: 仍在输出中的公钥
+    grep = "grep -vxF" if present else "grep -xF"
+    return (
+        "_wgm_peers=$(mktemp) && "
+        f'wg show {interface} peers > "$_wgm_peers" && '
+        f"_wgm_bad=$(printf '%s\\n' {keys} | {grep} -f \"$_wgm_peers\"); "
+        'rm -f "$_wgm_peers"; '
+        f'[ -z "$_wgm_bad" ] || {{ echo "未生效: $_wgm_bad"; exit 1; }}'
+    )
+
+
+def syncconf_command(interface: str, config_path: str) -> str:
+    """按配置文件整体同步运行中的接口（不断开现有连接）
+
+    wg-quick strip 的输出包含私钥和预共享密钥，写入权限 0600 的临时文件。
+
+    Args:
+        interface: 接口名称
+        config_path: 接口配置文件路径（文件名须为 <接口>.conf）
+    """
+    return (
+        "umask 077 && _wgm_strip=$(mktemp) && "
+        f'wg-quick strip {shlex.quote(config_path)} > "$_wgm_strip" && '
+        f'wg syncconf {interface} "$_wgm_strip"; '
+        '_wgm_rc=$?; rm -f "$_wgm_strip"; [ "$_wgm_rc" -eq 0 ]'
+    )